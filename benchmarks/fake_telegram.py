@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Voice2Text", "username": "voice2text_bot"}
+
+
+class FakeTelegramServer:
+    """
+    Локальная заглушка Telegram Bot API для нагрузочного теста.
+
+    Реализует getUpdates (long polling), getFile и скачивание файлов,
+    sendMessage, sendDocument, editMessageText, editMessageReplyMarkup и
+    answerCallbackQuery; остальные методы отвечают true. Каждый вызов
+    записывается с временем и чатом, чтобы считать задержку от появления
+    апдейта до ответа бота и число запросов к API на апдейт. Тексты ответов
+    сохраняются, чтобы отличать сообщения об ошибках от успешных ответов.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.files: dict[str, bytes] = {}
+        # chat_id -> [(время, метод)]
+        self.calls: dict[int, list[tuple[float, str]]] = defaultdict(list)
+        # chat_id -> тексты и подписи, отправленные ботом
+        self.texts: dict[int, list[str]] = defaultdict(list)
+        self.method_counts: Counter = Counter()
+        self._updates: list[dict] = []
+        self._new_update = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_chats: dict[str, int] = {}
+        self._callback_chats: dict[str, int] = {}
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # --- Входящий трафик ---
+
+    def add_file(self, file_id: str, data: bytes, chat_id: int):
+        self.files[file_id] = data
+        self._file_chats[file_id] = chat_id
+
+    def push_update(self, update: dict) -> int:
+        """Ставит апдейт в очередь getUpdates и возвращает его update_id."""
+        update = {"update_id": next(self._update_ids), **update}
+        callback = update.get("callback_query")
+        if callback is not None:
+            self._callback_chats[callback["id"]] = callback["from"]["id"]
+        self._updates.append(update)
+        self._new_update.set()
+        return update["update_id"]
+
+    def message(self, chat_id: int, **fields) -> dict:
+        """Сообщение пользователя chat_id (личный чат, id чата совпадает с id пользователя)."""
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"},
+            **fields
+        }
+
+    def bot_message(self, chat_id: int, **fields) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **fields
+        }
+
+    # --- Bot API ---
+
+    def _record(self, chat_id, method: str, text: str = None):
+        self.method_counts[method] += 1
+        if chat_id is not None:
+            self.calls[int(chat_id)].append((time.perf_counter(), method))
+            if text:
+                self.texts[int(chat_id)].append(text)
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + timeout
+        while True:
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+            if self._updates or time.monotonic() >= deadline:
+                return self._updates[:int(params.get("limit") or 100)]
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+
+    def _get_file(self, params: dict):
+        file_id = params["file_id"]
+        self._record(self._file_chats.get(file_id), "getFile")
+        return {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": len(self.files.get(file_id, b"")),
+            "file_path": f"files/{file_id}"
+        }
+
+    def _send_message(self, params: dict):
+        chat_id = int(params["chat_id"])
+        self._record(chat_id, "sendMessage", params.get("text"))
+        return self.bot_message(chat_id, text=params.get("text", ""))
+
+    def _send_document(self, params: dict):
+        chat_id = int(params["chat_id"])
+        self._record(chat_id, "sendDocument", params.get("caption"))
+        document = params.get("document")
+        file_name = getattr(document, "filename", None) or "document.txt"
+        file_id = f"doc{next(self._message_ids)}"
+        return self.bot_message(
+            chat_id,
+            document={"file_id": file_id, "file_unique_id": file_id, "file_name": file_name},
+            caption=params.get("caption")
+        )
+
+    def _edit_message(self, method: str, params: dict):
+        chat_id = int(params["chat_id"]) if params.get("chat_id") else None
+        self._record(chat_id, method, params.get("text"))
+        if chat_id is None:
+            return True
+        return {
+            **self.bot_message(chat_id, text=params.get("text", "")),
+            "message_id": int(params.get("message_id") or 0)
+        }
+
+    async def _method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        if not params and request.can_read_body:
+            try:
+                params = await request.json()
+            except (json.JSONDecodeError, ValueError):
+                params = {}
+
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "getMe":
+            result = BOT_USER
+        elif method == "getFile":
+            result = self._get_file(params)
+        elif method == "sendMessage":
+            result = self._send_message(params)
+        elif method == "sendDocument":
+            result = self._send_document(params)
+        elif method in ("editMessageText", "editMessageReplyMarkup"):
+            result = self._edit_message(method, params)
+        elif method == "answerCallbackQuery":
+            self._record(self._callback_chats.get(params.get("callback_query_id")), method)
+            result = True
+        else:
+            # setMyCommands, deleteWebhook и прочие
+            self._record(params.get("chat_id"), method)
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _download(self, request: web.Request) -> web.Response:
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        data = self.files.get(file_id)
+        if data is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=data, content_type="application/octet-stream")
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._download)
+        app.router.add_post("/bot{token}/{method}", self._method)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        # Отпускаем висящий long polling
+        self._new_update.set()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
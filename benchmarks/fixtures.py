@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+from services.audio import SAMPLE_RATE, decode_audio_file
+
+
+def synthetic_speech(seconds: float, seed: int = 0, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Генерирует речеподобный сигнал: гармоники с плавающей основной частотой,
+    слоговой амплитудной модуляцией и паузами. Для замеров скорости этого
+    достаточно — декодер проходит по всему аудио так же, как по речи.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, np.pi))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * 4 * t))
+    pauses = (np.sin(2 * np.pi * 0.2 * t + rng.uniform(0, np.pi)) > -0.6).astype(np.float32)
+    noise = 0.01 * rng.standard_normal(len(t))
+
+    signal = 0.3 * voiced * syllables * pauses + noise
+    return signal.astype(np.float32)
+
+
+def load_fixture_dir(path: str) -> list[tuple[str, np.ndarray]]:
+    """Декодирует все аудиофайлы из каталога (имя, PCM)."""
+    clips = []
+    for name in sorted(os.listdir(path)):
+        full_path = os.path.join(path, name)
+        if os.path.isfile(full_path):
+            clips.append((name, decode_audio_file(full_path)))
+    return clips
+
+
+def synthetic_text(words: int, seed: int = 0) -> str:
+    rng = np.random.default_rng(seed)
+    vocabulary = (
+        "встреча проект сроки бюджет команда релиз задача клиент отчёт "
+        "метрика нагрузка сервер очередь модель качество пользователь"
+    ).split()
+    sentences = []
+    while words > 0:
+        length = min(words, int(rng.integers(6, 16)))
+        sentence = " ".join(rng.choice(vocabulary, size=length))
+        sentences.append(sentence.capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
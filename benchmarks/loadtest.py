@@ -0,0 +1,272 @@
+"""
+Сквозной нагрузочный тест бота без Telegram и внешних сервисов.
+
+Настоящий Dispatcher из main_bot.py опрашивает заглушку Bot API
+(benchmarks.fake_telegram), которая выдаёт синтетический трафик: голосовые,
+аудиодокументы, тексты и нажатия кнопок настроек. LLM заменён локальной
+заглушкой, распознавание идёт на маленькой модели Whisper на CPU. Запуск из
+корня репозитория:
+
+    python -m benchmarks.loadtest --updates 200 --rate 5 --mix voice=4,audio=2,text=3,callback=1
+
+Задержка считается от появления апдейта в getUpdates до первого и до
+последнего ответа бота в этом чате. Каждый апдейт приходит из своего чата,
+поэтому вызовы API однозначно относятся к апдейту. Апдейт считается
+неудачным, если бот ответил текстом ошибки или модель не прогрелась (для
+голосовых и аудио); неудачные апдейты не входят в задержки и пропускную
+способность и показываются отдельно.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from benchmarks.fixtures import synthetic_speech, synthetic_text
+from benchmarks.run import _git_commit, _parse_list
+from benchmarks.stats import latency_summary
+from benchmarks.stub_llm import StubLLMServer
+from services.audio import SAMPLE_RATE
+
+UPDATE_KINDS = ("voice", "audio", "text", "callback")
+AUDIO_KINDS = ("voice", "audio")
+# Фрагменты ответов бота, по которым апдейт считается неудачным
+ERROR_MARKERS = (
+    "ошибка",
+    "не удалось",
+    "сервер перегружен",
+    "слишком много файлов",
+    "неверный тип файла",
+)
+
+
+def _wav_bytes(audio: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def _parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in UPDATE_KINDS:
+            raise SystemExit(f"Неизвестный тип апдейта: {kind} (допустимы {', '.join(UPDATE_KINDS)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def make_update(server: FakeTelegramServer, kind: str, chat_id: int, args, rng: random.Random) -> dict:
+    """Синтетический апдейт заданного типа от пользователя chat_id."""
+    if kind in ("voice", "audio"):
+        seconds = rng.choice(args.audio_seconds)
+        data = _wav_bytes(synthetic_speech(seconds, seed=chat_id))
+        file_id = f"audio{chat_id}"
+        server.add_file(file_id, data, chat_id)
+        entity = {"file_id": file_id, "file_unique_id": file_id, "file_size": len(data)}
+        if kind == "voice":
+            return {"message": server.message(
+                chat_id, voice={**entity, "duration": int(seconds), "mime_type": "audio/ogg"}
+            )}
+        return {"message": server.message(
+            chat_id, document={**entity, "file_name": f"{file_id}.wav", "mime_type": "audio/wav"}
+        )}
+
+    if kind == "text":
+        words = rng.choice(args.text_words)
+        return {"message": server.message(chat_id, text=synthetic_text(words, seed=chat_id) + f" #{chat_id}")}
+
+    # Нажатие кнопки "Настройки" под сообщением бота
+    return {"callback_query": {
+        "id": f"cb{chat_id}",
+        "from": {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"},
+        "chat_instance": str(chat_id),
+        "data": "settings:main",
+        "message": server.bot_message(chat_id, text="Меню")
+    }}
+
+
+def _failure(server: FakeTelegramServer, chat_id: int, kind: str, warm_up_error: str = None) -> str | None:
+    """Причина неудачи апдейта или None, если бот ответил без ошибки."""
+    if warm_up_error and kind in AUDIO_KINDS:
+        return f"прогрев модели: {warm_up_error}"
+    for text in server.texts.get(chat_id, []):
+        if any(marker in text.lower() for marker in ERROR_MARKERS):
+            return text
+    return None
+
+
+def _report(server: FakeTelegramServer, sent: list[tuple[int, str, float]], warm_up_error: str = None) -> dict:
+    by_kind = {}
+    first_all, last_all, completed = [], [], []
+    failures = {}
+    for kind in UPDATE_KINDS:
+        first, last, calls, failed = [], [], [], 0
+        for chat_id, update_kind, pushed_at in sent:
+            if update_kind != kind:
+                continue
+            chat_calls = server.calls.get(chat_id, [])
+            calls.append(len(chat_calls))
+            reason = _failure(server, chat_id, kind, warm_up_error)
+            if reason is not None:
+                failed += 1
+                failures[reason] = failures.get(reason, 0) + 1
+            elif chat_calls:
+                first.append(chat_calls[0][0] - pushed_at)
+                last.append(chat_calls[-1][0] - pushed_at)
+                completed.append(chat_calls[-1][0])
+        if not calls:
+            continue
+        by_kind[kind] = {
+            "updates": len(calls),
+            "answered": len(first),
+            "failed": failed,
+            "first_reply": latency_summary(first),
+            "last_reply": latency_summary(last),
+            "api_calls_per_update": sum(calls) / len(calls),
+        }
+        first_all += first
+        last_all += last
+
+    started = min(pushed_at for _, _, pushed_at in sent)
+    elapsed = max(completed, default=started) - started
+    return {
+        "updates": len(sent),
+        "answered": len(first_all),
+        "failed": sum(failures.values()),
+        "failures": failures,
+        "warm_up_error": warm_up_error,
+        "wall_seconds": elapsed,
+        "updates_per_second": len(first_all) / elapsed if elapsed > 0 else 0.0,
+        "first_reply": latency_summary(first_all),
+        "last_reply": latency_summary(last_all),
+        "api_calls": dict(server.method_counts),
+        "api_calls_per_update": sum(len(server.calls.get(chat_id, [])) for chat_id, _, _ in sent) / len(sent),
+        "by_kind": by_kind,
+    }
+
+
+async def _wait_quiet(server: FakeTelegramServer, sent: list, quiet: float, timeout: float):
+    """Ждёт, пока на все апдейты придёт ответ и бот замолчит на quiet секунд."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        answered = all(server.calls.get(chat_id) for chat_id, _, _ in sent)
+        last_call = max((calls[-1][0] for calls in server.calls.values() if calls), default=0.0)
+        if answered and time.perf_counter() - last_call >= quiet:
+            return
+        await asyncio.sleep(0.2)
+    print(f"Не дождались ответа на все апдейты за {timeout:.0f} с")
+
+
+async def _warm_up(transcriber) -> str | None:
+    """Загружает модель до начала трафика; возвращает текст ошибки, если это не удалось."""
+    try:
+        await transcriber.transcribe(synthetic_speech(1.0, seed=0), "ru")
+    except Exception as e:
+        print(f"Прогрев модели не удался, голосовые и аудио будут считаться неудачными: {e}")
+        return str(e) or type(e).__name__
+    return None
+
+
+async def run_loadtest(args) -> dict:
+    rng = random.Random(args.seed)
+    mix = _parse_mix(args.mix)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=args.updates)
+
+    async with StubLLMServer(latency=args.llm_latency) as llm, FakeTelegramServer() as telegram:
+        # Конфигурация читается из окружения при импорте, поэтому модули бота импортируются здесь
+        workdir = tempfile.mkdtemp(prefix="voicebot-loadtest-")
+        os.environ.update({
+            "LLM_PROVIDERS": "openai:stub",
+            "LLM_OPENAI_BASE_URL": llm.base_url,
+            "WHISPER_MODEL_SIZES": args.model,
+            "TRANSCRIPTION_CACHE_PATH": os.path.join(workdir, "transcription_cache.sqlite3"),
+            "USER_SETTINGS_DB_PATH": os.path.join(workdir, "user_settings.sqlite3"),
+            "JOB_QUEUE_BACKEND": "local",
+        })
+        from main_bot import close_dispatcher, create_bot, create_dispatcher
+        from services.transcription import ModelPool
+
+        bot = create_bot(token="42:loadtest", api_server=telegram.base_url)
+        transcriber = ModelPool(sizes=[args.model], default_size=args.model)
+        dp = create_dispatcher(transcriber=transcriber)
+        warm_up_error = await _warm_up(transcriber)
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+
+        sent = []
+        try:
+            for i, kind in enumerate(kinds):
+                chat_id = 1000 + i
+                update = make_update(telegram, kind, chat_id, args, rng)
+                sent.append((chat_id, kind, time.perf_counter()))
+                telegram.push_update(update)
+                # Пуассоновский поток апдейтов со средней частотой args.rate
+                await asyncio.sleep(rng.expovariate(args.rate))
+
+            await _wait_quiet(telegram, sent, args.quiet, args.timeout)
+        finally:
+            await dp.stop_polling()
+            await polling
+            await close_dispatcher(dp)
+            await bot.session.close()
+
+        report = _report(telegram, sent, warm_up_error)
+        report["llm_requests"] = llm.requests
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной нагрузочный тест с заглушкой Telegram Bot API")
+    parser.add_argument("--updates", type=int, default=100, help="сколько апдейтов отправить")
+    parser.add_argument("--rate", type=float, default=5.0, help="апдейтов в секунду (в среднем)")
+    parser.add_argument("--mix", default="voice=4,audio=2,text=3,callback=1", help="доли типов апдейтов")
+    parser.add_argument("--audio-seconds", default="5,15,40", help="длительности синтетических записей, с")
+    parser.add_argument("--text-words", default="50,300,1500", help="размеры текстов, слов")
+    parser.add_argument("--model", default="tiny", help="размер модели Whisper")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="задержка заглушки LLM, с")
+    parser.add_argument("--quiet", type=float, default=3.0, help="сколько секунд тишины считать завершением")
+    parser.add_argument("--timeout", type=float, default=600.0, help="предельное время ожидания ответов, с")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args()
+    args.audio_seconds = _parse_list(args.audio_seconds, float)
+    args.text_words = _parse_list(args.text_words)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "args": vars(args),
+        }
+    }
+    report["results"] = asyncio.run(run_loadtest(args))
+
+    results = report["results"]
+    print(
+        f"{results['answered']}/{results['updates']} апдейтов без ошибок, {results['failed']} с ошибкой, "
+        f"{results['updates_per_second']:.2f} upd/s, "
+        f"первый ответ p50={results['first_reply']['p50']:.2f} с, "
+        f"последний p95={results['last_reply']['p95']:.2f} с, "
+        f"{results['api_calls_per_update']:.1f} вызовов API на апдейт"
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Офлайн-бенчмарк горячих путей бота: транскрибации и суммаризации.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.run --suite all --concurrency 1,2,4 --output bench.json
+
+Результаты пишутся в JSON вместе с хэшем коммита, чтобы прогоны можно было
+сравнивать между версиями.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import subprocess
+import time
+
+from benchmarks.fixtures import load_fixture_dir, synthetic_speech, synthetic_text
+from benchmarks.stats import PeakRSSSampler, latency_summary
+from benchmarks.stub_llm import StubLLMServer
+from services.audio import SAMPLE_RATE
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _drive(jobs: list, concurrency: int) -> tuple[list[float], float]:
+    """Выполняет корутин-фабрики с ограничением параллелизма. Возвращает задержки и общее время."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed(job):
+        async with semaphore:
+            started = time.perf_counter()
+            await job()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(job) for job in jobs))
+    return latencies, time.perf_counter() - started
+
+
+async def bench_transcription(clips: list[tuple[str, object]], concurrency_levels: list[int], repeats: int) -> list[dict]:
+    from services.transcription import TranscriptionExecutor
+
+    results = []
+    transcriber = TranscriptionExecutor(queue_size=max(concurrency_levels) * repeats * len(clips))
+    try:
+        # Прогрев: загрузка модели в воркерах не должна попадать в замеры.
+        # Вызываем transcribe напрямую, а не transcribe_audio: та превращает
+        # ошибки в текст, и неудачные задачи посчитались бы как быстрые успешные
+        try:
+            await transcriber.transcribe(clips[0][1])
+        except Exception as e:
+            raise SystemExit(f"Модель не загрузилась, замер транскрибации невозможен: {type(e).__name__} {e}")
+
+        for concurrency in concurrency_levels:
+            # Ошибка любой задачи прерывает замер
+            jobs = [
+                (lambda audio=audio: transcriber.transcribe(audio))
+                for _ in range(repeats)
+                for _, audio in clips
+            ]
+            audio_seconds = repeats * sum(len(audio) / SAMPLE_RATE for _, audio in clips)
+
+            with PeakRSSSampler() as rss:
+                latencies, elapsed = await _drive(jobs, concurrency)
+
+            results.append({
+                "concurrency": concurrency,
+                "jobs": len(jobs),
+                "audio_seconds": audio_seconds,
+                "wall_seconds": elapsed,
+                "realtime_factor": elapsed / audio_seconds,
+                "jobs_per_second": len(jobs) / elapsed,
+                "latency": latency_summary(latencies),
+                "peak_rss_bytes": rss.peak,
+            })
+            print(f"transcription c={concurrency}: RTF={elapsed / audio_seconds:.3f}, {len(jobs) / elapsed:.2f} jobs/s")
+    finally:
+        transcriber.shutdown()
+
+    return results
+
+
+async def bench_summarization(text_sizes: list[int], concurrency_levels: list[int], repeats: int, llm_latency: float) -> list[dict]:
+    from services.llm_client import LLMClient, OpenAICompatibleBackend
+    from services.summarization import SummaryCache, generate_summary
+
+    results = []
+    async with StubLLMServer(latency=llm_latency) as server:
+        # Боевой клиент (таймауты, повторы, дублирование) с заглушкой вместо внешнего провайдера
+        client = LLMClient([OpenAICompatibleBackend("stub", base_url=server.base_url)])
+        seeds = itertools.count()
+        try:
+            for concurrency in concurrency_levels:
+                # Свой кэш на каждый уровень и отдельный seed на каждый текст: тексты
+                # расходятся с первого слова, и части длинного текста (map-reduce) не
+                # попадают в кэш ни на этом, ни на предыдущих уровнях
+                cache = SummaryCache()
+                jobs = [
+                    (lambda text=synthetic_text(size, seed=next(seeds)): generate_summary(
+                        text, "default", client=client, cache=cache
+                    ))
+                    for _ in range(repeats)
+                    for size in text_sizes
+                ]
+                requests_before = server.requests
+
+                with PeakRSSSampler() as rss:
+                    latencies, elapsed = await _drive(jobs, concurrency)
+
+                results.append({
+                    "concurrency": concurrency,
+                    "jobs": len(jobs),
+                    "wall_seconds": elapsed,
+                    "jobs_per_second": len(jobs) / elapsed,
+                    "latency": latency_summary(latencies),
+                    "overhead_p50": latency_summary(latencies)["p50"] - llm_latency,
+                    "peak_rss_bytes": rss.peak,
+                    "upstream_requests": server.requests - requests_before,
+                })
+                print(f"summarization c={concurrency}: {len(jobs) / elapsed:.2f} jobs/s")
+        finally:
+            await client.close()
+
+    return results
+
+
+def _parse_list(value: str, cast=int) -> list:
+    return [cast(item) for item in value.split(",") if item]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк транскрибации и суммаризации")
+    parser.add_argument("--suite", choices=("transcription", "summarization", "all"), default="all")
+    parser.add_argument("--concurrency", default="1,2,4", help="уровни параллелизма через запятую")
+    parser.add_argument("--durations", default="5,15,60", help="длительности синтетических клипов, с")
+    parser.add_argument("--fixtures", help="каталог с аудиофайлами вместо синтетики")
+    parser.add_argument("--text-sizes", default="200,1000,4000", help="размеры текстов для резюме, слов")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="задержка заглушки LLM, с")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    concurrency_levels = _parse_list(args.concurrency)
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "args": vars(args),
+        }
+    }
+
+    if args.suite in ("transcription", "all"):
+        from config import ASR_ENGINE, BATCH_MAX_SIZE, TRANSCRIPTION_WORKERS, WHISPER_MODEL_SIZE
+
+        if args.fixtures:
+            clips = load_fixture_dir(args.fixtures)
+        else:
+            clips = [
+                (f"synthetic_{seconds}s", synthetic_speech(seconds, seed=i))
+                for i, seconds in enumerate(_parse_list(args.durations, float))
+            ]
+        report["meta"]["asr"] = {
+            "engine": ASR_ENGINE,
+            "model_size": WHISPER_MODEL_SIZE,
+            "workers": TRANSCRIPTION_WORKERS,
+            "batch_max_size": BATCH_MAX_SIZE,
+            "clips": {name: len(audio) / SAMPLE_RATE for name, audio in clips},
+        }
+        report["transcription"] = await bench_transcription(clips, concurrency_levels, args.repeats)
+
+    if args.suite in ("summarization", "all"):
+        report["summarization"] = await bench_summarization(
+            _parse_list(args.text_sizes), concurrency_levels, args.repeats, args.llm_latency
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
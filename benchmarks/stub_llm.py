@@ -0,0 +1,95 @@
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+
+class StubLLMServer:
+    """
+    Локальный OpenAI-совместимый сервер (/v1/chat/completions) с заданной
+    задержкой ответа. Позволяет гонять суммаризацию без сети.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2, tokens_per_second: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.requests = 0
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _reply(self, messages: list) -> str:
+        text = messages[-1]["content"] if messages else ""
+        words = text.split()
+        return "Резюме: " + " ".join(words[:40])
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+        reply = self._reply(body.get("messages", []))
+
+        if body.get("stream"):
+            return await self._stream_reply(request, body, reply)
+
+        delay = self.latency
+        if self.tokens_per_second > 0:
+            delay += len(reply.split()) / self.tokens_per_second
+        await asyncio.sleep(delay)
+
+        return web.json_response({
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }]
+        })
+
+    async def _stream_reply(self, request: web.Request, body: dict, reply: str) -> web.StreamResponse:
+        """Отдаёт ответ по словам в формате Server-Sent Events, как OpenAI при stream=true."""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await asyncio.sleep(self.latency)
+
+        for i, word in enumerate(reply.split()):
+            chunk = {
+                "id": f"stub-{self.requests}",
+                "object": "chat.completion.chunk",
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}}]
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            if self.tokens_per_second > 0:
+                await asyncio.sleep(1 / self.tokens_per_second)
+
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
@@ -4,13 +4,121 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Администраторы бота (id пользователей через запятую): им доступны команды профилирования
+ADMIN_USER_IDS = [int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()]
+# Свой Bot API сервер вместо api.telegram.org (локальный telegram-bot-api или заглушка для нагрузочного теста)
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER", "")
 
 DEFAULT_LANGUAGE = "auto"
 
+# Языки Whisper: сначала самые востребованные, остальные по коду
 SUPPORTED_LANGUAGES = {
     "auto": "Автоматически",
+    "ru": "Русский",
+    "en": "Английский",
+    "uk": "Украинский",
+    "be": "Белорусский",
+    "kk": "Казахский",
+    "de": "Немецкий",
+    "fr": "Французский",
+    "es": "Испанский",
+    "it": "Итальянский",
+    "pt": "Португальский",
+    "zh": "Китайский",
+    "ja": "Японский",
+    "ko": "Корейский",
+    "tr": "Турецкий",
+    "ar": "Арабский",
+    "af": "Африкаанс",
+    "am": "Амхарский",
+    "as": "Ассамский",
+    "az": "Азербайджанский",
+    "ba": "Башкирский",
+    "bg": "Болгарский",
+    "bn": "Бенгальский",
+    "bo": "Тибетский",
+    "br": "Бретонский",
+    "bs": "Боснийский",
+    "ca": "Каталанский",
+    "cs": "Чешский",
+    "cy": "Валлийский",
+    "da": "Датский",
+    "el": "Греческий",
+    "et": "Эстонский",
+    "eu": "Баскский",
+    "fa": "Персидский",
+    "fi": "Финский",
+    "fo": "Фарерский",
+    "gl": "Галисийский",
+    "gu": "Гуджарати",
+    "ha": "Хауса",
+    "haw": "Гавайский",
+    "he": "Иврит",
+    "hi": "Хинди",
+    "hr": "Хорватский",
+    "ht": "Гаитянский креольский",
+    "hu": "Венгерский",
+    "hy": "Армянский",
+    "id": "Индонезийский",
+    "is": "Исландский",
+    "jw": "Яванский",
+    "ka": "Грузинский",
+    "km": "Кхмерский",
+    "kn": "Каннада",
+    "la": "Латинский",
+    "lb": "Люксембургский",
+    "ln": "Лингала",
+    "lo": "Лаосский",
+    "lt": "Литовский",
+    "lv": "Латышский",
+    "mg": "Малагасийский",
+    "mi": "Маори",
+    "mk": "Македонский",
+    "ml": "Малаялам",
+    "mn": "Монгольский",
+    "mr": "Маратхи",
+    "ms": "Малайский",
+    "mt": "Мальтийский",
+    "my": "Бирманский",
+    "ne": "Непальский",
+    "nl": "Нидерландский",
+    "nn": "Норвежский (нюнорск)",
+    "no": "Норвежский",
+    "oc": "Окситанский",
+    "pa": "Панджаби",
+    "pl": "Польский",
+    "ps": "Пушту",
+    "ro": "Румынский",
+    "sa": "Санскрит",
+    "sd": "Синдхи",
+    "si": "Сингальский",
+    "sk": "Словацкий",
+    "sl": "Словенский",
+    "sn": "Шона",
+    "so": "Сомали",
+    "sq": "Албанский",
+    "sr": "Сербский",
+    "su": "Сунданский",
+    "sv": "Шведский",
+    "sw": "Суахили",
+    "ta": "Тамильский",
+    "te": "Телугу",
+    "tg": "Таджикский",
+    "th": "Тайский",
+    "tk": "Туркменский",
+    "tl": "Тагальский",
+    "tt": "Татарский",
+    "ur": "Урду",
+    "uz": "Узбекский",
+    "vi": "Вьетнамский",
+    "yi": "Идиш",
+    "yo": "Йоруба",
+    "yue": "Кантонский",
 }
 
+# Выбор языка в настройках листается страницами
+LANGUAGE_KEYBOARD_PAGE_SIZE = int(os.getenv("LANGUAGE_KEYBOARD_PAGE_SIZE", "16"))
+
 DEFAULT_SUMMARY_STYLE = "default"
 
 SUMMARY_STYLES = {
@@ -27,4 +135,193 @@ SUMMARY_STYLES = {
 WHISPER_MODEL_SIZE = "small"
 MAX_MESSAGE_LENGTH = 4096
 TRANSCRIPTION_DISPLAY_CHUNK_SIZE = 3800
-SUMMARY_DISPLAY_CHUNK_SIZE = 3800
\ No newline at end of file
+SUMMARY_DISPLAY_CHUNK_SIZE = 3800
+
+# Пул транскрибации: каждый воркер держит собственный экземпляр модели
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "1"))
+TRANSCRIPTION_QUEUE_SIZE = int(os.getenv("TRANSCRIPTION_QUEUE_SIZE", "16"))
+
+# Планировщик аудио-задач: round-robin по пользователям с ограничением параллелизма
+SCHEDULER_MAX_INFLIGHT = int(os.getenv("SCHEDULER_MAX_INFLIGHT", "4"))
+SCHEDULER_MAX_INFLIGHT_PER_USER = int(os.getenv("SCHEDULER_MAX_INFLIGHT_PER_USER", "1"))
+SCHEDULER_MAX_QUEUED_PER_USER = int(os.getenv("SCHEDULER_MAX_QUEUED_PER_USER", "20"))
+# Начальная оценка времени обработки на секунду аудио (уточняется по факту)
+SCHEDULER_INITIAL_REALTIME_FACTOR = float(os.getenv("SCHEDULER_INITIAL_REALTIME_FACTOR", "0.5"))
+
+# Персистентный кэш транскрибаций (SQLite, вытеснение по LRU)
+TRANSCRIPTION_CACHE_PATH = os.getenv("TRANSCRIPTION_CACHE_PATH", "transcription_cache.sqlite3")
+TRANSCRIPTION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", "10000"))
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Кэш резюме (в памяти): TTL и LRU-вытеснение
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "1000"))
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", str(24 * 60 * 60)))
+
+# Файлы до этого размера скачиваются в память и декодируются через stdin ffmpeg,
+# более крупные — через временный файл
+AUDIO_IN_MEMORY_MAX_BYTES = int(os.getenv("AUDIO_IN_MEMORY_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Длинные записи транскрибируются по сегментам, выровненным по паузам,
+# и отправляются пользователю по мере готовности
+LONG_AUDIO_THRESHOLD_SECONDS = int(os.getenv("LONG_AUDIO_THRESHOLD_SECONDS", "300"))
+LONG_AUDIO_SEGMENT_SECONDS = int(os.getenv("LONG_AUDIO_SEGMENT_SECONDS", "60"))
+LONG_AUDIO_PARALLEL_SEGMENTS = int(os.getenv("LONG_AUDIO_PARALLEL_SEGMENTS", "2"))
+
+# Архивы (zip/tar) с аудиофайлами: ограничения на содержимое, сколько файлов
+# распознаётся одновременно, нужны ли резюме по каждому файлу и как часто
+# обновлять сообщение о прогрессе
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", "100"))
+ARCHIVE_MAX_FILE_BYTES = int(os.getenv("ARCHIVE_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+ARCHIVE_MAX_TOTAL_BYTES = int(os.getenv("ARCHIVE_MAX_TOTAL_BYTES", str(500 * 1024 * 1024)))
+ARCHIVE_PARALLEL_FILES = int(os.getenv("ARCHIVE_PARALLEL_FILES", "2"))
+ARCHIVE_SUMMARIES = os.getenv("ARCHIVE_SUMMARIES", "1") == "1"
+ARCHIVE_PROGRESS_INTERVAL = float(os.getenv("ARCHIVE_PROGRESS_INTERVAL", "3"))
+
+# Перед распознаванием из записи вырезаются паузы длиннее SILENCE_MIN_SECONDS:
+# кадр считается тишиной, если его энергия ниже SILENCE_THRESHOLD_DB (дБ от полной
+# шкалы) или уровня шума записи, умноженного на SILENCE_NOISE_FACTOR
+SILENCE_TRIM = os.getenv("SILENCE_TRIM", "1") == "1"
+SILENCE_THRESHOLD_DB = float(os.getenv("SILENCE_THRESHOLD_DB", "-45"))
+SILENCE_NOISE_FACTOR = float(os.getenv("SILENCE_NOISE_FACTOR", "2"))
+SILENCE_MIN_SECONDS = float(os.getenv("SILENCE_MIN_SECONDS", "0.6"))
+SILENCE_PADDING_SECONDS = float(os.getenv("SILENCE_PADDING_SECONDS", "0.2"))
+
+# Движок распознавания: "whisper" (openai-whisper) или "faster-whisper" (CTranslate2)
+ASR_ENGINE = os.getenv("ASR_ENGINE", "whisper")
+# Параметры faster-whisper: int8 / int8_float16 / float16 / float32
+ASR_COMPUTE_TYPE = os.getenv("ASR_COMPUTE_TYPE", "int8")
+ASR_CPU_THREADS = int(os.getenv("ASR_CPU_THREADS", "0"))
+ASR_NUM_WORKERS = int(os.getenv("ASR_NUM_WORKERS", "1"))
+
+# Микробатчинг коротких записей (только для движков с батчевым декодированием —
+# whisper): сколько ждать соседей и сколько клипов в батче
+# (BATCH_MAX_SIZE = 1 отключает батчинг)
+BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", "50"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+
+# HTTP-эндпоинт /metrics в формате Prometheus (0 — отключить)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Хранилище пользовательских настроек: LRU-кэш в памяти + отложенная запись в SQLite
+USER_SETTINGS_DB_PATH = os.getenv("USER_SETTINGS_DB_PATH", "user_settings.sqlite3")
+USER_SETTINGS_CACHE_SIZE = int(os.getenv("USER_SETTINGS_CACHE_SIZE", "10000"))
+USER_SETTINGS_FLUSH_INTERVAL = float(os.getenv("USER_SETTINGS_FLUSH_INTERVAL", "5"))
+
+# Очередь задач транскрибации: "local" — модель в процессе бота,
+# "sqlite" или "redis" — отдельные процессы worker.py
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "local")
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "job_queue.sqlite3")
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "redis://localhost:6379/0")
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "200"))
+JOB_QUEUE_POLL_INTERVAL = float(os.getenv("JOB_QUEUE_POLL_INTERVAL", "0.2"))
+# Сколько ждать результата и через сколько вернуть в очередь задачу упавшего воркера, секунды
+JOB_RESULT_TIMEOUT = float(os.getenv("JOB_RESULT_TIMEOUT", "1800"))
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "1800"))
+# Через сколько секунд удалять из SQLite-очереди завершённые задачи, результат которых никто не забрал
+JOB_FINISHED_TTL = float(os.getenv("JOB_FINISHED_TTL", "3600"))
+
+# Модель загружается при первой задаче; прогрев на синтетическом клипе в фоне
+# при старте и выгрузка после простоя (0 — не выгружать), секунды
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+MODEL_IDLE_TIMEOUT = int(os.getenv("MODEL_IDLE_TIMEOUT", "0"))
+
+# Пул моделей разных размеров и выбор модели под задачу
+WHISPER_MODEL_SIZES = [size for size in os.getenv("WHISPER_MODEL_SIZES", "tiny,base,small,medium").split(",") if size]
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "6144"))
+MODEL_ROUTE_SHORT_SECONDS = int(os.getenv("MODEL_ROUTE_SHORT_SECONDS", "30"))
+MODEL_ROUTE_SHORT_SIZE = os.getenv("MODEL_ROUTE_SHORT_SIZE", "base")
+MODEL_ROUTE_LONG_SECONDS = int(os.getenv("MODEL_ROUTE_LONG_SECONDS", "600"))
+MODEL_ROUTE_LONG_SIZE = os.getenv("MODEL_ROUTE_LONG_SIZE", "medium")
+# При такой глубине очереди автоматический выбор опускается на размер меньше
+MODEL_DOWNGRADE_QUEUE_DEPTH = int(os.getenv("MODEL_DOWNGRADE_QUEUE_DEPTH", "8"))
+
+DEFAULT_MODEL_PREFERENCE = "auto"
+
+MODEL_SIZE_NAMES = {
+    "auto": "Автоматически",
+    "tiny": "Tiny — быстрее всего",
+    "base": "Base",
+    "small": "Small",
+    "medium": "Medium — точнее",
+    "large": "Large — максимальное качество",
+}
+
+# Язык в режиме "auto": по последним LANGUAGE_PRIOR_WINDOW записям пользователя.
+# Если доля самого частого языка не ниже LANGUAGE_PRIOR_CONFIDENCE (и записей не меньше
+# LANGUAGE_PRIOR_MIN_SAMPLES), определение языка пропускается; каждая
+# LANGUAGE_PRIOR_RECHECK_EVERY-я запись всё равно проверяется моделью
+LANGUAGE_PRIOR_WINDOW = int(os.getenv("LANGUAGE_PRIOR_WINDOW", "20"))
+LANGUAGE_PRIOR_MIN_SAMPLES = int(os.getenv("LANGUAGE_PRIOR_MIN_SAMPLES", "5"))
+LANGUAGE_PRIOR_CONFIDENCE = float(os.getenv("LANGUAGE_PRIOR_CONFIDENCE", "0.9"))
+LANGUAGE_PRIOR_RECHECK_EVERY = int(os.getenv("LANGUAGE_PRIOR_RECHECK_EVERY", "10"))
+LANGUAGE_PRIOR_MAX_USERS = int(os.getenv("LANGUAGE_PRIOR_MAX_USERS", "10000"))
+
+# Провайдеры LLM по порядку отказоустойчивости: "бэкенд:модель" через запятую.
+# Бэкенды: g4f и openai (любой OpenAI-совместимый API по LLM_OPENAI_BASE_URL)
+LLM_PROVIDERS = [item.strip() for item in os.getenv("LLM_PROVIDERS", "g4f:gpt-4o-mini").split(",") if item.strip()]
+LLM_OPENAI_BASE_URL = os.getenv("LLM_OPENAI_BASE_URL", "https://api.openai.com/v1")
+LLM_OPENAI_API_KEY = os.getenv("LLM_OPENAI_API_KEY", "")
+# Таймаут одного запроса и повторы с экспоненциальной задержкой, секунды
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Дублирующий запрос, если ответ дольше этого перцентиля задержек (0 — не дублировать)
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+# Провайдер отключается после стольких ошибок подряд на LLM_CIRCUIT_RESET секунд
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+LLM_CIRCUIT_RESET = float(os.getenv("LLM_CIRCUIT_RESET", "30"))
+
+# Длинные тексты резюмируются по частям (map-reduce). Токены оцениваются по
+# числу символов; части резюмируются параллельно, не больше SUMMARY_MAP_CONCURRENCY
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_CHARS_PER_TOKEN = float(os.getenv("SUMMARY_CHARS_PER_TOKEN", "3"))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+SUMMARY_MAP_PROMPT = (
+    "You are a helpful assistant. The user text is one fragment of a longer transcript. "
+    "Summarize it, keeping all key facts, names, numbers and decisions. "
+    "Answer in the language of the text."
+)
+
+# Потоковое резюме: текст появляется в сообщении по мере генерации.
+# Правки сообщения не чаще раза в SUMMARY_EDIT_INTERVAL секунд (лимит Telegram)
+SUMMARY_STREAMING = os.getenv("SUMMARY_STREAMING", "1") == "1"
+SUMMARY_EDIT_INTERVAL = float(os.getenv("SUMMARY_EDIT_INTERVAL", "1.5"))
+
+# Резюме аудио: "auto" — сразу после транскрибации, "button" — по кнопке "Резюме"
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "auto")
+# Транскрибации, ожидающие нажатия кнопки "Резюме"
+TRANSCRIPT_STORE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_STORE_MAX_ENTRIES", "1000"))
+TRANSCRIPT_STORE_TTL = int(os.getenv("TRANSCRIPT_STORE_TTL", "86400"))
+
+# Исходящие сообщения: лимиты Telegram (глобально и на чат), повторы после
+# 429 и порог в символах, начиная с которого длинный текст уходит файлом .txt
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", "25"))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", "1"))
+DELIVERY_CHAT_BURST = int(os.getenv("DELIVERY_CHAT_BURST", "3"))
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "3"))
+DELIVERY_DOCUMENT_THRESHOLD = int(os.getenv("DELIVERY_DOCUMENT_THRESHOLD", "16000"))
+DELIVERY_MAX_CHATS = int(os.getenv("DELIVERY_MAX_CHATS", "10000"))
+
+# Профилирование задач: трассы стадий для задач дольше PROFILE_SLOW_JOB_SECONDS
+# (0 — выключено), период сэмплирования стеков, размер таблицы cProfile и
+# с какой задержки цикла событий записывать её в трассу как остановку
+PROFILE_SLOW_JOB_SECONDS = float(os.getenv("PROFILE_SLOW_JOB_SECONDS", "0"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "60"))
+PROFILE_LOOP_STALL_SECONDS = float(os.getenv("PROFILE_LOOP_STALL_SECONDS", "0.1"))
+
+# Длинные вставленные и пересланные тексты Telegram делит на несколько сообщений.
+# Сообщения чата, пришедшие с паузой не больше TEXT_DEBOUNCE_SECONDS (0 — не склеивать),
+# склеиваются в один запрос резюме; для пересылок из одного источника пауза
+# TEXT_DEBOUNCE_FORWARD_SECONDS. Буфер ждёт не дольше TEXT_DEBOUNCE_MAX_WAIT с первого
+# сообщения и ограничен по числу частей, символов и одновременно собираемых чатов
+TEXT_DEBOUNCE_SECONDS = float(os.getenv("TEXT_DEBOUNCE_SECONDS", "1.0"))
+TEXT_DEBOUNCE_FORWARD_SECONDS = float(os.getenv("TEXT_DEBOUNCE_FORWARD_SECONDS", "3.0"))
+TEXT_DEBOUNCE_MAX_WAIT = float(os.getenv("TEXT_DEBOUNCE_MAX_WAIT", "10"))
+TEXT_DEBOUNCE_MAX_PARTS = int(os.getenv("TEXT_DEBOUNCE_MAX_PARTS", "30"))
+TEXT_DEBOUNCE_MAX_CHARS = int(os.getenv("TEXT_DEBOUNCE_MAX_CHARS", "200000"))
+TEXT_DEBOUNCE_MAX_CHATS = int(os.getenv("TEXT_DEBOUNCE_MAX_CHATS", "10000"))
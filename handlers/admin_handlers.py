@@ -0,0 +1,64 @@
+import logging
+
+from aiogram import F, Router, types
+from aiogram.filters import Command, CommandObject
+
+from config import ADMIN_USER_IDS
+from services.profiling import PROFILE_MODES, JobProfiler
+
+
+logger = logging.getLogger(__name__)
+router = Router()
+# Команды роутера доступны только администраторам из ADMIN_USER_IDS
+router.message.filter(F.from_user.id.in_(set(ADMIN_USER_IDS)))
+
+logger.info("admin_handlers.router создан.")
+
+PROFILE_USAGE = (
+    "<b>Профилирование</b>\n"
+    "   /profile cprofile N — cProfile для следующих N задач\n"
+    "   /profile sampling N — сэмплирование стеков (flame graph) для следующих N задач\n"
+    "   /profile off — выключить\n"
+    "   /slowtrace S — присылать трассу стадий задач дольше S секунд (0 — выключить)"
+)
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: types.Message, command: CommandObject, profiler: JobProfiler):
+    """Включает профилирование следующих задач или показывает его состояние."""
+    args = (command.args or "").split()
+    if not args:
+        await message.answer(f"{profiler.status}\n\n{PROFILE_USAGE}")
+        return
+
+    if args[0] == "off":
+        profiler.disarm()
+        await message.answer(profiler.status)
+        return
+
+    mode = args[0]
+    if mode not in PROFILE_MODES or (len(args) > 1 and not args[1].isdigit()):
+        await message.answer(PROFILE_USAGE)
+        return
+
+    jobs = int(args[1]) if len(args) > 1 else 1
+    profiler.arm(mode, jobs, message.chat.id)
+    logger.info(f"Администратор {message.from_user.id} включил {mode} для {jobs} задач")
+    await message.answer(f"{profiler.status}\nПрофили придут в этот чат документами")
+
+
+@router.message(Command("slowtrace"))
+async def cmd_slowtrace(message: types.Message, command: CommandObject, profiler: JobProfiler):
+    """Задаёт порог, начиная с которого администраторам приходит трасса задачи."""
+    value = (command.args or "").strip()
+    if value == "off":
+        value = "0"
+    try:
+        threshold = float(value)
+    except ValueError:
+        await message.answer(f"{profiler.status}\n\n{PROFILE_USAGE}")
+        return
+
+    profiler.slow_seconds = max(0.0, threshold)
+    logger.info(f"Администратор {message.from_user.id} задал порог медленных задач {profiler.slow_seconds:g} с")
+    await message.answer(profiler.status)
@@ -4,10 +4,13 @@ from aiogram.fsm.context import FSMContext
 from aiogram.utils.markdown import hbold
 
 from keyboards.inline import get_main_settings_keyboard
+from services.transcription import ModelPool
+from services.user_settings import UserSettings, UserSettingsRepository
 from states.user_states import SettingsStates
 from config import (
     DEFAULT_LANGUAGE,
     DEFAULT_SUMMARY_STYLE,
+    MODEL_SIZE_NAMES,
     SUPPORTED_LANGUAGES,
     SUMMARY_STYLES
 )
@@ -17,33 +20,25 @@ router = Router()
 
 
 
-def get_user_settings(user_id: int, dp_user_settings: dict):
-
-    if user_id not in dp_user_settings:
-        dp_user_settings[user_id] = {
-            "language": DEFAULT_LANGUAGE,
-            "summary_style": DEFAULT_SUMMARY_STYLE,
-            "summary_style_name": SUMMARY_STYLES[DEFAULT_SUMMARY_STYLE]["name"]
-        }
-    elif 'summary_style_name' not in dp_user_settings[user_id]:
-        current_style_key = dp_user_settings[user_id].get('summary_style', DEFAULT_SUMMARY_STYLE)
-        style_info = SUMMARY_STYLES.get(current_style_key, SUMMARY_STYLES[DEFAULT_SUMMARY_STYLE])
-        dp_user_settings[user_id]['summary_style_name'] = style_info["name"]
-
-    return dp_user_settings[user_id]
+def get_user_settings(user_id: int, dp_user_settings: UserSettingsRepository) -> UserSettings:
+    """Возвращает настройки пользователя (по умолчанию, если он ещё ничего не менял)."""
+    return dp_user_settings.get(user_id)
 
 
 
 @router.message(CommandStart())
-async def cmd_start(message: types.Message, state: FSMContext, user_settings: dict, whisper_model: tuple):
+async def cmd_start(message: types.Message, state: FSMContext, user_settings: UserSettingsRepository, transcriber: ModelPool):
     await state.clear()
     user = message.from_user
     user_id = user.id
     current_settings = get_user_settings(user_id, user_settings)
 
-    _, device = whisper_model
+    model_state = transcriber.state
+    if transcriber.device:
+        model_state = f"{model_state} ({transcriber.device})"
     lang_name = SUPPORTED_LANGUAGES.get(current_settings["language"], "Авто")
     style_name = current_settings["summary_style_name"]
+    model_choice = MODEL_SIZE_NAMES.get(current_settings["model_size"], current_settings["model_size"])
 
     greeting_text = (
         f"Привет, {hbold(user.first_name or 'пользователь')}!\n\n"
@@ -52,13 +47,15 @@ async def cmd_start(message: types.Message, state: FSMContext, user_settings: di
         "   — Генерировать краткое резюме текста с помощью LLM\n\n"
         f"Язык транскрибации: {hbold(lang_name)}\n"
         f"Стиль резюме: {hbold(style_name)}\n"
+        f"Выбор модели: {hbold(model_choice)}\n"
+        f"Модель распознавания: {hbold(model_state)}\n"
     )
 
     await message.answer(greeting_text)
 
 
 @router.message(Command("help"))
-async def cmd_help(message: types.Message, user_settings: dict):
+async def cmd_help(message: types.Message, user_settings: UserSettingsRepository):
     """Справка по возможностям бота"""
     user_id = message.from_user.id
     current_settings = get_user_settings(user_id, user_settings)
@@ -76,6 +73,7 @@ async def cmd_help(message: types.Message, user_settings: dict):
         "   — Суммаризация текста (краткое содержание)\n\n"
         "<b>Как начать:</b>\n"
         "   — Отправить голосовое или аудиосообщение (.ogg; .mp3; т.д.) \n"
+        "   — Или zip/tar-архив с записями: придёт один файл с общей транскрибацией\n"
         "   — Бот обработает и пришлёт результат\n\n"
         "<b>Настройки:</b>\n"
         f"  — Язык транскрибации: {hbold(lang_name)}\n"
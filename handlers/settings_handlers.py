@@ -4,13 +4,15 @@ from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.markdown import hbold
 
-from config import SUPPORTED_LANGUAGES, SUMMARY_STYLES
+from config import MODEL_SIZE_NAMES, SUPPORTED_LANGUAGES, SUMMARY_STYLES, WHISPER_MODEL_SIZES
 from handlers.common_handlers import get_user_settings
 from keyboards.inline import (
     get_language_keyboard,
     get_main_settings_keyboard,
+    get_model_keyboard,
     get_summary_style_keyboard
 )
+from services.user_settings import UserSettingsRepository
 from states.user_states import SettingsStates
 
 
@@ -38,7 +40,7 @@ async def cq_back_to_main_settings(callback: types.CallbackQuery, state: FSMCont
 
 
 @router.callback_query(F.data == "settings:language", SettingsStates.MAIN_SETTINGS_MENU)
-async def cq_select_language_menu(callback: types.CallbackQuery, state: FSMContext, user_settings: dict):
+async def cq_select_language_menu(callback: types.CallbackQuery, state: FSMContext, user_settings: UserSettingsRepository):
     """Открывает меню выбора языка транскрибации."""
     user_id = callback.from_user.id
     logger.info(f"cq_select_language_menu вызван пользователем {user_id}")
@@ -53,8 +55,23 @@ async def cq_select_language_menu(callback: types.CallbackQuery, state: FSMConte
     await callback.answer()
 
 
+@router.callback_query(SettingsStates.CHOOSING_LANGUAGE, F.data.startswith("lang_page:"))
+async def cq_language_page(callback: types.CallbackQuery, user_settings: UserSettingsRepository):
+    """Листает список языков."""
+    user_id = callback.from_user.id
+    page = int(callback.data.split(":")[1])
+
+    user_prefs = get_user_settings(user_id, user_settings)
+    markup = get_language_keyboard(user_prefs["language"], page)
+
+    # Кнопка с номером текущей страницы ничего не меняет
+    if markup != callback.message.reply_markup:
+        await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
+
 @router.callback_query(SettingsStates.CHOOSING_LANGUAGE, F.data.startswith("select_lang:"))
-async def cq_set_language(callback: types.CallbackQuery, state: FSMContext, user_settings: dict):
+async def cq_set_language(callback: types.CallbackQuery, state: FSMContext, user_settings: UserSettingsRepository):
     """Устанавливает выбранный пользователем язык."""
     user_id = callback.from_user.id
     lang_code = callback.data.split(":")[1]
@@ -83,7 +100,7 @@ async def cq_set_language(callback: types.CallbackQuery, state: FSMContext, user
 
 
 @router.callback_query(F.data == "settings:summary_style", SettingsStates.MAIN_SETTINGS_MENU)
-async def cq_select_summary_style_menu(callback: types.CallbackQuery, state: FSMContext, user_settings: dict):
+async def cq_select_summary_style_menu(callback: types.CallbackQuery, state: FSMContext, user_settings: UserSettingsRepository):
     """Открывает меню выбора стиля резюме."""
     user_id = callback.from_user.id
     logger.info(f"cq_select_summary_style_menu вызван пользователем {user_id}")
@@ -99,7 +116,7 @@ async def cq_select_summary_style_menu(callback: types.CallbackQuery, state: FSM
 
 
 @router.callback_query(SettingsStates.CHOOSING_SUMMARY_STYLE, F.data.startswith("select_style:"))
-async def cq_set_summary_style(callback: types.CallbackQuery, state: FSMContext, user_settings: dict):
+async def cq_set_summary_style(callback: types.CallbackQuery, state: FSMContext, user_settings: UserSettingsRepository):
     """Устанавливает выбранный стиль резюме."""
     user_id = callback.from_user.id
     style_code = callback.data.split(":")[1]
@@ -125,4 +142,51 @@ async def cq_set_summary_style(callback: types.CallbackQuery, state: FSMContext,
         f"Стиль резюме изменён на: {hbold(selected_style_name)}\n"
         f"Выберите, что вы хотите настроить:",
         reply_markup=get_main_settings_keyboard()
-    )
\ No newline at end of file
+    )
+
+
+@router.callback_query(F.data == "settings:model", SettingsStates.MAIN_SETTINGS_MENU)
+async def cq_select_model_menu(callback: types.CallbackQuery, state: FSMContext, user_settings: UserSettingsRepository):
+    """Открывает меню выбора модели распознавания."""
+    user_id = callback.from_user.id
+    logger.info(f"cq_select_model_menu вызван пользователем {user_id}")
+
+    user_prefs = get_user_settings(user_id, user_settings)
+
+    await state.set_state(SettingsStates.CHOOSING_MODEL)
+    await callback.message.edit_text(
+        "Выберите модель распознавания. В автоматическом режиме короткие записи "
+        "распознаются быстрой моделью, длинные — точной, а при большой очереди бот "
+        "переходит на модель поменьше.",
+        reply_markup=get_model_keyboard(user_prefs["model_size"])
+    )
+    await callback.answer()
+
+
+@router.callback_query(SettingsStates.CHOOSING_MODEL, F.data.startswith("select_model:"))
+async def cq_set_model(callback: types.CallbackQuery, state: FSMContext, user_settings: UserSettingsRepository):
+    """Устанавливает выбранную модель распознавания."""
+    user_id = callback.from_user.id
+    model_code = callback.data.split(":")[1]
+
+    logger.info(f"cq_set_model вызван пользователем {user_id}, model_code: {model_code}")
+
+    if model_code != "auto" and model_code not in WHISPER_MODEL_SIZES:
+        logger.warning(f"Неверный model_code '{model_code}' от пользователя {user_id}")
+        await callback.answer("Неверная модель.", show_alert=True)
+        return
+
+    user_prefs = get_user_settings(user_id, user_settings)
+    user_prefs["model_size"] = model_code
+    logger.info(f"Модель пользователя {user_id} установлена: {model_code}")
+
+    selected_model_name = MODEL_SIZE_NAMES.get(model_code, model_code)
+    await callback.answer(f"Модель установлена: {selected_model_name}", show_alert=False)
+
+    await state.set_state(SettingsStates.MAIN_SETTINGS_MENU)
+    await callback.message.edit_text(
+        f"⚙️ <b>Настройки бота</b>\n\n"
+        f"Модель распознавания изменена на: {hbold(selected_model_name)}\n"
+        f"Выберите, что вы хотите настроить:",
+        reply_markup=get_main_settings_keyboard()
+    )
@@ -1,3 +1,5 @@
+import asyncio
+import html
 import logging
 
 from aiogram import F, Router, types
@@ -5,11 +7,20 @@ from aiogram.utils.markdown import hbold
 
 from config import (
     MAX_MESSAGE_LENGTH,
-    SUMMARY_DISPLAY_CHUNK_SIZE,
-    SUMMARY_STYLES
+    SUMMARY_STREAMING,
+    SUMMARY_STYLES,
+    TEXT_DEBOUNCE_FORWARD_SECONDS,
+    TEXT_DEBOUNCE_MAX_CHARS,
+    TEXT_DEBOUNCE_MAX_CHATS,
+    TEXT_DEBOUNCE_MAX_PARTS,
+    TEXT_DEBOUNCE_MAX_WAIT,
+    TEXT_DEBOUNCE_SECONDS
 )
 from handlers.common_handlers import get_user_settings
-from services.summarization import generate_summary
+from services.delivery import LiveMessage, outbound
+from services.metrics import ERRORS, stage_timer
+from services.summarization import generate_summary, stream_summary
+from services.user_settings import UserSettingsRepository
 
 
 logger = logging.getLogger(__name__)
@@ -18,40 +29,187 @@ router = Router()
 logger.info("text_input_handler.router создан.")
 
 
+def _forward_source(message: types.Message):
+    """Источник пересылки (тип и id отправителя или чата) или None для обычного сообщения."""
+    origin = message.forward_origin
+    if origin is None:
+        return None
+    for attr in ("sender_user", "sender_chat", "chat"):
+        source = getattr(origin, attr, None)
+        if source is not None:
+            return origin.type, source.id
+    return origin.type, getattr(origin, "sender_user_name", None)
+
+
+class _TextBatch:
+    """Сообщения одного пользователя в чате, которые склеиваются в один текст."""
+
+    def __init__(self, message: types.Message):
+        loop = asyncio.get_running_loop()
+        self.messages = [message]
+        self.chars = len(message.text)
+        self.source = _forward_source(message)
+        self.started = loop.time()
+        self.last_at = self.started
+        self.closed = False
+        self.changed = asyncio.Event()
+
+    def add(self, message: types.Message):
+        self.messages.append(message)
+        self.chars += len(message.text)
+        if _forward_source(message) != self.source:
+            self.source = None
+        self.last_at = asyncio.get_running_loop().time()
+        self.changed.set()
+
+    def close(self):
+        self.closed = True
+        self.changed.set()
+
+
+class TextDebouncer:
+    """
+    Склеивает текст, который Telegram разбил на несколько сообщений.
+
+    Первое сообщение открывает буфер чата, и его обработчик ждёт, пока сообщения
+    идут с паузой не больше window (forward_window — для пересылок из одного
+    источника), но не дольше max_wait. Следующие сообщения дописываются в буфер,
+    их обработчики сразу завершаются. Буфер закрывается досрочно, если новая часть
+    превысила бы max_parts или max_chars: она открывает следующий буфер. Когда
+    собирается уже max_chats буферов, сообщения обрабатываются без ожидания.
+    """
+
+    def __init__(
+        self,
+        window: float = TEXT_DEBOUNCE_SECONDS,
+        forward_window: float = TEXT_DEBOUNCE_FORWARD_SECONDS,
+        max_wait: float = TEXT_DEBOUNCE_MAX_WAIT,
+        max_parts: int = TEXT_DEBOUNCE_MAX_PARTS,
+        max_chars: int = TEXT_DEBOUNCE_MAX_CHARS,
+        max_chats: int = TEXT_DEBOUNCE_MAX_CHATS
+    ):
+        self.window = window
+        self.forward_window = max(window, forward_window)
+        self.max_wait = max(window, max_wait)
+        self.max_parts = max(1, max_parts)
+        self.max_chars = max_chars
+        self.max_chats = max(1, max_chats)
+        self._batches: dict[tuple[int, int], _TextBatch] = {}
+
+    @property
+    def pending(self) -> int:
+        """Количество собираемых буферов."""
+        return len(self._batches)
+
+    def _fits(self, batch: _TextBatch, message: types.Message) -> bool:
+        return (
+            not batch.closed
+            and len(batch.messages) < self.max_parts
+            and batch.chars + len(message.text) <= self.max_chars
+        )
+
+    async def collect(self, message: types.Message) -> list[types.Message] | None:
+        """
+        Добавляет сообщение в буфер чата. Возвращает все сообщения буфера
+        обработчику, открывшему буфер, и None остальным.
+        """
+        if self.window <= 0:
+            return [message]
+
+        key = (message.chat.id, message.from_user.id)
+        batch = self._batches.get(key)
+        if batch is not None:
+            if self._fits(batch, message):
+                batch.add(message)
+                return None
+            # Буфер полон: его обработчик отправит собранное, а это сообщение начнёт новый
+            batch.close()
+        elif len(self._batches) >= self.max_chats:
+            logger.warning(f"Буферов текста уже {len(self._batches)}, сообщение обрабатывается сразу")
+            return [message]
+
+        batch = _TextBatch(message)
+        self._batches[key] = batch
+        try:
+            await self._wait(batch)
+        finally:
+            if self._batches.get(key) is batch:
+                del self._batches[key]
+        return batch.messages
+
+    async def _wait(self, batch: _TextBatch):
+        loop = asyncio.get_running_loop()
+        while not batch.closed:
+            window = self.forward_window if batch.source is not None else self.window
+            deadline = min(batch.last_at + window, batch.started + self.max_wait)
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            batch.changed.clear()
+            try:
+                await asyncio.wait_for(batch.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch.closed = True
+
+
+text_debouncer = TextDebouncer()
+
+
 # Обработчик текстовых сообщений
 @router.message(F.text, ~F.text.startswith('/'))
-async def handle_text_input(message: types.Message, user_settings: dict):
+async def handle_text_input(message: types.Message, user_settings: UserSettingsRepository):
     """Обрабатывает текстовые сообщения пользователей для генерации резюме."""
     user_id = message.from_user.id
     logger.info(f"handle_text_input вызван пользователем {user_id} с текстом: '{message.text[:50]}...'")
 
-    status_msg = await message.answer("Генерирую резюме для вашего текста")
+    # Части одного длинного текста дописываются в буфер первой части
+    messages = await text_debouncer.collect(message)
+    if messages is None:
+        return
+    if len(messages) > 1:
+        logger.info(f"Пользователь {user_id}: склеено {len(messages)} сообщений в один текст")
+
+    status_msg = await outbound.answer(message, "Генерирую резюме для вашего текста")
 
     user_prefs = get_user_settings(user_id, user_settings)
     selected_summary_style = user_prefs.get("summary_style")
     logger.debug(f"Пользователь {user_id}: стиль резюме = {selected_summary_style}")
 
     try:
-        text_input = message.text
-        summary = await generate_summary(text_input, selected_summary_style)
+        text_input = "\n".join(part.text for part in sorted(messages, key=lambda part: part.message_id))
+
+        if SUMMARY_STREAMING:
+            style_name = SUMMARY_STYLES.get(selected_summary_style, {}).get('name', 'Стандартный')
+            summary_header = f"<b>Краткое резюме</b> (Стиль: {hbold(style_name)}):"
+
+            # Резюме дописывается в сообщение статуса по мере генерации
+            live = LiveMessage(message, status_msg, summary_header)
+            with stage_timer("summarize"):
+                async for delta in stream_summary(text_input, selected_summary_style):
+                    await live.append(delta)
+                summary = await live.finish()
+            logger.info(f"Резюме сгенерировано для пользователя {user_id}, длина: {len(summary)}")
+            return
+
+        with stage_timer("summarize"):
+            summary = await generate_summary(text_input, selected_summary_style)
         logger.info(f"Резюме сгенерировано для пользователя {user_id}, длина: {len(summary)}")
 
         style_name = SUMMARY_STYLES.get(selected_summary_style, {}).get('name', 'Стандартный')
         summary_header = f"<b>Краткое резюме</b> (Стиль: {hbold(style_name)}):"
-        full_response_text = f"{summary_header}\n{summary}"
-
-        if len(full_response_text) <= MAX_MESSAGE_LENGTH:
-            await status_msg.edit_text(full_response_text)
-        else:
-            await status_msg.edit_text("Резюме готово! Отправляю результат частями")
-            await message.answer(summary_header)
+        full_response_text = f"{summary_header}\n{html.escape(summary)}"
 
-            for i in range(0, len(summary), SUMMARY_DISPLAY_CHUNK_SIZE):
-                chunk = summary[i:i + SUMMARY_DISPLAY_CHUNK_SIZE]
-                await message.answer(chunk)
+        with stage_timer("send"):
+            if len(full_response_text) <= MAX_MESSAGE_LENGTH:
+                await outbound.edit_text(status_msg, full_response_text)
+            else:
+                await outbound.edit_text(status_msg, "Резюме готово! Отправляю результат частями")
+                await outbound.send_text(message, summary, summary_header, filename="summary.txt")
 
         logger.info(f"Текст успешно обработан для пользователя {user_id}")
 
     except Exception as e:
+        ERRORS.inc(stage="text")
         logger.error(f"Ошибка при обработке текста от пользователя {user_id}: {e}", exc_info=True)
-        await status_msg.edit_text(f"Ошибка при генерации резюме: {e}")
\ No newline at end of file
+        await outbound.edit_text(status_msg, f"Ошибка при генерации резюме: {e}")
\ No newline at end of file
@@ -1,125 +1,760 @@
+import asyncio
+import functools
+import html
 import logging
 import os
+import tarfile
 import tempfile
+import time
+import zipfile
 
 from aiogram import Bot, F, Router, types
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.utils.markdown import hbold
 
 from config import (
+    ARCHIVE_PARALLEL_FILES,
+    ARCHIVE_PROGRESS_INTERVAL,
+    ARCHIVE_SUMMARIES,
+    AUDIO_IN_MEMORY_MAX_BYTES,
+    LONG_AUDIO_THRESHOLD_SECONDS,
     MAX_MESSAGE_LENGTH,
+    SUMMARY_MODE,
+    SUMMARY_STREAMING,
     SUMMARY_STYLES,
     SUPPORTED_LANGUAGES,
     TRANSCRIPTION_DISPLAY_CHUNK_SIZE
 )
 from handlers.common_handlers import get_user_settings
-from services.summarization import generate_summary
-from services.transcription import transcribe_audio
+from keyboards.inline import get_summary_keyboard
+from services.archive import ArchiveLimitExceeded, count_archive_audio, is_archive, read_archive_audio
+from services.delivery import LiveMessage, outbound, split_html
+from services.language import LanguagePrior
+from services.metrics import ERRORS, STAGE_SECONDS, duration_bucket, stage_timer
+from services.profiling import JobProfiler
+from services.scheduler import AudioJobScheduler, SchedulerQueueFull
+from services.summarization import generate_summary, stream_summary
+from services.transcript_store import TranscriptStore
+from services.transcription import (
+    ModelPool,
+    TranscriptionCache,
+    TranscriptionQueueFull,
+    transcribe_audio,
+    transcribe_long_audio
+)
+from services.user_settings import UserSettingsRepository
 
 
 router = Router()
 
 logger = logging.getLogger(__name__)
 
+# Примерный битрейт документов без длительности, байт в секунду (~128 кбит/с)
+_ASSUMED_DOCUMENT_BYTERATE = 16_000
+
+
+def get_audio_duration(message: types.Message) -> float:
+    """Возвращает длительность аудио в секундах (для документов — оценку по размеру)."""
+    if message.voice:
+        return float(message.voice.duration or 0)
+    if message.audio:
+        return float(message.audio.duration or 0)
+    if message.document and message.document.file_size:
+        return message.document.file_size / _ASSUMED_DOCUMENT_BYTERATE
+    return 0.0
+
+
+def format_eta(seconds: float) -> str:
+    if seconds < 60:
+        return f"~{max(1, round(seconds))} сек"
+    return f"~{round(seconds / 60)} мин"
 
-async def process_audio_message(
+
+def get_file_entity(message: types.Message):
+    """Возвращает (файл, расширение) для аудио-сообщения или (None, None)."""
+    if message.voice:
+        return message.voice, ".ogg"
+    if message.audio:
+        file_entity = message.audio
+        return file_entity, os.path.splitext(file_entity.file_name)[1] if file_entity.file_name else ".mp3"
+    if message.document and (message.document.mime_type or "").startswith("audio"):
+        file_entity = message.document
+        return file_entity, os.path.splitext(file_entity.file_name)[1] if file_entity.file_name else ""
+    return None, None
+
+
+async def enqueue_audio_message(
     message: types.Message,
     bot: Bot,
-    user_settings: dict,
-    whisper_model: tuple
+    user_settings: UserSettingsRepository,
+    transcriber: ModelPool,
+    audio_scheduler: AudioJobScheduler,
+    transcription_cache: TranscriptionCache,
+    language_prior: LanguagePrior = None,
+    transcript_store: TranscriptStore = None,
+    profiler: JobProfiler = None
+):
+    """Ставит аудио в очередь планировщика и сообщает пользователю позицию."""
+    user_id = message.from_user.id
+    status_msg = await outbound.answer(message, "Обрабатываю аудио")
+
+    # Модель выбираем при постановке в очередь: глубина очереди говорит о нагрузке
+    user_prefs = get_user_settings(user_id, user_settings)
+    duration = get_audio_duration(message)
+    model_size = transcriber.route(duration, user_prefs.get("model_size"), audio_scheduler.queued)
+
+    # Повторно присланный файл отдаём из кэша без очереди, загрузки и инференса
+    file_entity, _ = get_file_entity(message)
+    if file_entity is not None:
+        language = user_prefs.get("language")
+        file_key = TranscriptionCache.file_key(file_entity.file_unique_id, model_size, language)
+        cached = await transcription_cache.get(file_key)
+        if cached is not None:
+            logger.info(f"Транскрибация для пользователя {user_id} найдена в кэше")
+            await deliver_audio_result(
+                message, status_msg, user_settings, cached,
+                model_size=model_size, transcript_store=transcript_store
+            )
+            return
+
+    async def on_wait(position: int, eta: float):
+        # Позиция в очереди — подсказка: после 429 её не повторяем, придёт следующая
+        await outbound.edit_text(
+            status_msg, f"Аудио в очереди: позиция {position}, ожидание {format_eta(eta)}", retry=False
+        )
+
+    queued_at = time.perf_counter()
+    trace = None
+
+    async def job():
+        nonlocal trace
+        STAGE_SECONDS.observe(
+            time.perf_counter() - queued_at,
+            stage="queue_wait",
+            duration_bucket=duration_bucket(duration),
+            model_size=model_size
+        )
+        # Трасса покрывает задачу от получения слота до доставки результата
+        if profiler is not None:
+            trace = profiler.start(f"Аудио пользователя {user_id}, {duration:.0f} с, модель {model_size}")
+        return await recognize_audio_message(
+            message, bot, status_msg, user_settings, transcriber, transcription_cache,
+            model_size=model_size, language_prior=language_prior
+        )
+
+    try:
+        try:
+            result = await audio_scheduler.run(user_id, duration, job, on_wait=on_wait)
+        except SchedulerQueueFull:
+            ERRORS.inc(stage="scheduler_queue_full")
+            logger.warning(f"Пользователь {user_id} превысил лимит задач в очереди")
+            await outbound.edit_text(status_msg, "Слишком много файлов в очереди. Дождитесь обработки предыдущих")
+            return
+
+        # Слот планировщика уже свободен: резюме и отправка не задерживают следующую запись
+        if result is not None:
+            transcription, transcription_sent = result
+            await deliver_audio_result(
+                message, status_msg, user_settings, transcription, transcription_sent,
+                model_size=model_size, transcript_store=transcript_store
+            )
+    finally:
+        if trace is not None:
+            await profiler.report(trace, bot)
+
+
+async def stream_transcription(message: types.Message, status_msg: types.Message, parts) -> str:
+    """
+    Отправляет части транскрибации по мере готовности, дописывая их в текущее
+    сообщение, пока оно помещается в лимит Telegram. Возвращает полный текст.
+    """
+    collected = []
+    live_msg = None
+    live_text = ""
+
+    async for part in parts:
+        if not part:
+            continue
+        collected.append(part)
+
+        for chunk in split_html(html.escape(part), TRANSCRIPTION_DISPLAY_CHUNK_SIZE):
+            if live_msg is None or len(live_text) + 1 + len(chunk) > MAX_MESSAGE_LENGTH:
+                live_text = chunk if live_msg else f"<b>Транскрибация</b>:\n{chunk}"
+                live_msg = await outbound.answer(message, live_text)
+            else:
+                live_text = f"{live_text}\n{chunk}"
+                await outbound.edit_text(live_msg, live_text)
+
+        await outbound.edit_text(status_msg, f"Транскрибирую длинную запись, готово частей: {len(collected)}")
+
+    return " ".join(collected)
+
+
+async def send_transcription(
+    message: types.Message,
+    transcription_header: str,
+    transcription: str,
+    reply_markup=None
+):
+    """Отправляет транскрибацию отдельными сообщениями или файлом, если она очень длинная."""
+    await outbound.send_text(
+        message, transcription, transcription_header, filename="transcription.txt", reply_markup=reply_markup
+    )
+
+
+async def send_summary(message: types.Message, summary_header: str, summary: str):
+    """Отправляет резюме отдельными сообщениями или файлом, если оно очень длинное."""
+    await outbound.send_text(message, summary, summary_header, filename="summary.txt")
+
+
+async def send_streaming_result(
+    message: types.Message,
+    status_msg: types.Message,
+    transcription: str,
+    transcription_header: str,
+    summary_header: str,
+    summary_style: str,
+    transcription_sent: bool,
+    duration: float,
+    model_size: str
 ):
-    """Обрабатывает аудио-, голосовые сообщения и документы с аудио."""
+    """
+    Выводит резюме по мере генерации. Если транскрибация короткая, резюме
+    дописывается под ней в сообщение статуса, иначе транскрибация уходит
+    отдельными сообщениями, а резюме — новым сообщением после неё.
+    """
+    if transcription_sent:
+        live_msg = None
+        header = summary_header
+    elif len(transcription_header) + len(transcription) + len(summary_header) <= MAX_MESSAGE_LENGTH // 2:
+        live_msg = status_msg
+        header = f"{transcription_header}\n{html.escape(transcription)}\n\n{summary_header}"
+        await outbound.edit_text(status_msg, f"{header}\nГенерирую резюме")
+    else:
+        with stage_timer("send", duration, model_size):
+            await send_transcription(message, transcription_header, transcription)
+        live_msg = None
+        header = summary_header
+
+    live = LiveMessage(message, live_msg, header)
+    with stage_timer("summarize", duration, model_size):
+        async for delta in stream_summary(transcription, summary_style):
+            await live.append(delta)
+        await live.finish()
+
+    if live_msg is None:
+        await outbound.edit_text(status_msg, "Аудио обработано!")
+
+
+async def recognize_audio_message(
+    message: types.Message,
+    bot: Bot,
+    status_msg: types.Message,
+    user_settings: UserSettingsRepository,
+    transcriber: ModelPool,
+    transcription_cache: TranscriptionCache,
+    model_size: str = None,
+    language_prior: LanguagePrior = None
+) -> tuple[str, bool] | None:
+    """
+    Стадия распознавания: загрузка, поиск в кэше и транскрибация.
+
+    Возвращает текст и признак того, что он уже отправлен пользователю
+    (длинные записи выводятся по частям), или None, если распознать не удалось
+    и пользователь уже получил сообщение об ошибке.
+    """
     user_id = message.from_user.id
-    status_msg = await message.answer("Обрабатываю аудио")
 
     # Получаем настройки пользователя
     user_prefs = get_user_settings(user_id, user_settings)
     selected_language = user_prefs.get("language")
-    selected_summary_style = user_prefs.get("summary_style")
 
-    whisper_model_instance, _ = whisper_model
+    duration = get_audio_duration(message)
+    model_size = model_size or transcriber.route(duration, user_prefs.get("model_size"))
     temp_path = None
+    transcription_sent = False
 
     try:
-        if message.voice:
-            file_entity = message.voice
-            file_suffix = ".ogg"
-        elif message.audio:
-            file_entity = message.audio
-            file_suffix = os.path.splitext(file_entity.file_name)[1] if file_entity.file_name else ".mp3"
-        elif message.document and message.document.mime_type.startswith("audio"):
-            file_entity = message.document
-            file_suffix = os.path.splitext(file_entity.file_name)[1] if file_entity.file_name else ""
-        else:
-            await status_msg.edit_text("Неверный тип файла")
-            return
+        file_entity, file_suffix = get_file_entity(message)
+        if file_entity is None:
+            await outbound.edit_text(status_msg, "Неверный тип файла")
+            return None
 
         file_info = await bot.get_file(file_entity.file_id)
 
-        with tempfile.NamedTemporaryFile(suffix=file_suffix, delete=False) as temp_file:
-            temp_path = temp_file.name
+        await outbound.edit_text(status_msg, "Загружаю файл")
+        with stage_timer("download", duration, model_size):
+            if (file_entity.file_size or 0) <= AUDIO_IN_MEMORY_MAX_BYTES:
+                # Небольшие файлы держим в памяти и декодируем через stdin ffmpeg
+                buffer = await bot.download_file(file_info.file_path)
+                audio = buffer.getvalue()
+            else:
+                with tempfile.NamedTemporaryFile(suffix=file_suffix, delete=False) as temp_file:
+                    temp_path = temp_file.name
+                await bot.download_file(file_info.file_path, destination=temp_path)
+                audio = temp_path
 
-        await status_msg.edit_text("Загружаю файл")
-        await bot.download_file(file_info.file_path, destination=temp_path)
+        with stage_timer("hash", duration, model_size):
+            if temp_path is None:
+                digest = TranscriptionCache.hash_bytes(audio)
+            else:
+                digest = await asyncio.to_thread(TranscriptionCache.hash_file, temp_path)
+
+        # Тот же звук мог прийти другим файлом (пересылка, повторная загрузка)
+        cache_keys = (
+            TranscriptionCache.file_key(file_entity.file_unique_id, model_size, selected_language),
+            TranscriptionCache.content_key(digest, model_size, selected_language)
+        )
+        transcription = await transcription_cache.get(cache_keys[1])
 
-        language_desc = f"{selected_language}" if selected_language != "auto" else "автоопределение"
-        await status_msg.edit_text(f"Транскрибирую ({language_desc})")
-        transcription = await transcribe_audio(whisper_model_instance, temp_path, selected_language)
+        # В режиме "auto" язык можно взять из истории пользователя и не определять заново.
+        # guess вызывается только перед распознаванием: ответ из кэша не сдвигает счётчик перепроверок
+        language = selected_language
+        on_language = None
+        if transcription is None and selected_language == "auto" and language_prior is not None:
+            language = language_prior.guess(user_id) or selected_language
+            if language == "auto":
+                on_language = functools.partial(language_prior.observe, user_id)
+
+        if transcription is not None:
+            await transcription_cache.put(cache_keys[:1], transcription)
+        elif duration >= LONG_AUDIO_THRESHOLD_SECONDS:
+            await outbound.edit_text(status_msg, "Транскрибирую длинную запись, отправляю текст по мере готовности")
+            parts = transcribe_long_audio(
+                transcriber, audio, language, model_size=model_size, on_language=on_language
+            )
+            with stage_timer("transcribe_long", duration, model_size):
+                transcription = await stream_transcription(message, status_msg, parts)
+            transcription_sent = True
+            if transcription:
+                await transcription_cache.put(cache_keys, transcription)
+        else:
+            if language == "auto":
+                language_desc = "автоопределение"
+            elif selected_language == "auto":
+                language_desc = f"{language}, по прошлым записям"
+            else:
+                language_desc = language
+            await outbound.edit_text(status_msg, f"Транскрибирую ({language_desc})")
+            with stage_timer("transcribe", duration, model_size):
+                transcription = await transcribe_audio(
+                    transcriber, audio, language,
+                    cache=transcription_cache, cache_keys=cache_keys,
+                    model_size=model_size, on_language=on_language
+                )
+        # Не держим байты аудио в памяти на время генерации резюме
+        del audio
 
         if not transcription:
-            await status_msg.edit_text("Не удалось распознать речь или аудио пустое.")
-            return
+            await outbound.edit_text(status_msg, "Не удалось распознать речь или аудио пустое.")
+            return None
 
-        await status_msg.edit_text("Генерирую резюме")
-        summary = await generate_summary(transcription, selected_summary_style)
+        return transcription, transcription_sent
 
-        lang_name = SUPPORTED_LANGUAGES.get(selected_language, 'Авто')
-        style_name = SUMMARY_STYLES.get(selected_summary_style, {}).get('name', 'Стандартный')
+    except TranscriptionQueueFull:
+        ERRORS.inc(stage="transcription_queue_full")
+        logger.warning(f"Очередь транскрибации переполнена, отказ пользователю {user_id}")
+        await outbound.edit_text(status_msg, "Сервер перегружен, попробуйте отправить аудио чуть позже")
+    except Exception as e:
+        ERRORS.inc(stage="audio")
+        logger.error(f"Ошибка при обработке аудио от пользователя {user_id}: {e}", exc_info=True)
+        await outbound.edit_text(status_msg, f"Произошла серьёзная ошибка при обработке аудио: {e}")
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+    return None
+
+
+async def deliver_audio_result(
+    message: types.Message,
+    status_msg: types.Message,
+    user_settings: UserSettingsRepository,
+    transcription: str,
+    transcription_sent: bool = False,
+    model_size: str = "",
+    transcript_store: TranscriptStore = None
+):
+    """
+    Стадия доставки: транскрибация уходит пользователю сразу, резюме
+    генерируется параллельно с отправкой (SUMMARY_MODE=auto) или по кнопке
+    "Резюме" (SUMMARY_MODE=button), чтобы не вызывать LLM без надобности.
+    """
+    user_id = message.from_user.id
+    user_prefs = get_user_settings(user_id, user_settings)
+    selected_language = user_prefs.get("language")
+    selected_summary_style = user_prefs.get("summary_style")
+    duration = get_audio_duration(message)
 
-        transcription_header = f"<b>Транскрибация</b> (Язык: {lang_name}):"
-        summary_header = f"<b>Краткое резюме</b> (Стиль: {style_name}):"
+    lang_name = SUPPORTED_LANGUAGES.get(selected_language, 'Авто')
+    style_name = SUMMARY_STYLES.get(selected_summary_style, {}).get('name', 'Стандартный')
 
-        full_response_text = f"{transcription_header}\n{transcription}\n\n{summary_header}\n{summary}"
+    transcription_header = f"<b>Транскрибация</b> (Язык: {lang_name}):"
+    summary_header = f"<b>Краткое резюме</b> (Стиль: {style_name}):"
+    transcription_text = f"{transcription_header}\n{html.escape(transcription)}"
 
-        if len(full_response_text) <= MAX_MESSAGE_LENGTH:
-            await status_msg.edit_text(full_response_text)
-        else:
-            await status_msg.edit_text("Аудио обработано! Отправляю результат частями")
+    try:
+        if SUMMARY_MODE == "button" and transcript_store is not None:
+            markup = get_summary_keyboard(transcript_store.put(transcription))
+            with stage_timer("send", duration, model_size):
+                if transcription_sent:
+                    await outbound.edit_text(status_msg, "Аудио обработано!", reply_markup=markup)
+                elif len(transcription_text) <= MAX_MESSAGE_LENGTH:
+                    await outbound.edit_text(status_msg, transcription_text, reply_markup=markup)
+                else:
+                    await outbound.edit_text(status_msg, "Аудио обработано! Отправляю результат частями")
+                    await send_transcription(message, transcription_header, transcription, reply_markup=markup)
+            return
 
-            await message.answer(transcription_header)
-            if len(transcription) > TRANSCRIPTION_DISPLAY_CHUNK_SIZE:
-                for i in range(0, len(transcription), TRANSCRIPTION_DISPLAY_CHUNK_SIZE):
-                    chunk = transcription[i:i + TRANSCRIPTION_DISPLAY_CHUNK_SIZE]
-                    await message.answer(chunk)
+        if SUMMARY_STREAMING:
+            await send_streaming_result(
+                message, status_msg, transcription, transcription_header, summary_header,
+                selected_summary_style, transcription_sent, duration, model_size
+            )
+            return
+
+        # Резюме генерируется, пока транскрибация отправляется пользователю
+        summary_task = asyncio.create_task(generate_summary(transcription, selected_summary_style))
+        try:
+            with stage_timer("send", duration, model_size):
+                if transcription_sent:
+                    status_has_transcription = False
+                elif len(transcription_text) + len(summary_header) <= MAX_MESSAGE_LENGTH // 2:
+                    status_has_transcription = True
+                    await outbound.edit_text(status_msg, f"{transcription_text}\n\n{summary_header}\nГенерирую резюме")
+                else:
+                    status_has_transcription = False
+                    await outbound.edit_text(status_msg, "Аудио обработано! Отправляю результат частями")
+                    await send_transcription(message, transcription_header, transcription)
+
+            with stage_timer("summarize", duration, model_size):
+                summary = await summary_task
+        finally:
+            summary_task.cancel()
+
+        full_response_text = f"{transcription_text}\n\n{summary_header}\n{html.escape(summary)}"
+
+        with stage_timer("send", duration, model_size):
+            if status_has_transcription and len(full_response_text) <= MAX_MESSAGE_LENGTH:
+                await outbound.edit_text(status_msg, full_response_text)
             else:
-                await message.answer(transcription)
+                if status_has_transcription:
+                    await outbound.edit_text(status_msg, transcription_text)
+                else:
+                    await outbound.edit_text(status_msg, "Аудио обработано!")
+                await send_summary(message, summary_header, summary)
+
+    except Exception as e:
+        ERRORS.inc(stage="audio_delivery")
+        logger.error(f"Ошибка при отправке результата пользователю {user_id}: {e}", exc_info=True)
+        await outbound.edit_text(status_msg, f"Произошла серьёзная ошибка при обработке аудио: {e}")
+
+
+async def enqueue_archive_message(
+    message: types.Message,
+    bot: Bot,
+    user_settings: UserSettingsRepository,
+    transcriber: ModelPool,
+    audio_scheduler: AudioJobScheduler,
+    transcription_cache: TranscriptionCache,
+    profiler: JobProfiler = None
+):
+    """Ставит архив с аудиофайлами в очередь планировщика одной задачей."""
+    user_id = message.from_user.id
+    status_msg = await outbound.answer(message, "Обрабатываю архив")
+    duration = get_audio_duration(message)
+
+    async def on_wait(position: int, eta: float):
+        # Позиция в очереди — подсказка: после 429 её не повторяем, придёт следующая
+        await outbound.edit_text(
+            status_msg, f"Архив в очереди: позиция {position}, ожидание {format_eta(eta)}", retry=False
+        )
+
+    trace = None
+
+    async def job():
+        nonlocal trace
+        if profiler is not None:
+            trace = profiler.start(f"Архив пользователя {user_id}: {message.document.file_name}")
+        return await recognize_archive_message(
+            message, bot, status_msg, user_settings, transcriber, transcription_cache
+        )
+
+    try:
+        try:
+            results = await audio_scheduler.run(user_id, duration, job, on_wait=on_wait)
+        except SchedulerQueueFull:
+            ERRORS.inc(stage="scheduler_queue_full")
+            logger.warning(f"Пользователь {user_id} превысил лимит задач в очереди")
+            await outbound.edit_text(status_msg, "Слишком много файлов в очереди. Дождитесь обработки предыдущих")
+            return
+
+        if results:
+            await deliver_archive_result(message, status_msg, user_settings, results)
+    finally:
+        if trace is not None:
+            await profiler.report(trace, bot)
+
+
+async def recognize_archive_message(
+    message: types.Message,
+    bot: Bot,
+    status_msg: types.Message,
+    user_settings: UserSettingsRepository,
+    transcriber: ModelPool,
+    transcription_cache: TranscriptionCache
+) -> list[tuple[str, str, bool]] | None:
+    """
+    Распознаёт все аудиофайлы архива.
+
+    Файлы читаются из архива по одному и сразу уходят в пул транскрибации,
+    одновременно не больше ARCHIVE_PARALLEL_FILES: столько же файлов держится
+    в памяти. Прогресс пишется в одно сообщение статуса. Возвращает список
+    (имя файла, текст, распознан ли) в порядке файлов в архиве или None при ошибке.
+    """
+    user_id = message.from_user.id
+    user_prefs = get_user_settings(user_id, user_settings)
+    language = user_prefs.get("language")
+    preference = user_prefs.get("model_size")
+    duration = get_audio_duration(message)
+
+    temp_path = None
+    results: list[tuple[str, str, bool] | None] = []
+    tasks = []
+    slots = asyncio.Semaphore(max(1, ARCHIVE_PARALLEL_FILES))
+    done = 0
+    next_update = 0.0
+    expected = None
+
+    async def report_progress():
+        nonlocal next_update
+        if time.monotonic() < next_update:
+            return
+        next_update = time.monotonic() + ARCHIVE_PROGRESS_INTERVAL
+        total = f" из {expected}" if expected else ""
+        try:
+            await outbound.edit_text(status_msg, f"Распознаю архив: готово файлов {done}{total}", retry=False)
+        except TelegramRetryAfter:
+            # Прогресс не критичен: следующее обновление покажет актуальное число
+            pass
 
-            await message.answer(summary_header)
-            if len(summary) > TRANSCRIPTION_DISPLAY_CHUNK_SIZE:
-                for i in range(0, len(summary), TRANSCRIPTION_DISPLAY_CHUNK_SIZE):
-                    chunk = summary[i:i + TRANSCRIPTION_DISPLAY_CHUNK_SIZE]
-                    await message.answer(chunk)
+    async def recognize_entry(index: int, name: str, data: bytes | None):
+        nonlocal done
+        try:
+            if data is None:
+                results[index] = (name, "[Файл слишком большой, пропущен]", False)
+                return
+            model_size = transcriber.route(len(data) / _ASSUMED_DOCUMENT_BYTERATE, preference)
+            digest = await asyncio.to_thread(TranscriptionCache.hash_bytes, data)
+            cache_keys = (TranscriptionCache.content_key(digest, model_size, language),)
+            text = await transcription_cache.get(*cache_keys)
+            if text is None:
+                text = await transcribe_audio(
+                    transcriber, data, language,
+                    cache=transcription_cache, cache_keys=cache_keys, model_size=model_size
+                )
+            if text and not text.startswith("[Ошибка"):
+                results[index] = (name, text, True)
             else:
-                await message.answer(summary)
+                results[index] = (name, text or "[Речь не распознана]", False)
+        except TranscriptionQueueFull:
+            ERRORS.inc(stage="transcription_queue_full")
+            results[index] = (name, "[Сервер перегружен, файл не распознан]", False)
+        except Exception as e:
+            ERRORS.inc(stage="archive_entry")
+            logger.error(f"Ошибка при распознавании {name} из архива пользователя {user_id}: {e}", exc_info=True)
+            results[index] = (name, f"[Ошибка при распознавании: {e}]", False)
+        finally:
+            slots.release()
+            done += 1
+            await report_progress()
+
+    try:
+        file_info = await bot.get_file(message.document.file_id)
+
+        await outbound.edit_text(status_msg, "Загружаю архив")
+        suffix = os.path.splitext(message.document.file_name or "")[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+            temp_path = temp_file.name
+        with stage_timer("download", duration):
+            await bot.download_file(file_info.file_path, destination=temp_path)
 
+        expected = await asyncio.to_thread(count_archive_audio, temp_path)
+        await report_progress()
+
+        with stage_timer("transcribe_archive", duration):
+            # Следующий файл распаковывается, только когда освободился слот
+            async for name, data in read_archive_audio(temp_path):
+                await slots.acquire()
+                results.append(None)
+                tasks.append(asyncio.create_task(recognize_entry(len(results) - 1, name, data)))
+                del data
+            await asyncio.gather(*tasks)
+
+        if not results:
+            await outbound.edit_text(status_msg, "В архиве не найдено аудиофайлов")
+            return None
+        return results
+
+    except ArchiveLimitExceeded as e:
+        await outbound.edit_text(status_msg, f"Архив слишком большой: {e}")
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        await outbound.edit_text(status_msg, f"Не удалось прочитать архив: {e}")
     except Exception as e:
-        await status_msg.edit_text(f"Произошла серьёзная ошибка при обработке аудио: {e}")
+        ERRORS.inc(stage="archive")
+        logger.error(f"Ошибка при обработке архива от пользователя {user_id}: {e}", exc_info=True)
+        await outbound.edit_text(status_msg, f"Произошла серьёзная ошибка при обработке архива: {e}")
     finally:
+        for task in tasks:
+            task.cancel()
         if temp_path and os.path.exists(temp_path):
             os.unlink(temp_path)
+    return None
+
+
+async def deliver_archive_result(
+    message: types.Message,
+    status_msg: types.Message,
+    user_settings: UserSettingsRepository,
+    results: list[tuple[str, str, bool]]
+):
+    """
+    Отправляет общую транскрибацию архива одним файлом и, если включено
+    ARCHIVE_SUMMARIES, вторым файлом — резюме каждой распознанной записи.
+    """
+    user_id = message.from_user.id
+    selected_summary_style = get_user_settings(user_id, user_settings).get("summary_style")
+    archive_name = os.path.basename(message.document.file_name or "archive").split(".")[0] or "archive"
+    recognized = [(name, text) for name, text, ok in results if ok]
+
+    try:
+        with stage_timer("send"):
+            await outbound.edit_text(status_msg, f"Архив обработан: распознано файлов {len(recognized)} из {len(results)}")
+            combined = "\n\n".join(f"=== {name} ===\n{text}" for name, text, _ in results)
+            await outbound.send_document(
+                message, combined, f"{archive_name}_transcription.txt",
+                caption=f"<b>Транскрибация архива</b> (файлов: {len(results)})"
+            )
+
+        if not ARCHIVE_SUMMARIES or not recognized:
+            return
 
+        slots = asyncio.Semaphore(max(1, ARCHIVE_PARALLEL_FILES))
+
+        async def summarize(text: str) -> str:
+            async with slots:
+                return await generate_summary(text, selected_summary_style)
+
+        with stage_timer("summarize"):
+            summaries = await asyncio.gather(*(summarize(text) for _, text in recognized))
+
+        style_name = SUMMARY_STYLES.get(selected_summary_style, {}).get('name', 'Стандартный')
+        with stage_timer("send"):
+            await outbound.send_document(
+                message,
+                "\n\n".join(f"=== {name} ===\n{summary}" for (name, _), summary in zip(recognized, summaries)),
+                f"{archive_name}_summary.txt",
+                caption=f"<b>Краткое резюме по файлам</b> (Стиль: {style_name})"
+            )
+    except Exception as e:
+        ERRORS.inc(stage="archive_delivery")
+        logger.error(f"Ошибка при отправке результата архива пользователю {user_id}: {e}", exc_info=True)
+        await outbound.edit_text(status_msg, f"Произошла серьёзная ошибка при обработке архива: {e}")
 
 
 @router.message(F.voice)
-async def handle_voice_message(message: types.Message, bot: Bot, user_settings: dict, whisper_model: tuple):
-    await process_audio_message(message, bot, user_settings, whisper_model)
+async def handle_voice_message(
+    message: types.Message,
+    bot: Bot,
+    user_settings: UserSettingsRepository,
+    transcriber: ModelPool,
+    audio_scheduler: AudioJobScheduler,
+    transcription_cache: TranscriptionCache,
+    language_prior: LanguagePrior,
+    transcript_store: TranscriptStore,
+    profiler: JobProfiler
+):
+    await enqueue_audio_message(
+        message, bot, user_settings, transcriber, audio_scheduler, transcription_cache,
+        language_prior, transcript_store, profiler
+    )
 
 
 @router.message(F.audio)
-async def handle_audio_message(message: types.Message, bot: Bot, user_settings: dict, whisper_model: tuple):
-    await process_audio_message(message, bot, user_settings, whisper_model)
+async def handle_audio_message(
+    message: types.Message,
+    bot: Bot,
+    user_settings: UserSettingsRepository,
+    transcriber: ModelPool,
+    audio_scheduler: AudioJobScheduler,
+    transcription_cache: TranscriptionCache,
+    language_prior: LanguagePrior,
+    transcript_store: TranscriptStore,
+    profiler: JobProfiler
+):
+    await enqueue_audio_message(
+        message, bot, user_settings, transcriber, audio_scheduler, transcription_cache,
+        language_prior, transcript_store, profiler
+    )
 
 
 @router.message(F.document)
-async def handle_document_audio(message: types.Message, bot: Bot, user_settings: dict, whisper_model: tuple):
+async def handle_document_audio(
+    message: types.Message,
+    bot: Bot,
+    user_settings: UserSettingsRepository,
+    transcriber: ModelPool,
+    audio_scheduler: AudioJobScheduler,
+    transcription_cache: TranscriptionCache,
+    language_prior: LanguagePrior,
+    transcript_store: TranscriptStore,
+    profiler: JobProfiler
+):
     if message.document.mime_type and message.document.mime_type.startswith("audio"):
-        await process_audio_message(message, bot, user_settings, whisper_model)
\ No newline at end of file
+        await enqueue_audio_message(
+            message, bot, user_settings, transcriber, audio_scheduler, transcription_cache,
+            language_prior, transcript_store, profiler
+        )
+    elif is_archive(message.document.file_name, message.document.mime_type):
+        await enqueue_archive_message(
+            message, bot, user_settings, transcriber, audio_scheduler, transcription_cache, profiler
+        )
+
+
+@router.callback_query(F.data.startswith("summary:"))
+async def cq_summary(
+    callback: types.CallbackQuery,
+    user_settings: UserSettingsRepository,
+    transcript_store: TranscriptStore
+):
+    """Генерирует резюме по готовой транскрибации по нажатию кнопки "Резюме"."""
+    user_id = callback.from_user.id
+    token = callback.data.split(":", 1)[1]
+    logger.info(f"cq_summary вызван пользователем {user_id}")
+
+    transcription = transcript_store.get(token)
+    if transcription is None:
+        await callback.answer("Транскрибация устарела, отправьте аудио ещё раз", show_alert=True)
+        return
+
+    await callback.answer("Генерирую резюме")
+    # Повторное нажатие не нужно: убираем кнопку
+    await callback.message.edit_reply_markup(reply_markup=None)
+
+    selected_summary_style = get_user_settings(user_id, user_settings).get("summary_style")
+    style_name = SUMMARY_STYLES.get(selected_summary_style, {}).get('name', 'Стандартный')
+    summary_header = f"<b>Краткое резюме</b> (Стиль: {style_name}):"
+
+    try:
+        with stage_timer("summarize"):
+            if SUMMARY_STREAMING:
+                live = LiveMessage(callback.message, None, summary_header)
+                async for delta in stream_summary(transcription, selected_summary_style):
+                    await live.append(delta)
+                await live.finish()
+            else:
+                summary = await generate_summary(transcription, selected_summary_style)
+                await send_summary(callback.message, summary_header, summary)
+    except Exception as e:
+        ERRORS.inc(stage="summary_button")
+        logger.error(f"Ошибка при генерации резюме для пользователя {user_id}: {e}", exc_info=True)
+        await outbound.answer(callback.message, f"Ошибка при генерации резюме: {e}")
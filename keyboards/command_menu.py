@@ -1,5 +1,13 @@
+import logging
+
 from aiogram import Bot
-from aiogram.types import BotCommand, BotCommandScopeDefault
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import BotCommand, BotCommandScopeChat, BotCommandScopeDefault
+
+from config import ADMIN_USER_IDS
+
+
+logger = logging.getLogger(__name__)
 
 
 async def set_main_menu(bot: Bot):
@@ -14,4 +22,19 @@ async def set_main_menu(bot: Bot):
     await bot.set_my_commands(
         commands=main_menu_commands,
         scope=BotCommandScopeDefault()
-    )
\ No newline at end of file
+    )
+
+    # Администраторы видят в меню ещё и команды профилирования
+    admin_menu_commands = main_menu_commands + [
+        BotCommand(command="/profile", description="Профилирование задач"),
+        BotCommand(command="/slowtrace", description="Трассы медленных задач")
+    ]
+    for admin_id in ADMIN_USER_IDS:
+        try:
+            await bot.set_my_commands(
+                commands=admin_menu_commands,
+                scope=BotCommandScopeChat(chat_id=admin_id)
+            )
+        except TelegramAPIError as e:
+            # Чата ещё нет, если администратор не запускал бота
+            logger.warning(f"Не удалось задать меню администратора {admin_id}: {e}")
@@ -2,7 +2,13 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 
-from config import SUPPORTED_LANGUAGES, SUMMARY_STYLES
+from config import (
+    LANGUAGE_KEYBOARD_PAGE_SIZE,
+    MODEL_SIZE_NAMES,
+    SUPPORTED_LANGUAGES,
+    SUMMARY_STYLES,
+    WHISPER_MODEL_SIZES
+)
 
 
 
@@ -13,6 +19,7 @@ def get_main_settings_keyboard() -> InlineKeyboardMarkup:
     
     builder.button(text="Язык транскрибации", callback_data="settings:language")
     builder.button(text="Стиль резюме",      callback_data="settings:summary_style")
+    builder.button(text="Модель распознавания", callback_data="settings:model")
     builder.button(text="Закрыть настройки",  callback_data="settings:close")
     
     builder.adjust(1)
@@ -20,16 +27,46 @@ def get_main_settings_keyboard() -> InlineKeyboardMarkup:
 
 
 
-def get_language_keyboard(current_lang: str) -> InlineKeyboardMarkup:
-    """Возвращает клавиатуру для выбора языка транскрибации."""
+def get_language_pages_count() -> int:
+    """Количество страниц в выборе языка."""
+    return -(-len(SUPPORTED_LANGUAGES) // LANGUAGE_KEYBOARD_PAGE_SIZE)
+
+
+
+def get_language_page(lang_code: str) -> int:
+    """Номер страницы, на которой находится язык."""
+    codes = list(SUPPORTED_LANGUAGES)
+    index = codes.index(lang_code) if lang_code in codes else 0
+    return index // LANGUAGE_KEYBOARD_PAGE_SIZE
+
+
+
+def get_language_keyboard(current_lang: str, page: int = None) -> InlineKeyboardMarkup:
+    """Возвращает постраничную клавиатуру для выбора языка транскрибации."""
     builder = InlineKeyboardBuilder()
     
-    for code, name in SUPPORTED_LANGUAGES.items():
+    pages = get_language_pages_count()
+    if page is None:
+        page = get_language_page(current_lang)
+    page = min(max(page, 0), pages - 1)
+    
+    start = page * LANGUAGE_KEYBOARD_PAGE_SIZE
+    languages = list(SUPPORTED_LANGUAGES.items())[start:start + LANGUAGE_KEYBOARD_PAGE_SIZE]
+    for code, name in languages:
         text = f"✅ {name}" if code == current_lang else name
         builder.button(text=text, callback_data=f"select_lang:{code}")
+    # Языки в два столбца
+    rows = [2] * (len(languages) // 2) + [1] * (len(languages) % 2)
+    
+    if pages > 1:
+        builder.button(text="◀️", callback_data=f"lang_page:{(page - 1) % pages}")
+        builder.button(text=f"{page + 1}/{pages}", callback_data=f"lang_page:{page}")
+        builder.button(text="▶️", callback_data=f"lang_page:{(page + 1) % pages}")
+        rows.append(3)
     
     builder.button(text="Назад к настройкам", callback_data="settings:main")
-    builder.adjust(1)
+    rows.append(1)
+    builder.adjust(*rows)
     return builder.as_markup()
 
 
@@ -49,6 +86,28 @@ def get_summary_style_keyboard(current_style: str) -> InlineKeyboardMarkup:
 
 
 
+def get_model_keyboard(current_model: str) -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру для выбора модели распознавания."""
+    builder = InlineKeyboardBuilder()
+    
+    for code in ["auto"] + WHISPER_MODEL_SIZES:
+        name = MODEL_SIZE_NAMES.get(code, code)
+        text = f"✅ {name}" if code == current_model else name
+        builder.button(text=text, callback_data=f"select_model:{code}")
+    
+    builder.button(text="Назад к настройкам", callback_data="settings:main")
+    builder.adjust(1)
+    return builder.as_markup()
+
+
+
+def get_summary_keyboard(token: str) -> InlineKeyboardMarkup:
+    """Возвращает кнопку для генерации резюме по готовой транскрибации."""
+    buttons = [[InlineKeyboardButton(text="Резюме", callback_data=f"summary:{token}")]]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
     """Возвращает кнопку 'Отмена'."""
     buttons = [[InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_state")]]
@@ -5,42 +5,111 @@ import logging
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.client.bot import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from dotenv import load_dotenv
 
-from handlers import common_handlers, settings_handlers, voice_audio_handler, text_input_handler
+from handlers import admin_handlers, common_handlers, settings_handlers, voice_audio_handler, text_input_handler
 from keyboards.command_menu import set_main_menu
-from services.transcription import load_whisper_model
-from config import TELEGRAM_BOT_TOKEN
+from services.job_queue import RemoteTranscriber, create_job_queue
+from services.language import LanguagePrior
+from services.llm_client import get_llm_client
+from services.metrics import JOBS_INFLIGHT, QUEUE_DEPTH, start_metrics_server
+from services.profiling import JobProfiler
+from services.scheduler import AudioJobScheduler
+from services.transcript_store import TranscriptStore
+from services.transcription import ModelPool, TranscriptionCache
+from services.user_settings import UserSettingsRepository
+from config import JOB_QUEUE_BACKEND, METRICS_HOST, METRICS_PORT, TELEGRAM_API_SERVER, TELEGRAM_BOT_TOKEN
 
 
-async def main():
-    load_dotenv()
-
-    bot = Bot(
-        token=TELEGRAM_BOT_TOKEN,
+def create_bot(token: str = TELEGRAM_BOT_TOKEN, api_server: str = TELEGRAM_API_SERVER) -> Bot:
+    """
+    Создаёт бота. api_server — адрес своего Bot API сервера (локального
+    telegram-bot-api или заглушки из benchmarks.fake_telegram) вместо api.telegram.org.
+    """
+    session = None
+    if api_server:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_server))
+    return Bot(
+        token=token,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
 
+
+def create_dispatcher(transcriber=None) -> Dispatcher:
+    """
+    Собирает диспетчер со всеми роутерами и сервисами. transcriber можно
+    передать готовым (например, пул с одной маленькой моделью для нагрузочного
+    теста), иначе он выбирается по JOB_QUEUE_BACKEND. Сервисы запускаются здесь,
+    а останавливаются в close_dispatcher.
+    """
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
 
-    dp['user_settings'] = {}
-    dp['whisper_model'] = load_whisper_model()
+    if transcriber is None and JOB_QUEUE_BACKEND == "local":
+        transcriber = ModelPool()
+    elif transcriber is None:
+        # Модель живёт в отдельных процессах worker.py
+        transcriber = RemoteTranscriber(create_job_queue())
+    transcriber.start()
+    # Проверяем LLM_PROVIDERS при старте, а не на первом запросе
+    get_llm_client()
+    audio_scheduler = AudioJobScheduler()
+    user_settings = UserSettingsRepository()
+    user_settings.start()
 
-    await set_main_menu(bot)
+    dp['user_settings'] = user_settings
+    dp['transcriber'] = transcriber
+    dp['audio_scheduler'] = audio_scheduler
+    dp['transcription_cache'] = TranscriptionCache()
+    dp['language_prior'] = LanguagePrior()
+    dp['transcript_store'] = TranscriptStore()
+    dp['profiler'] = JobProfiler()
+
+    QUEUE_DEPTH.set_function(lambda: audio_scheduler.queued, queue="audio_jobs")
+    JOBS_INFLIGHT.set_function(lambda: audio_scheduler.inflight, queue="audio_jobs")
+    QUEUE_DEPTH.set_function(lambda: transcriber.pending, queue="transcription")
 
+    dp.include_router(admin_handlers.router)
     dp.include_router(common_handlers.router)
     dp.include_router(settings_handlers.router)
     dp.include_router(voice_audio_handler.router)
     dp.include_router(text_input_handler.router)
+    return dp
+
+
+async def close_dispatcher(dp: Dispatcher):
+    """Останавливает сервисы, запущенные в create_dispatcher."""
+    dp['transcriber'].shutdown()
+    await dp['user_settings'].close()
+    await get_llm_client().close()
+    dp['transcription_cache'].close()
+
+
+async def main():
+    load_dotenv()
+
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+    await set_main_menu(bot)
 
     logging.basicConfig(level=logging.INFO)
     try:
         await dp.start_polling(bot)
     finally:
+        await close_dispatcher(dp)
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
         await bot.session.close()
 
 
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import tarfile
+import zipfile
+from typing import AsyncIterator, Iterator
+
+from config import ARCHIVE_MAX_FILE_BYTES, ARCHIVE_MAX_FILES, ARCHIVE_MAX_TOTAL_BYTES
+
+
+logger = logging.getLogger(__name__)
+
+# Расширения файлов внутри архива, которые отправляются на распознавание
+AUDIO_EXTENSIONS = {
+    ".aac", ".amr", ".flac", ".m4a", ".mp3", ".mp4", ".oga", ".ogg", ".opus", ".wav", ".webm", ".wma"
+}
+
+_ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+_ARCHIVE_MIME_TYPES = {
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-compressed-tar",
+}
+
+
+class ArchiveLimitExceeded(Exception):
+    """Архив превышает допустимое число файлов или объём распакованных данных."""
+
+
+def is_archive(file_name: str | None, mime_type: str | None) -> bool:
+    """Похож ли документ на zip- или tar-архив (по имени файла или MIME-типу)."""
+    if file_name and file_name.lower().endswith(_ARCHIVE_SUFFIXES):
+        return True
+    return (mime_type or "").lower() in _ARCHIVE_MIME_TYPES
+
+
+def _is_audio_entry(name: str) -> bool:
+    base = os.path.basename(name)
+    if not base or base.startswith(".") or name.startswith("__MACOSX/"):
+        return False
+    return os.path.splitext(base)[1].lower() in AUDIO_EXTENSIONS
+
+
+def _read_limited(stream, limit: int) -> bytes | None:
+    """Читает не больше limit байт; None, если данных больше (заголовку архива верить нельзя)."""
+    data = stream.read(limit + 1)
+    return None if len(data) > limit else data
+
+
+def _iter_zip(path: str):
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not _is_audio_entry(info.filename):
+                continue
+            with archive.open(info) as stream:
+                yield info.filename, stream
+
+
+def _iter_tar(path: str):
+    # Режим "r|*" читает архив последовательно, без произвольного доступа и распаковки на диск
+    with tarfile.open(path, mode="r|*") as archive:
+        for member in archive:
+            if not member.isfile() or not _is_audio_entry(member.name):
+                continue
+            stream = archive.extractfile(member)
+            if stream is not None:
+                yield member.name, stream
+
+
+def iter_archive_audio(
+    path: str,
+    max_files: int = ARCHIVE_MAX_FILES,
+    max_file_bytes: int = ARCHIVE_MAX_FILE_BYTES,
+    max_total_bytes: int = ARCHIVE_MAX_TOTAL_BYTES
+) -> Iterator[tuple[str, bytes | None]]:
+    """
+    Последовательно читает аудиофайлы из zip- или tar-архива.
+
+    В памяти одновременно находится только текущий файл. Для файлов крупнее
+    max_file_bytes вместо байтов возвращается None. Если файлов больше max_files
+    или распакованный объём больше max_total_bytes, бросается ArchiveLimitExceeded.
+    """
+    entries = _iter_zip(path) if zipfile.is_zipfile(path) else _iter_tar(path)
+    count = 0
+    total = 0
+    for name, stream in entries:
+        count += 1
+        if count > max_files:
+            raise ArchiveLimitExceeded(f"в архиве больше {max_files} аудиофайлов")
+
+        remaining = max_total_bytes - total
+        data = _read_limited(stream, min(max_file_bytes, remaining))
+        if data is None:
+            if remaining <= max_file_bytes:
+                raise ArchiveLimitExceeded(f"распакованный объём больше {max_total_bytes // (1024 * 1024)} МБ")
+            logger.info(f"Файл {name} в архиве слишком большой, пропускаем")
+        else:
+            total += len(data)
+        yield name, data
+
+
+def count_archive_audio(path: str) -> int | None:
+    """Число аудиофайлов в zip-архиве по оглавлению; для tar без полного чтения неизвестно."""
+    if not zipfile.is_zipfile(path):
+        return None
+    with zipfile.ZipFile(path) as archive:
+        return sum(1 for info in archive.infolist() if not info.is_dir() and _is_audio_entry(info.filename))
+
+
+async def read_archive_audio(path: str, **limits) -> AsyncIterator[tuple[str, bytes | None]]:
+    """Асинхронная обёртка над iter_archive_audio: чтение и распаковка идут в отдельном потоке."""
+    entries = iter_archive_audio(path, **limits)
+    try:
+        while True:
+            entry = await asyncio.to_thread(next, entries, None)
+            if entry is None:
+                return
+            yield entry
+    finally:
+        await asyncio.to_thread(entries.close)
@@ -0,0 +1,216 @@
+import logging
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Частота дискретизации, с которой работает Whisper
+SAMPLE_RATE = 16000
+
+
+def _ffmpeg_decode(source: str, data: bytes = None, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    cmd = ["ffmpeg"]
+    if data is None:
+        cmd.append("-nostdin")
+    cmd += [
+        "-threads", "0",
+        "-i", source,
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate),
+        "-loglevel", "error",
+        "pipe:1"
+    ]
+    result = subprocess.run(cmd, input=data, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def decode_audio_bytes(data: bytes, suffix: str = "", sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Декодирует аудио из памяти в моно float32 PCM с частотой sample_rate.
+
+    Байты подаются в stdin ffmpeg без записи на диск. Контейнеры, которым нужен
+    произвольный доступ (например, m4a с moov-атомом в конце), из пайпа не читаются —
+    для них выполняется запасной проход через временный файл.
+    """
+    try:
+        return _ffmpeg_decode("pipe:0", data, sample_rate)
+    except subprocess.CalledProcessError as e:
+        logger.info(f"Декодирование из пайпа не удалось, пробуем через файл: {e.stderr.decode(errors='ignore')[:200]}")
+
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+        temp_file.write(data)
+        temp_path = temp_file.name
+    try:
+        return decode_audio_file(temp_path, sample_rate)
+    finally:
+        os.unlink(temp_path)
+
+
+def decode_audio_file(file_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Декодирует аудиофайл в моно float32 PCM с частотой sample_rate."""
+    return _ffmpeg_decode(file_path, sample_rate=sample_rate)
+
+
+def frame_energy(audio: np.ndarray, frame_seconds: float = 0.03, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Среднеквадратичная энергия аудио по непересекающимся кадрам."""
+    frame = max(1, int(frame_seconds * sample_rate))
+    usable = len(audio) - len(audio) % frame
+    if usable == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:usable].reshape(-1, frame)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def split_on_silence(
+    audio: np.ndarray,
+    max_segment_seconds: float,
+    min_segment_seconds: float = None,
+    frame_seconds: float = 0.03,
+    sample_rate: int = SAMPLE_RATE
+) -> list[tuple[int, int]]:
+    """
+    Делит аудио на сегменты не длиннее max_segment_seconds.
+
+    Граница каждого сегмента ставится в самый тихий кадр во второй половине
+    допустимого окна, поэтому разрезы приходятся на паузы, а не на середину слова.
+    Возвращает список пар (начало, конец) в отсчётах.
+    """
+    total = len(audio)
+    max_len = int(max_segment_seconds * sample_rate)
+    if total <= max_len:
+        return [(0, total)]
+
+    if min_segment_seconds is None:
+        min_segment_seconds = max_segment_seconds / 2
+
+    frame = max(1, int(frame_seconds * sample_rate))
+    energy = frame_energy(audio, frame_seconds, sample_rate)
+    min_frames = max(1, int(min_segment_seconds * sample_rate) // frame)
+    max_frames = max(min_frames + 1, max_len // frame)
+
+    bounds = []
+    start = 0
+    while total - start * frame > max_len:
+        window = energy[start + min_frames:start + max_frames]
+        if len(window) == 0:
+            break
+        cut = start + min_frames + int(np.argmin(window))
+        bounds.append((start * frame, cut * frame))
+        start = cut
+
+    bounds.append((start * frame, total))
+    return bounds
+
+
+class SpeechRegions:
+    """
+    Речевые участки записи, склеенные без пауз, и карта смещений обратно в исходную запись.
+
+    regions — массив пар (начало, конец) участков в отсчётах исходной записи.
+    """
+
+    def __init__(self, audio: np.ndarray, regions: np.ndarray, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.regions = regions
+        self.original_samples = len(audio)
+        lengths = regions[:, 1] - regions[:, 0]
+        # Начало каждого участка в склеенной записи
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        if len(regions) == 1 and regions[0, 0] == 0 and regions[0, 1] == len(audio):
+            self.audio = audio
+        else:
+            self.audio = np.concatenate([audio[start:end] for start, end in regions]) if len(regions) else audio[:0]
+
+    @property
+    def original_seconds(self) -> float:
+        return self.original_samples / self.sample_rate
+
+    @property
+    def speech_seconds(self) -> float:
+        return len(self.audio) / self.sample_rate
+
+    @property
+    def trimmed_ratio(self) -> float:
+        """Доля исходной записи, вырезанная как тишина."""
+        if not self.original_samples:
+            return 0.0
+        return 1 - len(self.audio) / self.original_samples
+
+    def to_original(self, seconds: float, end: bool = False) -> float:
+        """
+        Переводит время в склеенной записи во время исходной записи.
+        Для концов отрезков (end=True) граница участков относится к предыдущему участку.
+        """
+        if not len(self.regions):
+            return seconds
+        position = seconds * self.sample_rate
+        i = int(np.searchsorted(self.offsets, position, side="left" if end else "right")) - 1
+        i = min(max(i, 0), len(self.regions) - 1)
+        return float(self.regions[i, 0] + position - self.offsets[i]) / self.sample_rate
+
+    def remap(self, result: dict) -> dict:
+        """Возвращает результат движка с временем сегментов исходной записи и статистикой обрезки."""
+        result = dict(result)
+        result["segments"] = [
+            {**seg, "start": self.to_original(seg["start"]), "end": self.to_original(seg["end"], end=True)}
+            for seg in result.get("segments", [])
+        ]
+        result["trim"] = {"original_seconds": self.original_seconds, "speech_seconds": self.speech_seconds}
+        return result
+
+
+def trim_silence(
+    audio: np.ndarray,
+    threshold_db: float = -45.0,
+    noise_factor: float = 2.0,
+    min_silence_seconds: float = 0.6,
+    padding_seconds: float = 0.2,
+    frame_seconds: float = 0.03,
+    sample_rate: int = SAMPLE_RATE
+) -> SpeechRegions:
+    """
+    Находит речь по энергии кадров и вырезает паузы длиннее min_silence_seconds.
+
+    Порог — большее из абсолютного threshold_db и уровня шума записи (10-й
+    перцентиль энергии кадров), умноженного на noise_factor, но не выше половины
+    уровня громких кадров (90-й перцентиль). Вокруг речи
+    оставляется padding_seconds, чтобы не срезать тихие начала и концы слов.
+    Все шаги векторизованы, цикл по кадрам не нужен даже для часовых записей.
+    """
+    frame = max(1, int(frame_seconds * sample_rate))
+    energy = frame_energy(audio, frame_seconds, sample_rate)
+    if len(energy) == 0:
+        return SpeechRegions(audio, np.array([[0, len(audio)]], dtype=np.int64), sample_rate)
+
+    noise, loud = np.percentile(energy, [10, 90])
+    # В записи без пауз 10-й перцентиль — уже речь: порог шума не поднимаем выше
+    # половины уровня громких кадров, иначе такая запись целиком уйдёт в тишину
+    threshold = max(10 ** (threshold_db / 20), min(float(noise) * noise_factor, float(loud) / 2))
+    speech = energy > threshold
+
+    padding = int(round(padding_seconds / frame_seconds))
+    if padding:
+        speech = np.convolve(speech, np.ones(2 * padding + 1), mode="same") > 0
+
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return SpeechRegions(audio, np.zeros((0, 2), dtype=np.int64), sample_rate)
+
+    # Короткие паузы внутри речи оставляем: это дыхание и паузы между словами
+    long_gaps = starts[1:] - ends[:-1] >= max(1, int(min_silence_seconds / frame_seconds))
+    starts = np.concatenate((starts[:1], starts[1:][long_gaps]))
+    ends = np.concatenate((ends[:-1][long_gaps], ends[-1:]))
+
+    regions = np.stack((starts, ends), axis=1).astype(np.int64) * frame
+    # Хвост короче кадра не попал в энергию: присоединяем его к последнему участку
+    if ends[-1] == len(energy):
+        regions[-1, 1] = len(audio)
+    return SpeechRegions(audio, regions, sample_rate)
@@ -0,0 +1,370 @@
+import asyncio
+import html
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import BufferedInputFile
+
+from config import (
+    DELIVERY_CHAT_BURST,
+    DELIVERY_CHAT_RATE,
+    DELIVERY_DOCUMENT_THRESHOLD,
+    DELIVERY_GLOBAL_RATE,
+    DELIVERY_MAX_CHATS,
+    DELIVERY_MAX_RETRIES,
+    MAX_MESSAGE_LENGTH,
+    SUMMARY_EDIT_INTERVAL
+)
+from services.metrics import ERRORS
+
+
+logger = logging.getLogger(__name__)
+
+# Тег, HTML-сущность, пробельный промежуток или слово
+_HTML_ATOM = re.compile(r"<[^<>]*>|&#?\w+;|\s+|[^<&\s]+|[<&]")
+_TAG_NAME = re.compile(r"</?\s*([a-zA-Z][\w-]*)")
+_SENTENCE_END = (".", "!", "?", "…")
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate операций в секунду со всплеском до capacity."""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        # Замок создаётся в работающем цикле событий: глобальный outbound
+        # создаётся при импорте и может пережить цикл (тесты, нагрузочный тест)
+        self._lock = None
+        self._loop = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (после ответа 429 от Telegram)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+def _atoms(text: str, max_atom: int) -> list[str]:
+    atoms = []
+    for atom in _HTML_ATOM.findall(text):
+        if len(atom) <= max_atom or atom.startswith("<"):
+            atoms.append(atom)
+        else:
+            atoms.extend(atom[i:i + max_atom] for i in range(0, len(atom), max_atom))
+    return atoms
+
+
+def _track_tags(stack: list, atom: str) -> list:
+    """Стек открытых тегов после atom: [(имя, открывающий тег)]."""
+    if not atom.startswith("<") or len(atom) < 3:
+        return stack
+    match = _TAG_NAME.match(atom)
+    if match is None:
+        return stack
+    name = match.group(1).lower()
+    if atom.startswith("</"):
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i][0] == name:
+                return stack[:i] + stack[i + 1:]
+        return stack
+    return stack + [(name, atom)]
+
+
+def _closing(stack: list) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+
+def _opening(stack: list) -> str:
+    return "".join(tag for _, tag in stack)
+
+
+def _break_rank(atoms: list[str], i: int) -> int:
+    """Насколько удачно резать на пробельном атоме i: абзац > предложение > слово."""
+    if "\n" in atoms[i]:
+        return 3
+    if i > 0 and atoms[i - 1].endswith(_SENTENCE_END):
+        return 2
+    return 1
+
+
+def split_html(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """
+    Делит HTML-текст на части не длиннее limit.
+
+    Режет по абзацам, затем по предложениям, затем по словам и только в крайнем
+    случае внутри слова. Теги и сущности не разрываются: незакрытые на границе
+    теги закрываются в конце части и открываются заново в начале следующей.
+    """
+    chunks = []
+    current = []
+    start_stack = []
+    stack = []
+    size = 0
+
+    for atom in _atoms(text, max(1, limit // 4)):
+        current.append(atom)
+        stack = _track_tags(stack, atom)
+        size += len(atom)
+        if size + len(_closing(stack)) <= limit:
+            continue
+
+        # Ищем лучшую точку разреза во второй половине куска
+        best = None
+        replay = list(start_stack)
+        offset = len(_opening(start_stack))
+        stacks = []
+        for i, item in enumerate(current):
+            stacks.append((replay, offset))
+            replay = _track_tags(replay, item)
+            offset += len(item)
+        for i in range(len(current) - 1, 0, -1):
+            if not current[i].isspace():
+                continue
+            before_stack, before_size = stacks[i]
+            if before_size + len(_closing(before_stack)) > limit or before_size < limit // 2:
+                continue
+            rank = _break_rank(current, i)
+            if best is None or rank > best[0]:
+                best = (rank, i)
+            if rank == 3:
+                break
+
+        if best is not None:
+            cut, skip = best[1], 1
+        else:
+            cut, skip = len(current) - 1, 0
+        cut_stack = stacks[cut][0]
+
+        chunks.append(_opening(start_stack) + "".join(current[:cut]).rstrip() + _closing(cut_stack))
+        current = current[cut + skip:]
+        start_stack = cut_stack
+        size = len(_opening(start_stack)) + sum(len(item) for item in current)
+
+    tail = "".join(current).strip()
+    if tail:
+        chunks.append(_opening(start_stack) + tail + _closing(stack))
+    return chunks
+
+
+class OutboundSender:
+    """
+    Все исходящие сообщения бота проходят здесь.
+
+    Частота ограничена маркерными корзинами: общей для бота и отдельной для
+    каждого чата. На ответ 429 (TelegramRetryAfter) чат ставится на паузу на
+    указанное время, и запрос повторяется. Длинные тексты режутся по границам
+    предложений и слов, а очень длинные уходят одним файлом .txt.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = DELIVERY_GLOBAL_RATE,
+        chat_rate: float = DELIVERY_CHAT_RATE,
+        chat_burst: int = DELIVERY_CHAT_BURST,
+        max_retries: int = DELIVERY_MAX_RETRIES,
+        document_threshold: int = DELIVERY_DOCUMENT_THRESHOLD,
+        max_chats: int = DELIVERY_MAX_CHATS
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.document_threshold = document_threshold
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, max(1, int(global_rate)))
+        self._chats: OrderedDict[int, TokenBucket] = OrderedDict()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def call(self, chat_id: int, request, retry: bool = True):
+        """
+        Выполняет request() с учётом лимитов. Без retry ответ 429 не повторяется,
+        а пробрасывается вызывающему (пауза чата всё равно учитывается).
+        """
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self._global.acquire()
+            try:
+                return await request()
+            except TelegramRetryAfter as e:
+                ERRORS.inc(stage="telegram_retry_after")
+                bucket.pause(e.retry_after)
+                logger.warning(f"Telegram просит подождать {e.retry_after} с перед отправкой в чат {chat_id}")
+                if not retry or attempt == self.max_retries:
+                    raise
+
+    async def answer(self, message: types.Message, text: str, **kwargs) -> types.Message:
+        return await self.call(message.chat.id, lambda: message.answer(text, **kwargs))
+
+    async def edit_text(self, message: types.Message, text: str, retry: bool = True, **kwargs):
+        return await self.call(message.chat.id, lambda: message.edit_text(text, **kwargs), retry=retry)
+
+    async def send_document(
+        self,
+        message: types.Message,
+        text: str,
+        filename: str,
+        caption: str = None,
+        reply_markup=None
+    ) -> types.Message:
+        """Отправляет текст файлом в UTF-8."""
+        document = BufferedInputFile(text.encode("utf-8"), filename=filename)
+        return await self.call(
+            message.chat.id,
+            lambda: message.answer_document(document, caption=caption, reply_markup=reply_markup)
+        )
+
+    async def send_text(
+        self,
+        message: types.Message,
+        text: str,
+        header: str = "",
+        filename: str = "text.txt",
+        reply_markup=None
+    ) -> list[types.Message]:
+        """
+        Отправляет простой текст с HTML-заголовком: частями по границам
+        предложений или, если текст длиннее document_threshold, файлом .txt.
+        reply_markup прикрепляется к последнему сообщению.
+        """
+        if len(text) > self.document_threshold:
+            caption = f"{header}\nТекст длинный, отправляю файлом" if header else None
+            return [await self.send_document(message, text, filename, caption, reply_markup)]
+
+        body = html.escape(text)
+        chunks = split_html(f"{header}\n{body}" if header else body)
+        sent = []
+        for i, chunk in enumerate(chunks):
+            markup = reply_markup if i == len(chunks) - 1 else None
+            sent.append(await self.answer(message, chunk, reply_markup=markup))
+        return sent
+
+
+outbound = OutboundSender()
+
+
+class LiveMessage:
+    """
+    Сообщение, которое дописывается по мере поступления текста.
+
+    Правки идут не чаще interval секунд, чтобы не упираться в лимит Telegram
+    на редактирование. Когда текст перестаёт помещаться в MAX_MESSAGE_LENGTH,
+    текущее сообщение фиксируется и продолжение уходит новым сообщением.
+    Текст экранируется: незавершённый фрагмент не должен ломать HTML-разметку.
+    """
+
+    def __init__(
+        self,
+        message: types.Message,
+        live_msg: types.Message,
+        header: str = "",
+        interval: float = SUMMARY_EDIT_INTERVAL,
+        limit: int = MAX_MESSAGE_LENGTH
+    ):
+        self.message = message
+        self.live_msg = live_msg
+        self.header = header
+        self.interval = interval
+        self.limit = limit
+        self.text = ""
+        self._current = ""
+        self._shown = None
+        self._next_edit = 0.0
+
+    def _render(self, text: str) -> str:
+        body = html.escape(text)
+        return f"{self.header}\n{body}" if self.header else body
+
+    async def append(self, delta: str):
+        self.text += delta
+        self._current += delta
+        if time.monotonic() >= self._next_edit:
+            await self.flush()
+
+    async def flush(self, wait: bool = False):
+        """
+        Показывает накопленный текст, переходя на новые сообщения при переполнении.
+        С wait=True правка не пропускается из-за лимита, а дожидается его.
+        """
+        while len(self._render(self._current)) > self.limit:
+            budget = self.limit - len(self._render(""))
+            cut = self._cut(self._current, budget)
+            # Заполненное сообщение больше не меняется, поэтому правку нельзя пропустить
+            await self._edit(self._render(self._current[:cut].rstrip()), wait=True)
+            self._current = self._current[cut:].lstrip()
+            # Продолжение уходит новым сообщением без заголовка
+            self.header = ""
+            self.live_msg = None
+            self._shown = None
+
+        await self._edit(self._render(self._current), wait)
+
+    async def finish(self) -> str:
+        """Дописывает остаток без ожидания интервала. Возвращает весь текст."""
+        await self.flush(wait=True)
+        return self.text
+
+    @staticmethod
+    def _cut(text: str, budget: int) -> int:
+        """Позиция разреза не дальше budget экранированных символов, по возможности на пробеле."""
+        cut = len(text)
+        while cut > 0 and len(html.escape(text[:cut])) > budget:
+            cut = min(cut - 1, budget)
+        space = text.rfind(" ", 0, cut)
+        return space if space > cut // 2 else max(1, cut)
+
+    async def _edit(self, rendered: str, wait: bool = False):
+        if rendered == self._shown or not rendered.strip():
+            return
+
+        while True:
+            try:
+                if self.live_msg is None:
+                    self.live_msg = await outbound.answer(self.message, rendered)
+                else:
+                    await outbound.edit_text(self.live_msg, rendered, retry=wait)
+                self._shown = rendered
+                self._next_edit = time.monotonic() + self.interval
+                return
+            except TelegramRetryAfter as e:
+                if not wait and self.live_msg is not None:
+                    # Следующая правка всё равно принесёт весь накопленный текст
+                    self._next_edit = time.monotonic() + e.retry_after
+                    logger.debug(f"Правка сообщения отложена на {e.retry_after} с")
+                    return
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    raise
+                return
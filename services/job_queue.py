@@ -0,0 +1,534 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AsyncIterator
+
+import numpy as np
+
+from config import (
+    JOB_FINISHED_TTL,
+    JOB_QUEUE_BACKEND,
+    JOB_QUEUE_MAX_DEPTH,
+    JOB_QUEUE_PATH,
+    JOB_QUEUE_POLL_INTERVAL,
+    JOB_QUEUE_URL,
+    JOB_RESULT_TIMEOUT,
+    JOB_VISIBILITY_TIMEOUT,
+    WHISPER_MODEL_SIZE,
+    WHISPER_MODEL_SIZES
+)
+from services.transcription import TranscriptionQueueFull, choose_model_size
+
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteTranscriptionError(Exception):
+    """Воркер не смог распознать аудио."""
+
+
+class QueuedJob:
+    """Задача, полученная воркером из очереди."""
+
+    __slots__ = ("id", "kind", "language", "options", "audio")
+
+    def __init__(self, job_id: str, kind: str, language: str | None, options: dict, audio: bytes):
+        self.id = job_id
+        self.kind = kind
+        self.language = language
+        self.options = options
+        self.audio = audio
+
+    def payload(self):
+        """Аудио в виде, который принимает TranscriptionExecutor.transcribe."""
+        if self.kind == "pcm":
+            return np.frombuffer(self.audio, dtype=np.float32)
+        return self.audio
+
+
+def encode_audio(audio) -> tuple[str, bytes]:
+    """Готовит аудио к передаче через очередь: закодированные байты или PCM float32."""
+    if isinstance(audio, np.ndarray):
+        return "pcm", audio.astype(np.float32, copy=False).tobytes()
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return "encoded", bytes(audio)
+    with open(audio, "rb") as f:
+        return "encoded", f.read()
+
+
+class JobQueue:
+    """
+    Интерфейс очереди задач транскрибации между фронтендом бота и воркерами.
+
+    Фронтенд вызывает enqueue/wait_result/cancel, воркеры — dequeue/publish/complete.
+    Промежуточные сообщения (publish) передаются в on_message у wait_result
+    до итогового результата, а timeout отсчитывается от последнего сообщения.
+    """
+
+    async def enqueue(self, kind: str, audio: bytes, language: str = None, options: dict = None) -> str:
+        raise NotImplementedError
+
+    async def dequeue(self, worker_id: str, timeout: float) -> QueuedJob | None:
+        raise NotImplementedError
+
+    async def publish(self, job_id: str, message: dict):
+        raise NotImplementedError
+
+    async def complete(self, job_id: str, result: dict = None, error: str = None):
+        raise NotImplementedError
+
+    async def wait_result(self, job_id: str, timeout: float, on_message=None) -> dict:
+        raise NotImplementedError
+
+    async def cancel(self, job_id: str):
+        raise NotImplementedError
+
+    async def depth(self) -> int:
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Очередь в файле SQLite (WAL). Подходит для нескольких процессов-воркеров
+    на одном узле. Задачи, которые воркер взял и не завершил за
+    visibility_timeout, возвращаются в очередь. Завершённые задачи, результат
+    которых никто не забрал (фронтенд перезапустился), удаляются через finished_ttl.
+    """
+
+    def __init__(
+        self,
+        path: str = JOB_QUEUE_PATH,
+        poll_interval: float = JOB_QUEUE_POLL_INTERVAL,
+        visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+        finished_ttl: float = JOB_FINISHED_TTL
+    ):
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.finished_ttl = finished_ttl
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " language TEXT,"
+            " options TEXT NOT NULL,"
+            " audio BLOB,"
+            " result TEXT,"
+            " error TEXT,"
+            " worker TEXT,"
+            " created_at REAL NOT NULL,"
+            " claimed_at REAL,"
+            " finished_at REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "finished_at" not in columns:
+            # Файл очереди от прошлой версии
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN finished_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_messages ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " job_id TEXT NOT NULL,"
+            " message TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS job_messages_job ON job_messages (job_id, seq)")
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def enqueue(self, kind: str, audio: bytes, language: str = None, options: dict = None) -> str:
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO jobs (id, status, kind, language, options, audio, created_at)"
+            " VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, kind, language, json.dumps(options or {}), audio, time.time())
+        )
+        return job_id
+
+    def _purge_finished(self, now: float):
+        """Удаляет забытые результаты и сообщения старше finished_ttl (не чаще раза в finished_ttl / 10)."""
+        if now - self._last_purge < self.finished_ttl / 10:
+            return
+        self._last_purge = now
+
+        expired = now - self.finished_ttl
+        purged = self._conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (expired,)
+        ).rowcount
+        self._conn.execute(
+            "DELETE FROM job_messages WHERE created_at < ? AND job_id NOT IN"
+            " (SELECT id FROM jobs WHERE status IN ('queued', 'running'))",
+            (expired,)
+        )
+        if purged:
+            logger.info(f"Из очереди удалено {purged} завершённых задач без получателя")
+
+    def _claim(self, worker_id: str) -> QueuedJob | None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._purge_finished(now)
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', claimed_at = NULL, worker = NULL"
+                    " WHERE status = 'running' AND claimed_at < ?",
+                    (now - self.visibility_timeout,)
+                )
+                row = self._conn.execute(
+                    "SELECT id, kind, language, options, audio FROM jobs"
+                    " WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', claimed_at = ?, worker = ? WHERE id = ?",
+                        (now, worker_id, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        job_id, kind, language, options, audio = row
+        return QueuedJob(job_id, kind, language, json.loads(options), audio)
+
+    async def dequeue(self, worker_id: str, timeout: float) -> QueuedJob | None:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await asyncio.to_thread(self._claim, worker_id)
+            if job is not None or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(self.poll_interval)
+
+    async def publish(self, job_id: str, message: dict):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO job_messages (job_id, message, created_at) VALUES (?, ?, ?)",
+            (job_id, json.dumps(message), time.time())
+        )
+
+    async def complete(self, job_id: str, result: dict = None, error: str = None):
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = ?, result = ?, error = ?, audio = NULL, finished_at = ? WHERE id = ?",
+            (
+                "failed" if error else "done",
+                json.dumps(result) if result is not None else None,
+                error,
+                time.time(),
+                job_id
+            )
+        )
+
+    def _delete(self, job_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.execute("DELETE FROM job_messages WHERE job_id = ?", (job_id,))
+
+    async def wait_result(self, job_id: str, timeout: float, on_message=None) -> dict:
+        deadline = time.monotonic() + timeout
+        last_seq = 0
+        while time.monotonic() < deadline:
+            # Сообщения читаем до статуса: всё, что воркер опубликовал до complete, не потеряется
+            messages = await asyncio.to_thread(
+                self._execute,
+                "SELECT seq, message FROM job_messages WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, last_seq)
+            )
+            rows = await asyncio.to_thread(
+                self._execute, "SELECT status, result, error FROM jobs WHERE id = ?", (job_id,)
+            )
+            if messages:
+                last_seq = messages[-1][0]
+                deadline = time.monotonic() + timeout
+                if on_message is not None:
+                    for _, message in messages:
+                        on_message(json.loads(message))
+
+            if not rows:
+                raise RemoteTranscriptionError(f"Задача {job_id} пропала из очереди")
+
+            status, result, error = rows[0]
+            if status in ("done", "failed"):
+                await asyncio.to_thread(self._delete, job_id)
+                if status == "failed":
+                    raise RemoteTranscriptionError(error)
+                return json.loads(result)
+
+            await asyncio.sleep(self.poll_interval)
+
+        raise TimeoutError(f"Нет результата по задаче {job_id} за {timeout:.0f} с")
+
+    async def cancel(self, job_id: str):
+        await asyncio.to_thread(self._delete, job_id)
+
+    async def depth(self) -> int:
+        rows = await asyncio.to_thread(self._execute, "SELECT COUNT(*) FROM jobs WHERE status = 'queued'")
+        return rows[0][0]
+
+    def shutdown(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Очередь в Redis (или совместимом сервере) для воркеров на нескольких узлах.
+
+    Идентификаторы задач лежат в списке; воркер атомарно перекладывает
+    задачу в список обрабатываемых (BLMOVE), результат возвращается через
+    отдельный список, на котором фронтенд ждёт BLPOP.
+    """
+
+    def __init__(
+        self,
+        url: str = JOB_QUEUE_URL,
+        prefix: str = "voicebot",
+        visibility_timeout: float = JOB_VISIBILITY_TIMEOUT
+    ):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self.visibility_timeout = visibility_timeout
+        self._queue_key = f"{prefix}:jobs"
+        self._processing_key = f"{prefix}:processing"
+        self._prefix = prefix
+        self._last_requeue = 0.0
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self._prefix}:job:{job_id}"
+
+    def _result_key(self, job_id: str) -> str:
+        return f"{self._prefix}:result:{job_id}"
+
+    async def enqueue(self, kind: str, audio: bytes, language: str = None, options: dict = None) -> str:
+        job_id = uuid.uuid4().hex
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._job_key(job_id), mapping={
+                "kind": kind,
+                "language": language or "",
+                "options": json.dumps(options or {}),
+                "audio": audio,
+            })
+            pipe.lpush(self._queue_key, job_id)
+            await pipe.execute()
+        return job_id
+
+    async def _requeue_stale(self):
+        """Возвращает в очередь задачи воркеров, не ответивших за visibility_timeout."""
+        now = time.time()
+        if now - self._last_requeue < self.visibility_timeout / 10:
+            return
+        self._last_requeue = now
+
+        for raw_id in await self._redis.lrange(self._processing_key, 0, -1):
+            job_id = raw_id.decode()
+            job_key = self._job_key(job_id)
+            claimed_at = await self._redis.hget(job_key, "claimed_at")
+            if claimed_at is None and await self._redis.exists(job_key):
+                # Воркер только что забрал задачу (BLMOVE) и ещё не записал claimed_at:
+                # отсчитываем visibility_timeout с момента, когда задачу увидели здесь
+                await self._redis.hsetnx(job_key, "claimed_at", now)
+                continue
+            if claimed_at is None or now - float(claimed_at) > self.visibility_timeout:
+                # Задача зависла у упавшего воркера или её хэш удалён отменой
+                if await self._redis.lrem(self._processing_key, 1, job_id):
+                    await self._redis.rpush(self._queue_key, job_id)
+
+    async def dequeue(self, worker_id: str, timeout: float) -> QueuedJob | None:
+        await self._requeue_stale()
+
+        raw_id = await self._redis.blmove(self._queue_key, self._processing_key, timeout, "RIGHT", "LEFT")
+        if raw_id is None:
+            return None
+
+        job_id = raw_id.decode()
+        job_key = self._job_key(job_id)
+        await self._redis.hset(job_key, mapping={"claimed_at": time.time(), "worker": worker_id})
+        fields = await self._redis.hgetall(job_key)
+        if b"audio" not in fields:
+            # Задачу отменили, пока она ждала в очереди
+            await self._redis.lrem(self._processing_key, 1, job_id)
+            await self._redis.delete(job_key)
+            return None
+
+        return QueuedJob(
+            job_id,
+            fields[b"kind"].decode(),
+            fields[b"language"].decode() or None,
+            json.loads(fields[b"options"]),
+            fields[b"audio"]
+        )
+
+    async def publish(self, job_id: str, message: dict):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(self._result_key(job_id), json.dumps({"message": message}))
+            pipe.expire(self._result_key(job_id), int(self.visibility_timeout))
+            await pipe.execute()
+
+    async def complete(self, job_id: str, result: dict = None, error: str = None):
+        message = json.dumps({"result": result, "error": error})
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(self._result_key(job_id), message)
+            pipe.expire(self._result_key(job_id), int(self.visibility_timeout))
+            pipe.delete(self._job_key(job_id))
+            pipe.lrem(self._processing_key, 1, job_id)
+            await pipe.execute()
+
+    async def wait_result(self, job_id: str, timeout: float, on_message=None) -> dict:
+        while True:
+            item = await self._redis.blpop(self._result_key(job_id), timeout)
+            if item is None:
+                raise TimeoutError(f"Нет результата по задаче {job_id} за {timeout:.0f} с")
+
+            message = json.loads(item[1])
+            if "message" not in message:
+                break
+            if on_message is not None:
+                on_message(message["message"])
+
+        if message["error"]:
+            raise RemoteTranscriptionError(message["error"])
+        return message["result"]
+
+    async def cancel(self, job_id: str):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self._queue_key, 1, job_id)
+            pipe.delete(self._job_key(job_id), self._result_key(job_id))
+            await pipe.execute()
+
+    async def depth(self) -> int:
+        return await self._redis.llen(self._queue_key)
+
+
+def create_job_queue(backend: str = JOB_QUEUE_BACKEND) -> JobQueue:
+    if backend == "sqlite":
+        return SQLiteJobQueue()
+    if backend == "redis":
+        return RedisJobQueue()
+    raise ValueError(f"Неизвестный JOB_QUEUE_BACKEND: {backend}")
+
+
+class RemoteTranscriber:
+    """
+    Транскрибация в отдельных процессах worker.py через очередь задач.
+
+    Интерфейс совпадает с TranscriptionExecutor, поэтому обработчики не знают,
+    где работает модель. При переполнении очереди выбрасывает TranscriptionQueueFull.
+    """
+
+    device = "remote"
+    state = "в отдельных воркерах"
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        model_size: str = WHISPER_MODEL_SIZE,
+        max_depth: int = JOB_QUEUE_MAX_DEPTH,
+        result_timeout: float = JOB_RESULT_TIMEOUT
+    ):
+        self.queue = queue
+        self.model_size = model_size
+        self.max_depth = max_depth
+        self.result_timeout = result_timeout
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Задачи этого процесса, ожидающие результата от воркеров."""
+        return self._pending
+
+    def start(self):
+        """Модель загружают воркеры, фоновых задач у фронтенда нет."""
+
+    def route(self, duration: float, preference: str = None, queue_depth: int = None) -> str:
+        """Размер модели для записи; воркеры держат пул из WHISPER_MODEL_SIZES."""
+        if queue_depth is None:
+            queue_depth = self._pending
+        return choose_model_size(duration, queue_depth, preference, WHISPER_MODEL_SIZES, self.model_size)
+
+    async def transcribe(self, audio, language: str = None, model_size: str = None) -> dict:
+        return await self._submit(audio, language, {"model_size": model_size or self.model_size})
+
+    async def detect_language(self, audio, model_size: str = None) -> tuple[str, float]:
+        result = await self._submit(
+            audio, None, {"model_size": model_size or self.model_size, "task": "detect_language"}
+        )
+        return result["language"], result["probability"]
+
+    async def transcribe_long(
+        self,
+        audio,
+        language: str = None,
+        model_size: str = None,
+        on_language=None
+    ) -> AsyncIterator[str]:
+        """
+        Длинная запись одной задачей: воркер сам декодирует и режет её по паузам,
+        а тексты сегментов приходят промежуточными сообщениями по мере готовности.
+        """
+        parts = asyncio.Queue()
+        detected = []
+
+        def on_message(message: dict):
+            if message.get("language") and on_language is not None and not detected:
+                detected.append(message["language"])
+                on_language(message["language"])
+            if "text" in message:
+                parts.put_nowait(message["text"])
+
+        options = {"model_size": model_size or self.model_size, "task": "transcribe_long"}
+        waiter = asyncio.ensure_future(self._submit(audio, language, options, on_message))
+        getter = None
+        try:
+            while True:
+                getter = asyncio.ensure_future(parts.get())
+                await asyncio.wait({getter, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                    continue
+
+                getter.cancel()
+                while not parts.empty():
+                    yield parts.get_nowait()
+                on_message(waiter.result())
+                return
+        finally:
+            if getter is not None:
+                getter.cancel()
+            waiter.cancel()
+
+    async def _submit(self, audio, language: str | None, options: dict, on_message=None) -> dict:
+        if await self.queue.depth() >= self.max_depth:
+            raise TranscriptionQueueFull(f"В очереди воркеров уже {self.max_depth} задач")
+
+        kind, data = await asyncio.to_thread(encode_audio, audio)
+        job_id = await self.queue.enqueue(kind, data, language, options)
+        del data
+
+        self._pending += 1
+        try:
+            return await self.queue.wait_result(job_id, self.result_timeout, on_message)
+        except (asyncio.CancelledError, TimeoutError):
+            await self.queue.cancel(job_id)
+            raise
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        self.queue.shutdown()
@@ -0,0 +1,83 @@
+import logging
+from collections import Counter, OrderedDict, deque
+
+from config import (
+    LANGUAGE_PRIOR_CONFIDENCE,
+    LANGUAGE_PRIOR_MAX_USERS,
+    LANGUAGE_PRIOR_MIN_SAMPLES,
+    LANGUAGE_PRIOR_RECHECK_EVERY,
+    LANGUAGE_PRIOR_WINDOW
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class _UserHistory:
+    __slots__ = ("recent", "counts", "skipped")
+
+    def __init__(self, window: int):
+        self.recent: deque[str] = deque(maxlen=window)
+        self.counts: Counter = Counter()
+        self.skipped = 0
+
+
+class LanguagePrior:
+    """
+    Скользящая гистограмма языков записей каждого пользователя.
+
+    Если пользователь почти всегда говорит на одном языке, guess возвращает его
+    и модель не тратит проход энкодера на определение языка. Чтобы смена языка
+    не осталась незамеченной, каждая recheck_every-я запись всё равно идёт на
+    автоопределение. Хранится в памяти для max_users последних пользователей.
+    """
+
+    def __init__(
+        self,
+        window: int = LANGUAGE_PRIOR_WINDOW,
+        min_samples: int = LANGUAGE_PRIOR_MIN_SAMPLES,
+        confidence: float = LANGUAGE_PRIOR_CONFIDENCE,
+        recheck_every: int = LANGUAGE_PRIOR_RECHECK_EVERY,
+        max_users: int = LANGUAGE_PRIOR_MAX_USERS
+    ):
+        self.window = max(1, window)
+        self.min_samples = min(max(1, min_samples), self.window)
+        self.confidence = confidence
+        self.recheck_every = recheck_every
+        self.max_users = max_users
+        self._users: OrderedDict[int, _UserHistory] = OrderedDict()
+
+    def guess(self, user_id: int) -> str | None:
+        """Уверенно преобладающий язык пользователя или None, если язык нужно определить."""
+        history = self._users.get(user_id)
+        if history is None or len(history.recent) < self.min_samples:
+            return None
+
+        language, count = history.counts.most_common(1)[0]
+        if count / len(history.recent) < self.confidence:
+            return None
+
+        if self.recheck_every and history.skipped + 1 >= self.recheck_every:
+            history.skipped = 0
+            return None
+
+        history.skipped += 1
+        return language
+
+    def observe(self, user_id: int, language: str):
+        """Учитывает язык, определённый моделью для записи пользователя."""
+        history = self._users.get(user_id)
+        if history is None:
+            history = self._users[user_id] = _UserHistory(self.window)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+
+        if len(history.recent) == history.recent.maxlen:
+            oldest = history.recent[0]
+            history.counts[oldest] -= 1
+            if history.counts[oldest] <= 0:
+                del history.counts[oldest]
+        history.recent.append(language)
+        history.counts[language] += 1
@@ -0,0 +1,463 @@
+import asyncio
+import inspect
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import AsyncIterator
+
+import aiohttp
+
+from config import (
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_CIRCUIT_FAILURES,
+    LLM_CIRCUIT_RESET,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_PERCENTILE,
+    LLM_MAX_RETRIES,
+    LLM_OPENAI_API_KEY,
+    LLM_OPENAI_BASE_URL,
+    LLM_PROVIDERS,
+    LLM_TIMEOUT
+)
+from services.metrics import LLM_REQUESTS, LLM_TTFT_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних задержек провайдера учитывается при выборе момента дублирования
+_LATENCY_WINDOW = 200
+
+
+class LLMError(Exception):
+    """Ошибка запроса к LLM."""
+
+
+class EmptyResponseError(LLMError):
+    """Модель вернула пустой ответ."""
+
+
+class LLMUnavailableError(LLMError):
+    """Ни один провайдер не ответил."""
+
+
+class LLMBackend:
+    """Один провайдер с конкретной моделью."""
+
+    kind = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{self.model}"
+
+    async def complete(self, messages: list) -> str:
+        raise NotImplementedError
+
+    async def stream(self, messages: list) -> AsyncIterator[str]:
+        """Фрагменты ответа по мере генерации; по умолчанию — весь ответ одним куском."""
+        yield await self.complete(messages)
+
+    async def close(self):
+        pass
+
+
+class G4FBackend(LLMBackend):
+    """Бесплатные провайдеры через g4f."""
+
+    kind = "g4f"
+
+    def __init__(self, model: str):
+        super().__init__(model)
+        import g4f
+        self._g4f = g4f
+
+    async def complete(self, messages: list) -> str:
+        response = await self._g4f.ChatCompletion.create_async(
+            model=self.model,
+            messages=messages,
+            stream=False
+        )
+        return response if isinstance(response, str) else ""
+
+    async def stream(self, messages: list) -> AsyncIterator[str]:
+        from g4f.client import AsyncClient
+
+        response = AsyncClient().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True
+        )
+        if inspect.isawaitable(response):
+            response = await response
+        async for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Любой сервер с OpenAI-совместимым /chat/completions (в том числе локальная заглушка)."""
+
+    kind = "openai"
+
+    def __init__(self, model: str, base_url: str = LLM_OPENAI_BASE_URL, api_key: str = LLM_OPENAI_API_KEY):
+        super().__init__(model)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self._session = aiohttp.ClientSession(headers=headers)
+        return self._session
+
+    async def complete(self, messages: list) -> str:
+        async with self._get_session().post(
+            f"{self.base_url}/chat/completions",
+            json={"model": self.model, "messages": messages}
+        ) as response:
+            if response.status >= 400:
+                raise LLMError(f"{self.name}: HTTP {response.status}")
+            payload = await response.json()
+
+        try:
+            return payload["choices"][0]["message"]["content"] or ""
+        except (KeyError, IndexError, TypeError):
+            raise LLMError(f"{self.name}: неожиданный формат ответа")
+
+    async def stream(self, messages: list) -> AsyncIterator[str]:
+        async with self._get_session().post(
+            f"{self.base_url}/chat/completions",
+            json={"model": self.model, "messages": messages, "stream": True}
+        ) as response:
+            if response.status >= 400:
+                raise LLMError(f"{self.name}: HTTP {response.status}")
+
+            # Server-Sent Events: строки "data: {...}", конец потока — "data: [DONE]"
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                except (ValueError, KeyError, IndexError, TypeError):
+                    raise LLMError(f"{self.name}: неожиданный формат потока")
+                if delta:
+                    yield delta
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+LLM_BACKENDS = {
+    G4FBackend.kind: G4FBackend,
+    OpenAICompatibleBackend.kind: OpenAICompatibleBackend,
+}
+
+
+def create_backend(spec: str) -> LLMBackend:
+    """Создаёт бэкенд по строке "бэкенд:модель" из LLM_PROVIDERS."""
+    kind, _, model = spec.partition(":")
+    backend_cls = LLM_BACKENDS.get(kind)
+    if backend_cls is None or not model:
+        raise ValueError(f"Неверный провайдер LLM: {spec}. Формат — бэкенд:модель, бэкенды: {', '.join(LLM_BACKENDS)}")
+    return backend_cls(model)
+
+
+class CircuitBreaker:
+    """
+    Размыкается после failure_threshold ошибок подряд и не пропускает запросы
+    reset_timeout секунд. Затем пропускает один пробный запрос: успех замыкает
+    цепь, ошибка снова размыкает. Если пробный запрос отменён, release
+    разрешает следующую пробу.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_CIRCUIT_FAILURES, reset_timeout: float = LLM_CIRCUIT_RESET):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+            return False
+        self._probing = True
+        return True
+
+    def release(self):
+        """Пробный запрос завершился без результата (отменён или брошен потребителем)."""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных ответов провайдера."""
+
+    def __init__(self, window: int = _LATENCY_WINDOW):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 1) -> float | None:
+        if len(self._samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMClient:
+    """
+    Клиент LLM поверх упорядоченного списка провайдеров.
+
+    Каждый запрос ограничен таймаутом. Если ответ задерживается дольше
+    hedge_percentile обычных задержек провайдера, параллельно уходит
+    дублирующий запрос, и побеждает первый ответ. Ошибки повторяются с
+    экспоненциальной задержкой, после max_retries повторов запрос переходит
+    к следующему провайдеру. Провайдеры с разомкнутым автоматом пропускаются.
+    """
+
+    def __init__(
+        self,
+        backends: list[LLMBackend],
+        timeout: float = LLM_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY
+    ):
+        if not backends:
+            raise ValueError("Не задан ни один провайдер LLM")
+        self.backends = backends
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.breakers = {backend.name: CircuitBreaker() for backend in backends}
+        self.latencies = {backend.name: LatencyTracker() for backend in backends}
+
+    @classmethod
+    def from_config(cls, providers: list[str] = LLM_PROVIDERS) -> "LLMClient":
+        return cls([create_backend(spec) for spec in providers])
+
+    @property
+    def model_name(self) -> str:
+        """Идентификатор цепочки провайдеров (для ключей кэша)."""
+        return ",".join(backend.name for backend in self.backends)
+
+    async def complete(self, messages: list) -> str:
+        """Возвращает непустой ответ первого ответившего провайдера."""
+        last_error = None
+
+        for backend in self.backends:
+            breaker = self.breakers[backend.name]
+            for attempt in range(self.max_retries + 1):
+                # Запрос, пропущенный разомкнутым автоматом, — пробный
+                probe = breaker.is_open
+                if not breaker.allow():
+                    LLM_REQUESTS.inc(provider=backend.name, result="circuit_open")
+                    break
+
+                try:
+                    text = await self._hedged(backend, messages)
+                except asyncio.CancelledError:
+                    if probe:
+                        breaker.release()
+                    raise
+                except Exception as e:
+                    last_error = e
+                    await self._on_failure(backend, e, attempt)
+                    continue
+
+                breaker.record_success()
+                LLM_REQUESTS.inc(provider=backend.name, result="ok")
+                return text
+
+            logger.warning(f"LLM {backend.name} недоступен, переключаюсь на следующий провайдер")
+
+        raise self._unavailable(last_error)
+
+    async def stream(self, messages: list) -> AsyncIterator[str]:
+        """
+        Ответ по фрагментам. Повторы и переход к следующему провайдеру возможны,
+        пока не получен первый фрагмент; после этого ошибка прерывает поток.
+        Время до первого фрагмента пишется в лог и в voicebot_llm_ttft_seconds.
+        """
+        last_error = None
+
+        for backend in self.backends:
+            breaker = self.breakers[backend.name]
+            for attempt in range(self.max_retries + 1):
+                probe = breaker.is_open
+                if not breaker.allow():
+                    LLM_REQUESTS.inc(provider=backend.name, result="circuit_open")
+                    break
+
+                started = time.perf_counter()
+                chunks = backend.stream(messages)
+                try:
+                    first = await asyncio.wait_for(self._first_chunk(backend, chunks), self.timeout)
+                except asyncio.CancelledError:
+                    if probe:
+                        breaker.release()
+                    await chunks.aclose()
+                    raise
+                except Exception as e:
+                    await chunks.aclose()
+                    last_error = e
+                    await self._on_failure(backend, e, attempt)
+                    continue
+
+                ttft = time.perf_counter() - started
+                LLM_TTFT_SECONDS.observe(ttft, provider=backend.name)
+                logger.info(f"LLM {backend.name}: первый фрагмент ответа через {ttft:.2f} с")
+
+                try:
+                    yield first
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        yield chunk
+                except (asyncio.CancelledError, GeneratorExit):
+                    # Потребитель перестал читать поток: проба не дала результата
+                    if probe:
+                        breaker.release()
+                    raise
+                except Exception as e:
+                    breaker.record_failure()
+                    LLM_REQUESTS.inc(provider=backend.name, result="error")
+                    logger.warning(f"LLM {backend.name}: поток прервался: {type(e).__name__} {e}")
+                    raise
+                finally:
+                    await chunks.aclose()
+
+                breaker.record_success()
+                LLM_REQUESTS.inc(provider=backend.name, result="ok")
+                self.latencies[backend.name].observe(time.perf_counter() - started)
+                return
+
+            logger.warning(f"LLM {backend.name} недоступен, переключаюсь на следующий провайдер")
+
+        raise self._unavailable(last_error)
+
+    @staticmethod
+    async def _first_chunk(backend: LLMBackend, chunks) -> str:
+        async for chunk in chunks:
+            if chunk:
+                return chunk
+        raise EmptyResponseError(f"{backend.name}: пустой ответ")
+
+    async def _on_failure(self, backend: LLMBackend, error: Exception, attempt: int):
+        """Учитывает ошибку и ждёт перед повтором, если он ещё будет."""
+        breaker = self.breakers[backend.name]
+        breaker.record_failure()
+        result = "timeout" if isinstance(error, TimeoutError) else "error"
+        LLM_REQUESTS.inc(provider=backend.name, result=result)
+        logger.warning(f"LLM {backend.name}, попытка {attempt + 1}: {type(error).__name__} {error}")
+        if attempt < self.max_retries and not breaker.is_open:
+            await asyncio.sleep(self._backoff(attempt))
+
+    @staticmethod
+    def _unavailable(last_error: Exception | None) -> Exception:
+        if last_error is None:
+            return LLMUnavailableError("все провайдеры LLM временно отключены после ошибок")
+        if isinstance(last_error, LLMError):
+            return last_error
+        return LLMUnavailableError(f"все провайдеры LLM недоступны ({type(last_error).__name__} {last_error})")
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        # Разброс, чтобы повторы разных запросов не шли одной волной
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _call(self, backend: LLMBackend, messages: list) -> str:
+        started = time.perf_counter()
+        text = await asyncio.wait_for(backend.complete(messages), self.timeout)
+        if not text or not text.strip():
+            raise EmptyResponseError(f"{backend.name}: пустой ответ")
+        self.latencies[backend.name].observe(time.perf_counter() - started)
+        return text.strip()
+
+    def _hedge_delay(self, backend: LLMBackend) -> float | None:
+        if self.hedge_percentile <= 0:
+            return None
+        delay = self.latencies[backend.name].percentile(self.hedge_percentile, self.hedge_min_samples)
+        if delay is None:
+            return None
+        return max(self.hedge_min_delay, delay)
+
+    async def _hedged(self, backend: LLMBackend, messages: list) -> str:
+        """Запрос к провайдеру с дублированием, если первый ответ запаздывает."""
+        delay = self._hedge_delay(backend)
+        if delay is None or delay >= self.timeout:
+            return await self._call(backend, messages)
+
+        tasks = [asyncio.ensure_future(self._call(backend, messages))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                LLM_REQUESTS.inc(provider=backend.name, result="hedged")
+                tasks.append(asyncio.ensure_future(self._call(backend, messages)))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.close()
+
+
+_default_client = None
+
+
+def get_llm_client() -> LLMClient:
+    """Общий клиент по LLM_PROVIDERS, создаётся при первом обращении."""
+    global _default_client
+    if _default_client is None:
+        _default_client = LLMClient.from_config()
+    return _default_client
@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from services.profiling import current_trace
+
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин длительности аудио для меток гистограмм, секунды
+_DURATION_BUCKETS = ((30, "lt_30s"), (120, "30s_2m"), (600, "2m_10m"), (1800, "10m_30m"))
+
+DEFAULT_TIME_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def duration_bucket(seconds: float | None) -> str:
+    """Метка корзины для длительности аудио."""
+    if seconds is None:
+        return "unknown"
+    for limit, label in _DURATION_BUCKETS:
+        if seconds < limit:
+            return label
+    return "gt_30m"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs += [f'{name}="{_escape(value)}"' for name, value in extra.items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        super().__init__(name, description, labels)
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, func, **labels):
+        """Значение вычисляется при каждом чтении /metrics."""
+        with self._lock:
+            self._functions[self._key(labels)] = func
+
+    def _samples(self):
+        samples = super()._samples()
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                samples.append((self.name, key, func()))
+            except Exception as e:
+                logger.debug(f"Не удалось вычислить {self.name}: {e}")
+        return samples
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = DEFAULT_TIME_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.label_names, key, {"le": bound})
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.label_names, key, {"le": "+Inf"})
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "voicebot_stage_seconds",
+    "Длительность стадий обработки",
+    ("stage", "duration_bucket", "model_size")
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "voicebot_queue_depth",
+    "Задачи, ожидающие обработки",
+    ("queue",)
+))
+JOBS_INFLIGHT = REGISTRY.register(Gauge(
+    "voicebot_jobs_inflight",
+    "Задачи в обработке",
+    ("queue",)
+))
+MODEL_LOAD_SECONDS = REGISTRY.register(Gauge(
+    "voicebot_model_load_seconds",
+    "Время загрузки модели распознавания",
+    ("engine", "model_size")
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "voicebot_cache_requests_total",
+    "Обращения к кэшам",
+    ("cache", "result")
+))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    "voicebot_llm_requests_total",
+    "Запросы к провайдерам LLM",
+    ("provider", "result")
+))
+LLM_TTFT_SECONDS = REGISTRY.register(Histogram(
+    "voicebot_llm_ttft_seconds",
+    "Время до первого фрагмента потокового ответа LLM",
+    ("provider",)
+))
+AUDIO_SECONDS = REGISTRY.register(Counter(
+    "voicebot_audio_seconds_total",
+    "Длительность аудио до (original) и после (speech) вырезания тишины",
+    ("kind",)
+))
+ERRORS = REGISTRY.register(Counter(
+    "voicebot_errors_total",
+    "Ошибки обработки",
+    ("stage",)
+))
+
+
+@contextmanager
+def stage_timer(stage: str, duration: float = None, model_size: str = ""):
+    """Замеряет длительность стадии и пишет её в гистограмму voicebot_stage_seconds."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(
+            elapsed,
+            stage=stage,
+            duration_bucket=duration_bucket(duration),
+            model_size=model_size
+        )
+        trace = current_trace.get()
+        if trace is not None:
+            trace.record(stage, elapsed)
+
+
+async def start_metrics_server(host: str, port: int, registry: MetricsRegistry = REGISTRY) -> web.AppRunner:
+    """Поднимает HTTP-эндпоинт /metrics в формате Prometheus."""
+
+    async def metrics_handler(request: web.Request) -> web.Response:
+        return web.Response(
+            body=registry.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
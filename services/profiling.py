@@ -0,0 +1,290 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+from config import (
+    ADMIN_USER_IDS,
+    PROFILE_LOOP_STALL_SECONDS,
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_SLOW_JOB_SECONDS,
+    PROFILE_TOP_FUNCTIONS
+)
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+# Трасса задачи, которая сейчас выполняется в этом контексте (None — трассировка выключена)
+current_trace: ContextVar["JobTrace | None"] = ContextVar("current_trace", default=None)
+
+
+class JobTrace:
+    """
+    Трасса одной задачи: длительности стадий, остановки цикла событий и, если
+    задача профилируется, профиль кода в потоках модели и в потоке цикла
+    событий (cProfile) или сэмплы стеков этих потоков для flame graph.
+    """
+
+    # Трасса, которая сейчас профилирует поток цикла событий через cProfile:
+    # второй профилировщик в том же потоке подменил бы первый
+    _loop_profile_owner: "JobTrace | None" = None
+
+    def __init__(
+        self,
+        label: str,
+        mode: str = None,
+        chat_id: int = None,
+        sample_interval: float = PROFILE_SAMPLE_INTERVAL,
+        stall_seconds: float = PROFILE_LOOP_STALL_SECONDS
+    ):
+        self.label = label
+        self.mode = mode
+        self.chat_id = chat_id
+        self.sample_interval = sample_interval
+        self.stall_seconds = stall_seconds
+        self.started = time.perf_counter()
+        self.elapsed = None
+        # (смещение от начала задачи, стадия, длительность)
+        self.stages: list[tuple[float, str, float]] = []
+        self.stalls: list[float] = []
+        self.token = None
+        self._profiles: list[cProfile.Profile] = []
+        self._loop_profile = None
+        self._samples: Counter = Counter()
+        # id потока -> роль в свёрнутых стеках
+        self._threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    def watch_loop(self):
+        """
+        Вызывается в потоке цикла событий при старте задачи: следит за его
+        остановками и, если задача профилируется, профилирует и этот поток.
+        Профиль цикла событий включает все корутины, работавшие во время задачи.
+        """
+        if self.stall_seconds > 0:
+            self._watchdog = asyncio.get_running_loop().create_task(self._watch_stalls())
+
+        if self.mode == "cprofile" and JobTrace._loop_profile_owner is None:
+            JobTrace._loop_profile_owner = self
+            self._loop_profile = cProfile.Profile()
+            self._loop_profile.enable()
+        elif self.mode == "sampling":
+            self._watch_thread(threading.get_ident(), "event_loop")
+
+    async def _watch_stalls(self):
+        """Записывает в трассу каждую задержку пробуждения цикла событий дольше stall_seconds."""
+        interval = self.stall_seconds / 2
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lag = time.perf_counter() - expected
+            if lag >= self.stall_seconds:
+                self.stalls.append(lag)
+                self.record("event_loop_stall", lag)
+
+    def _watch_thread(self, thread_id: int, role: str):
+        with self._lock:
+            self._threads[thread_id] = role
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="job-sampler", daemon=True)
+                self._sampler.start()
+
+    def record(self, stage: str, seconds: float):
+        """Вызывается из stage_timer, в том числе из потоков-воркеров."""
+        self.stages.append((time.perf_counter() - self.started - seconds, stage, seconds))
+
+    def run_in_thread(self, func, *args):
+        """Выполняет func в текущем потоке-воркере, профилируя его, если задача профилируется."""
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return func(*args)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._profiles.append(profile)
+
+        if self.mode == "sampling":
+            thread_id = threading.get_ident()
+            self._watch_thread(thread_id, "model_thread")
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._threads.pop(thread_id, None)
+
+        return func(*args)
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                threads = list(self._threads.items())
+            frames = sys._current_frames()
+            for thread_id, role in threads:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(role)
+                self._samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> float:
+        self.elapsed = time.perf_counter() - self.started
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+        if JobTrace._loop_profile_owner is self:
+            self._loop_profile.disable()
+            JobTrace._loop_profile_owner = None
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        return self.elapsed
+
+    def stages_report(self) -> str:
+        lines = [f"{self.label}", f"Всего: {self.elapsed:.3f} с", "", "начало, с  длительность, с  стадия"]
+        for offset, stage, seconds in sorted(self.stages):
+            lines.append(f"{offset:10.3f}  {seconds:15.3f}  {stage}")
+        if self.stalls:
+            lines += [
+                "",
+                f"Остановки цикла событий дольше {self.stall_seconds:g} с: {len(self.stalls)}, "
+                f"максимум {max(self.stalls):.3f} с, всего {sum(self.stalls):.3f} с"
+            ]
+        return "\n".join(lines) + "\n"
+
+    def profile_report(self) -> tuple[str, str]:
+        """Имя файла и содержимое профиля: таблица pstats или свёрнутые стеки для flame graph."""
+        if self.mode == "sampling":
+            folded = "\n".join(f"{stack} {count}" for stack, count in self._samples.most_common())
+            return "flamegraph.folded", folded or "# Сэмплов нет\n"
+
+        stream = io.StringIO()
+        stream.write(self.stages_report() + "\n")
+        if self._profiles:
+            stats = pstats.Stats(self._profiles[0], stream=stream)
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        else:
+            stream.write("Профиль потоков модели пуст: задача не дошла до модели (например, ответ из кэша)\n")
+
+        stream.write("\nЦикл событий (все корутины за время задачи):\n")
+        if self._loop_profile is not None:
+            pstats.Stats(self._loop_profile, stream=stream).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        else:
+            stream.write("Не профилировался: его уже профилирует другая задача\n")
+        return "profile.txt", stream.getvalue()
+
+
+class JobProfiler:
+    """
+    Профилирование по команде администратора и трассы медленных задач.
+
+    arm включает cProfile или сэмплирующий профилировщик для следующих N задач,
+    профиль приходит документом в чат, где дана команда. Если задача длилась
+    дольше slow_seconds, трасса её стадий уходит всем администраторам. Когда
+    ничего не включено, start возвращает None и задача выполняется без трассы.
+    """
+
+    def __init__(
+        self,
+        admin_ids: list[int] = ADMIN_USER_IDS,
+        slow_seconds: float = PROFILE_SLOW_JOB_SECONDS,
+        sample_interval: float = PROFILE_SAMPLE_INTERVAL
+    ):
+        self.admin_ids = list(admin_ids)
+        self.slow_seconds = slow_seconds
+        self.sample_interval = sample_interval
+        self.mode = None
+        self.remaining = 0
+        self.chat_id = None
+
+    def arm(self, mode: str, jobs: int, chat_id: int):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode}")
+        self.mode = mode
+        self.remaining = max(1, jobs)
+        self.chat_id = chat_id
+
+    def disarm(self):
+        self.mode = None
+        self.remaining = 0
+        self.chat_id = None
+
+    @property
+    def status(self) -> str:
+        profile = f"{self.mode}, осталось задач: {self.remaining}" if self.remaining else "выключено"
+        slow = f"дольше {self.slow_seconds:g} с" if self.slow_seconds > 0 else "выключены"
+        return f"Профилирование: {profile}\nТрассы медленных задач: {slow}"
+
+    def start(self, label: str) -> JobTrace | None:
+        """Начинает трассу задачи в текущем контексте или возвращает None, если трассировать нечего."""
+        if self.remaining > 0:
+            trace = JobTrace(label, self.mode, self.chat_id, self.sample_interval)
+            self.remaining -= 1
+            if not self.remaining:
+                self.mode = None
+        elif self.slow_seconds > 0:
+            trace = JobTrace(label)
+        else:
+            return None
+        trace.watch_loop()
+        trace.token = current_trace.set(trace)
+        return trace
+
+    def finish(self, trace: JobTrace) -> list[tuple[int, str, str, str]]:
+        """
+        Завершает трассу. Возвращает документы к отправке:
+        (чат, имя файла, содержимое, подпись).
+        """
+        try:
+            current_trace.reset(trace.token)
+        except ValueError:
+            # Трасса завершается не в том контексте, где начиналась
+            current_trace.set(None)
+        elapsed = trace.stop()
+
+        documents = []
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if trace.mode is not None and trace.chat_id is not None:
+            filename, content = trace.profile_report()
+            documents.append((trace.chat_id, f"{stamp}-{filename}", content, f"Профиль ({trace.mode}): {trace.label}"))
+
+        if self.slow_seconds > 0 and elapsed >= self.slow_seconds:
+            logger.warning(f"Медленная задача: {trace.label}, {elapsed:.1f} с")
+            for admin_id in self.admin_ids:
+                documents.append((
+                    admin_id, f"{stamp}-slow-trace.txt", trace.stages_report(),
+                    f"Задача длилась {elapsed:.1f} с (порог {self.slow_seconds:g} с)"
+                ))
+        return documents
+
+    async def report(self, trace: JobTrace, bot: Bot):
+        """Завершает трассу и отправляет профиль и трассу медленной задачи документами."""
+        for chat_id, filename, content, caption in self.finish(trace):
+            try:
+                await bot.send_document(
+                    chat_id, BufferedInputFile(content.encode("utf-8"), filename=filename), caption=caption
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось отправить {filename} в чат {chat_id}: {e}")
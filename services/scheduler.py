@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter, deque
+
+from config import (
+    SCHEDULER_INITIAL_REALTIME_FACTOR,
+    SCHEDULER_MAX_INFLIGHT,
+    SCHEDULER_MAX_INFLIGHT_PER_USER,
+    SCHEDULER_MAX_QUEUED_PER_USER
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Вес нового наблюдения в скользящей оценке скорости обработки
+_RTF_SMOOTHING = 0.2
+
+
+class SchedulerQueueFull(Exception):
+    """У пользователя слишком много задач в очереди."""
+
+
+class _Job:
+    __slots__ = ("user_id", "duration", "seq", "granted", "started_at")
+
+    def __init__(self, user_id: int, duration: float, seq: int):
+        self.user_id = user_id
+        self.duration = duration
+        self.seq = seq
+        self.granted = False
+        self.started_at = None
+
+
+class AudioJobScheduler:
+    """
+    Планировщик аудио-задач.
+
+    Задачи ставятся в очередь отдельно для каждого пользователя, слоты выдаются
+    по кругу (round-robin), поэтому один пользователь с пачкой файлов не
+    блокирует остальных. Внутри очереди пользователя короткие записи идут первыми.
+    Параллелизм ограничен как глобально, так и на пользователя.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = SCHEDULER_MAX_INFLIGHT,
+        max_inflight_per_user: int = SCHEDULER_MAX_INFLIGHT_PER_USER,
+        max_queued_per_user: int = SCHEDULER_MAX_QUEUED_PER_USER,
+        realtime_factor: float = SCHEDULER_INITIAL_REALTIME_FACTOR
+    ):
+        self.max_inflight = max(1, max_inflight)
+        self.max_inflight_per_user = max(1, max_inflight_per_user)
+        self.max_queued_per_user = max(1, max_queued_per_user)
+        self.realtime_factor = realtime_factor
+
+        self._queues: dict[int, list] = {}
+        self._round_robin: deque[int] = deque()
+        self._inflight_per_user: Counter = Counter()
+        self._inflight: set[_Job] = set()
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+
+    @property
+    def queued(self) -> int:
+        """Количество задач, ожидающих слота."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def inflight(self) -> int:
+        """Количество выполняемых задач."""
+        return len(self._inflight)
+
+    async def run(self, user_id: int, duration: float, job_factory, on_wait=None):
+        """
+        Ставит задачу в очередь, дожидается слота и выполняет job_factory().
+
+        on_wait(position, eta_seconds) вызывается при каждом изменении позиции
+        задачи в очереди, пока она ждёт слота.
+        """
+        job = self._enqueue(user_id, duration)
+
+        try:
+            last_position = None
+            while not job.granted:
+                changed = self._changed
+                position, eta = self._estimate(job)
+                if on_wait and position != last_position:
+                    last_position = position
+                    try:
+                        await on_wait(position, eta)
+                    except Exception as e:
+                        logger.debug(f"Не удалось обновить позицию в очереди для {user_id}: {e}")
+                if not job.granted:
+                    await changed.wait()
+        except asyncio.CancelledError:
+            if job.granted:
+                self._release(job)
+            else:
+                self._discard(job)
+            raise
+
+        try:
+            return await job_factory()
+        finally:
+            self._release(job)
+
+    def _enqueue(self, user_id: int, duration: float) -> _Job:
+        queue = self._queues.setdefault(user_id, [])
+        if len(queue) >= self.max_queued_per_user:
+            raise SchedulerQueueFull(f"У пользователя {user_id} уже {len(queue)} задач в очереди")
+
+        job = _Job(user_id, max(0.0, duration or 0.0), next(self._seq))
+        heapq.heappush(queue, (job.duration, job.seq, job))
+        if user_id not in self._round_robin:
+            self._round_robin.append(user_id)
+
+        logger.info(f"Задача пользователя {user_id} ({job.duration:.0f} с) поставлена в очередь")
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        """Выдаёт свободные слоты задачам по кругу между пользователями."""
+        while len(self._inflight) < self.max_inflight and self._round_robin:
+            for _ in range(len(self._round_robin)):
+                user_id = self._round_robin[0]
+                self._round_robin.rotate(-1)
+                if self._inflight_per_user[user_id] < self.max_inflight_per_user:
+                    break
+            else:
+                break
+
+            queue = self._queues[user_id]
+            _, _, job = heapq.heappop(queue)
+            if not queue:
+                del self._queues[user_id]
+                self._round_robin.remove(user_id)
+
+            job.granted = True
+            job.started_at = time.monotonic()
+            self._inflight.add(job)
+            self._inflight_per_user[user_id] += 1
+
+        self._signal()
+
+    def _release(self, job: _Job):
+        if job not in self._inflight:
+            return
+
+        self._inflight.discard(job)
+        self._inflight_per_user[job.user_id] -= 1
+        if self._inflight_per_user[job.user_id] <= 0:
+            del self._inflight_per_user[job.user_id]
+
+        elapsed = time.monotonic() - job.started_at
+        if job.duration > 0:
+            observed = elapsed / job.duration
+            self.realtime_factor += _RTF_SMOOTHING * (observed - self.realtime_factor)
+
+        self._dispatch()
+
+    def _discard(self, job: _Job):
+        queue = self._queues.get(job.user_id)
+        if not queue:
+            return
+
+        queue[:] = [item for item in queue if item[2] is not job]
+        heapq.heapify(queue)
+        if not queue:
+            del self._queues[job.user_id]
+            self._round_robin.remove(job.user_id)
+
+        self._signal()
+
+    def _signal(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _waiting_order(self) -> list[_Job]:
+        """Ожидаемый порядок выдачи слотов ожидающим задачам."""
+        queues = [sorted(self._queues[user_id]) for user_id in self._round_robin]
+        order = []
+        depth = 0
+        while queues:
+            queues = [queue for queue in queues if len(queue) > depth]
+            order.extend(queue[depth][2] for queue in queues)
+            depth += 1
+        return order
+
+    def _estimate(self, job: _Job) -> tuple[int, float]:
+        """Возвращает позицию задачи в очереди и оценку ожидания в секундах."""
+        now = time.monotonic()
+        backlog = sum(
+            max(0.0, j.duration * self.realtime_factor - (now - j.started_at))
+            for j in self._inflight
+        )
+
+        position = 0
+        for position, waiting in enumerate(self._waiting_order(), start=1):
+            if waiting is job:
+                break
+            backlog += waiting.duration * self.realtime_factor
+
+        return position, backlog / self.max_inflight
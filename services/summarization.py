@@ -1,31 +1,328 @@
-import g4f
-from config import SUMMARY_STYLES
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncIterator
 
+from config import (
+    SUMMARY_CACHE_MAX_ENTRIES,
+    SUMMARY_CACHE_TTL,
+    SUMMARY_CHARS_PER_TOKEN,
+    SUMMARY_CHUNK_TOKENS,
+    SUMMARY_MAP_CONCURRENCY,
+    SUMMARY_MAP_PROMPT,
+    SUMMARY_STYLES
+)
+from services.llm_client import EmptyResponseError, LLMClient, get_llm_client
+from services.metrics import CACHE_REQUESTS
 
-async def generate_summary(text: str, style_key: str) -> str:
-    # Получаем стиль по ключу или используем "default"
-    style = SUMMARY_STYLES.get(style_key, SUMMARY_STYLES["default"])
-    system_prompt = style["prompt"]
 
-    # Формируем диалог для модели
+logger = logging.getLogger(__name__)
+
+# Граница предложения: знак конца предложения и пробел или перевод строки
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+class SummaryCache:
+    """
+    Кэш готовых резюме в памяти с TTL и LRU-вытеснением.
+
+    Одновременные одинаковые запросы объединяются: к модели уходит один вызов,
+    остальные ждут его результат. Это касается и потоковой генерации
+    (stream_or_create). Ошибки не кэшируются.
+    """
+
+    def __init__(self, max_entries: int = SUMMARY_CACHE_MAX_ENTRIES, ttl: float = SUMMARY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def make_key(text: str, prompt: str, model_name: str) -> str:
+        normalized = " ".join(text.split())
+        payload = "\0".join((model_name, prompt, normalized))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, summary = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return summary
+
+    def put(self, key: str, summary: str):
+        self._entries[key] = (time.monotonic() + self.ttl, summary)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _lookup(self, key: str) -> str | None:
+        """Резюме из кэша или из уже идущего запроса; None — запрос нужно выполнить самому."""
+        while True:
+            summary = self.get(key)
+            if summary is not None:
+                self.hits += 1
+                CACHE_REQUESTS.inc(cache="summary", result="hit")
+                return summary
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                return None
+
+            try:
+                summary = await asyncio.shield(pending)
+                self.hits += 1
+                CACHE_REQUESTS.inc(cache="summary", result="coalesced")
+                return summary
+            except asyncio.CancelledError:
+                # Отменили запрос-лидер, а не нас: пробуем снова
+                if not pending.cancelled():
+                    raise
+
+    def _lead(self, key: str) -> asyncio.Future:
+        """Регистрирует вызывающего лидером запроса: остальные будут ждать его future."""
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache="summary", result="miss")
+        future = asyncio.get_running_loop().create_future()
+        # Ошибку лидера может никто не ждать; помечаем её как полученную
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return future
+
+    async def get_or_create(self, key: str, factory) -> str:
+        """Возвращает резюме из кэша, из уже идущего запроса или вызывает factory()."""
+        summary = await self._lookup(key)
+        if summary is not None:
+            return summary
+
+        future = self._lead(key)
+        try:
+            summary = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        finally:
+            del self._inflight[key]
+
+        self.put(key, summary)
+        future.set_result(summary)
+        return summary
+
+    async def stream_or_create(self, key: str, factory) -> AsyncIterator[str]:
+        """
+        Как get_or_create для потоковой генерации: лидер выдаёт фрагменты
+        factory() по мере генерации, остальные получают готовое резюме целиком.
+        """
+        summary = await self._lookup(key)
+        if summary is not None:
+            yield summary
+            return
+
+        future = self._lead(key)
+        parts = []
+        try:
+            async with aclosing(factory()) as deltas:
+                async for delta in deltas:
+                    parts.append(delta)
+                    yield delta
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        except BaseException:
+            # Отмена или вызывающий перестал читать поток
+            future.cancel()
+            raise
+        finally:
+            del self._inflight[key]
+
+        summary = "".join(parts).strip()
+        if summary:
+            self.put(key, summary)
+        future.set_result(summary)
+
+
+summary_cache = SummaryCache()
+
+
+def estimate_tokens(text: str, chars_per_token: float = SUMMARY_CHARS_PER_TOKEN) -> int:
+    """Грубая оценка числа токенов без токенизатора модели."""
+    return int(len(text) / chars_per_token) + 1
+
+
+def split_into_chunks(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS) -> list[str]:
+    """
+    Делит текст на части не больше max_tokens по границам предложений.
+    Предложение длиннее бюджета режется по словам.
+    """
+    max_chars = max(1, int(max_tokens * SUMMARY_CHARS_PER_TOKEN))
+    pieces = []
+    for sentence in _SENTENCE_BOUNDARY.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+
+        current = []
+        size = 0
+        for word in sentence.split():
+            if current and size + 1 + len(word) > max_chars:
+                pieces.append(" ".join(current))
+                current, size = [], 0
+            current.append(word)
+            size += len(word) + (1 if size else 0)
+        if current:
+            pieces.append(" ".join(current))
+
+    chunks = []
+    current = []
+    size = 0
+    for piece in pieces:
+        if current and size + 1 + len(piece) > max_chars:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + (1 if size else 0)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+async def _summarize(text: str, system_prompt: str, cache: SummaryCache, client: LLMClient) -> str:
+    """Один запрос к модели с кэшем и объединением одинаковых запросов."""
     conversation = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": text}
     ]
+    key = SummaryCache.make_key(text, system_prompt, client.model_name)
+    return await cache.get_or_create(key, lambda: client.complete(conversation))
+
+
+async def _fold(
+    text: str,
+    cache: SummaryCache,
+    client: LLMClient,
+    max_tokens: int = SUMMARY_CHUNK_TOKENS,
+    concurrency: int = SUMMARY_MAP_CONCURRENCY
+) -> str:
+    """
+    Сворачивает текст, пока он не поместится в бюджет: части резюмируются
+    параллельно и склеиваются. Если частичные резюме вместе снова не
+    помещаются, они сворачиваются ещё раз.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def summarize_chunk(chunk: str) -> str:
+        async with semaphore:
+            return await _summarize(chunk, SUMMARY_MAP_PROMPT, cache, client)
+
+    while estimate_tokens(text) > max_tokens:
+        chunks = split_into_chunks(text, max_tokens)
+        logger.info(f"Текст на ~{estimate_tokens(text)} токенов разбит на {len(chunks)} частей для резюме")
+        partials = await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
+        reduced = "\n\n".join(partials)
+        if len(reduced) >= len(text):
+            # Частичные резюме не короче исходника: дальше сворачивать бессмысленно
+            break
+        text = reduced
+
+    return text
+
+
+async def _map_reduce(text: str, system_prompt: str, cache: SummaryCache, client: LLMClient) -> str:
+    """Иерархическое резюме: свёртка по частям, затем итог в выбранном стиле."""
+    folded = await _fold(text, cache, client)
+    return await _summarize(folded, system_prompt, cache, client)
+
+
+async def generate_summary(
+    text: str,
+    style_key: str,
+    cache: SummaryCache = summary_cache,
+    client: LLMClient = None
+) -> str:
+    client = client or get_llm_client()
+
+    # Получаем стиль по ключу или используем "default"
+    style = SUMMARY_STYLES.get(style_key, SUMMARY_STYLES["default"])
+    system_prompt = style["prompt"]
 
     try:
-        # Запрашиваем ответ от модели
-        raw_response = await g4f.ChatCompletion.create_async(
-            model  = g4f.models.gpt_4o_mini,
-            messages = conversation,
-            stream = False
-        )
-
-        # Проверяем ответ
-        if raw_response and isinstance(raw_response, str) and raw_response.strip():
-            return raw_response.strip()
-        else:
-            return "Ошибка: пустой ответ"
+        if estimate_tokens(text) <= SUMMARY_CHUNK_TOKENS:
+            # Запрашиваем ответ от модели (или берём из кэша)
+            return await _summarize(text, system_prompt, cache, client)
+
+        # Длинный текст не помещается в контекст модели: резюмируем по частям
+        key = SummaryCache.make_key(text, system_prompt, client.model_name)
+        return await cache.get_or_create(key, lambda: _map_reduce(text, system_prompt, cache, client))
+
+    except EmptyResponseError:
+        return "Ошибка: пустой ответ"
+
+    except Exception as error:
+        logger.error(f"Не удалось получить резюме: {type(error).__name__} {error}")
+        return f"Не удалось получить ответ: {str(error)}"
+
+
+async def stream_summary(
+    text: str,
+    style_key: str,
+    cache: SummaryCache = summary_cache,
+    client: LLMClient = None
+) -> AsyncIterator[str]:
+    """
+    То же, что generate_summary, но выдаёт резюме фрагментами по мере генерации.
+
+    Готовое резюме из кэша выдаётся целиком, как и резюме того же текста,
+    которое уже генерируется для другого пользователя: к модели уходит один
+    потоковый запрос. Для длинных текстов части
+    сворачиваются как обычно, потоком идёт только итоговый шаг. Ошибка до
+    первого фрагмента выдаётся текстом, как в generate_summary.
+    """
+    client = client or get_llm_client()
+
+    style = SUMMARY_STYLES.get(style_key, SUMMARY_STYLES["default"])
+    system_prompt = style["prompt"]
+    key = SummaryCache.make_key(text, system_prompt, client.model_name)
+
+    async def generate():
+        folded = await _fold(text, cache, client)
+        conversation = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": folded}
+        ]
+        async for delta in client.stream(conversation):
+            yield delta
+
+    parts = []
+    try:
+        async with aclosing(cache.stream_or_create(key, generate)) as deltas:
+            async for delta in deltas:
+                parts.append(delta)
+                yield delta
+
+    except EmptyResponseError:
+        yield "Ошибка: пустой ответ"
+        return
 
     except Exception as error:
-        return f"Не удалось получить ответ: {str(error)}"
\ No newline at end of file
+        logger.error(f"Не удалось получить резюме: {type(error).__name__} {error}")
+        if not parts:
+            yield f"Не удалось получить ответ: {str(error)}"
+        return
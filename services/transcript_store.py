@@ -0,0 +1,37 @@
+import time
+import uuid
+from collections import OrderedDict
+
+from config import TRANSCRIPT_STORE_MAX_ENTRIES, TRANSCRIPT_STORE_TTL
+
+
+class TranscriptStore:
+    """
+    Транскрибации, по которым резюме можно запросить позже кнопкой.
+
+    Токен записи помещается в callback_data кнопки. Хранилище ограничено по
+    числу записей (вытесняются самые старые) и по времени жизни.
+    """
+
+    def __init__(self, max_entries: int = TRANSCRIPT_STORE_MAX_ENTRIES, ttl: float = TRANSCRIPT_STORE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def put(self, transcription: str) -> str:
+        token = uuid.uuid4().hex[:16]
+        self._entries[token] = (time.monotonic() + self.ttl, transcription)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> str | None:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+
+        expires_at, transcription = entry
+        if expires_at < time.monotonic():
+            del self._entries[token]
+            return None
+        return transcription
@@ -1,37 +1,984 @@
-import torch
-import whisper
+import asyncio
+import contextvars
+import gc
+import hashlib
+import logging
+import sqlite3
+import sys
+import threading
+import time
 import warnings
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
 
-from config import WHISPER_MODEL_SIZE
+import numpy as np
+
+from config import (
+    ASR_COMPUTE_TYPE,
+    ASR_CPU_THREADS,
+    ASR_ENGINE,
+    ASR_NUM_WORKERS,
+    BATCH_MAX_SIZE,
+    BATCH_WINDOW_MS,
+    LONG_AUDIO_PARALLEL_SEGMENTS,
+    LONG_AUDIO_SEGMENT_SECONDS,
+    MODEL_DOWNGRADE_QUEUE_DEPTH,
+    MODEL_IDLE_TIMEOUT,
+    MODEL_MEMORY_BUDGET_MB,
+    MODEL_ROUTE_LONG_SECONDS,
+    MODEL_ROUTE_LONG_SIZE,
+    MODEL_ROUTE_SHORT_SECONDS,
+    MODEL_ROUTE_SHORT_SIZE,
+    MODEL_WARMUP,
+    SILENCE_MIN_SECONDS,
+    SILENCE_NOISE_FACTOR,
+    SILENCE_PADDING_SECONDS,
+    SILENCE_THRESHOLD_DB,
+    SILENCE_TRIM,
+    TRANSCRIPTION_CACHE_MAX_BYTES,
+    TRANSCRIPTION_CACHE_MAX_ENTRIES,
+    TRANSCRIPTION_CACHE_PATH,
+    TRANSCRIPTION_QUEUE_SIZE,
+    TRANSCRIPTION_WORKERS,
+    WHISPER_MODEL_SIZE,
+    WHISPER_MODEL_SIZES
+)
+from services.audio import (
+    SAMPLE_RATE,
+    SpeechRegions,
+    decode_audio_bytes,
+    decode_audio_file,
+    split_on_silence,
+    trim_silence
+)
+from services.metrics import AUDIO_SECONDS, CACHE_REQUESTS, MODEL_LOAD_SECONDS, stage_timer
+from services.profiling import current_trace
 
 warnings.filterwarnings("ignore", message="FP16 is not supported on CPU; using FP32 instead")
 
+logger = logging.getLogger(__name__)
+
+# Окно Whisper: по нему определяется язык, короткие клипы дополняются до него тишиной
+WHISPER_WINDOW_SECONDS = 30
+# Клипы длиннее в батч не попадают
+_BATCH_MAX_CLIP_SECONDS = WHISPER_WINDOW_SECONDS
+
+# Состояния модели в пуле транскрибации
+MODEL_STATE_NOT_LOADED = "не загружена"
+MODEL_STATE_LOADING = "загружается"
+MODEL_STATE_READY = "готова"
+MODEL_STATE_UNLOADED = "выгружена после простоя"
+
+# Примерный объём памяти одного экземпляра модели в FP32, МБ
+MODEL_MEMORY_MB = {
+    "tiny": 150,
+    "base": 300,
+    "small": 1000,
+    "medium": 3000,
+    "large": 6000,
+}
+
 
-def load_whisper_model():
-    """Загружает Whisper-модель в зависимости от доступности CUDA."""
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    
-    print(f"Whisper model loading on: {device}")
-    model = whisper.load_model(WHISPER_MODEL_SIZE, device=device)
-    print("Whisper model loaded.")
-    
-    return model, device
+def model_memory_mb(model_size: str) -> int:
+    """Примерный объём памяти одного экземпляра модели ("large-v3" считается как "large")."""
+    return MODEL_MEMORY_MB.get(model_size.split(".")[0].split("-")[0], 1000)
 
 
-async def transcribe_audio(model, file_path: str, language: str = None) -> str:
-    """Транскрибирует аудиофайл в текст. Автоматически определяет язык, если указано 'auto'."""
+class TranscriptionQueueFull(Exception):
+    """Очередь транскрибации переполнена, новые задачи временно не принимаются."""
+
+
+def detect_device() -> str:
+    """Возвращает "cuda", если доступна видеокарта, иначе "cpu"."""
     try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        pass
+
+    try:
+        import ctranslate2
+        return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    except ImportError:
+        return "cpu"
+
+
+class ASREngine:
+    """
+    Интерфейс движка распознавания речи.
+
+    transcribe принимает путь к файлу или PCM-массив 16 кГц и возвращает словарь
+    с ключами text, language и segments (список словарей start/end/text).
+    """
+
+    name = "base"
+    # Можно ли вызывать один экземпляр из нескольких потоков одновременно
+    thread_safe = False
+    # Декодирует ли transcribe_batch клипы одним проходом модели; без этого
+    # микробатчинг только выстраивает клипы в очередь на одном потоке
+    supports_batching = False
+
+    def __init__(self, model_size: str, device: str):
+        self.model_size = model_size
+        self.device = device
+
+    def transcribe(self, audio, language: str = None) -> dict:
+        raise NotImplementedError
+
+    def transcribe_batch(self, audios: list, language: str = None) -> list[dict]:
+        """Распознаёт несколько коротких клипов; по умолчанию — по одному."""
+        return [self.transcribe(audio, language) for audio in audios]
+
+    def detect_language(self, audio: np.ndarray) -> tuple[str, float]:
+        """Определяет язык по первому окну в 30 с. Возвращает код языка и уверенность."""
+        raise NotImplementedError
+
+
+class WhisperEngine(ASREngine):
+    """openai-whisper на PyTorch."""
+
+    name = "whisper"
+    supports_batching = True
+
+    def __init__(self, model_size: str, device: str):
+        super().__init__(model_size, device)
+        import whisper
+        self.model = whisper.load_model(model_size, device=device)
+
+    def transcribe(self, audio, language: str = None) -> dict:
         transcription_params = {
-            "audio": file_path,
-            "fp16": False if model.device == "cpu" else True
+            "audio": audio,
+            "fp16": False if self.device == "cpu" else True
         }
 
         if language not in (None, "auto"):
             transcription_params["language"] = language
 
-        result = model.transcribe(**transcription_params)
+        result = self.model.transcribe(**transcription_params)
+        return {
+            "text": result["text"],
+            "language": result.get("language"),
+            "segments": [
+                {"start": seg["start"], "end": seg["end"], "text": seg["text"]}
+                for seg in result.get("segments", [])
+            ]
+        }
 
-        return result["text"].strip()
+    def transcribe_batch(self, audios: list, language: str = None) -> list[dict]:
+        """
+        Один батчевый проход энкодера/декодера по клипам не длиннее 30 с.
+
+        Каждый клип дополняется тишиной до окна Whisper в 30 с, мел-спектрограммы
+        складываются в один тензор и декодируются за один вызов whisper.decode.
+        """
+        import torch
+        import whisper
+
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=self.model.dims.n_mels)
+            for audio in audios
+        ]).to(self.model.device)
+        options = whisper.DecodingOptions(
+            language=None if language in (None, "auto") else language,
+            fp16=False if self.device == "cpu" else True,
+            without_timestamps=True
+        )
+        results = whisper.decode(self.model, mels, options)
+
+        return [
+            {
+                "text": result.text,
+                "language": result.language,
+                "segments": [{"start": 0.0, "end": len(audio) / SAMPLE_RATE, "text": result.text}]
+            }
+            for audio, result in zip(audios, results)
+        ]
+
+    def detect_language(self, audio: np.ndarray) -> tuple[str, float]:
+        """Один проход энкодера по первому окну вместо полного распознавания."""
+        import whisper
+
+        mel = whisper.log_mel_spectrogram(
+            whisper.pad_or_trim(audio), n_mels=self.model.dims.n_mels
+        ).to(self.model.device)
+        _, probs = self.model.detect_language(mel)
+        language = max(probs, key=probs.get)
+        return language, probs[language]
+
+
+class FasterWhisperEngine(ASREngine):
+    """faster-whisper (CTranslate2) с квантованием весов."""
+
+    name = "faster-whisper"
+    thread_safe = True
+
+    def __init__(
+        self,
+        model_size: str,
+        device: str,
+        compute_type: str = ASR_COMPUTE_TYPE,
+        cpu_threads: int = ASR_CPU_THREADS,
+        num_workers: int = ASR_NUM_WORKERS
+    ):
+        super().__init__(model_size, device)
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(
+            model_size,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=num_workers
+        )
+
+    def transcribe(self, audio, language: str = None) -> dict:
+        segments, info = self.model.transcribe(
+            audio,
+            language=None if language in (None, "auto") else language
+        )
+        # segments — ленивый генератор, распознавание идёт при итерации
+        segments = [
+            {"start": seg.start, "end": seg.end, "text": seg.text}
+            for seg in segments
+        ]
+        return {
+            "text": "".join(seg["text"] for seg in segments),
+            "language": info.language,
+            "segments": segments
+        }
+
+    def detect_language(self, audio: np.ndarray) -> tuple[str, float]:
+        # Язык определяется сразу при вызове transcribe, сегменты не итерируем
+        _, info = self.model.transcribe(audio[:WHISPER_WINDOW_SECONDS * SAMPLE_RATE], beam_size=1)
+        return info.language, info.language_probability
+
+
+ASR_ENGINES = {
+    WhisperEngine.name: WhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+}
+
+
+def load_whisper_model(model_size: str = WHISPER_MODEL_SIZE):
+    """Загружает движок распознавания (ASR_ENGINE) в зависимости от доступности CUDA."""
+    device = detect_device()
+    engine_cls = ASR_ENGINES.get(ASR_ENGINE)
+    if engine_cls is None:
+        raise ValueError(f"Неизвестный ASR_ENGINE: {ASR_ENGINE}. Доступны: {', '.join(ASR_ENGINES)}")
+
+    print(f"ASR engine {engine_cls.name} ({model_size}) loading on: {device}")
+    started = time.perf_counter()
+    engine = engine_cls(model_size, device)
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - started, engine=engine_cls.name, model_size=model_size)
+    print("ASR engine loaded.")
+
+    return engine, device
+
+
+def _transcribe_sync(engine: ASREngine, audio, language: str = None) -> dict:
+    """
+    Синхронный вызов движка. Выполняется только в потоке-воркере.
+
+    audio — путь к файлу, байты закодированного аудио или готовый PCM-массив.
+    """
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        with stage_timer("decode", model_size=engine.model_size):
+            audio = decode_audio_bytes(bytes(audio))
+
+    duration = len(audio) / SAMPLE_RATE if isinstance(audio, np.ndarray) else None
+    with stage_timer("inference", duration, engine.model_size):
+        return engine.transcribe(audio, language)
+
+
+def _trim_silence_sync(audio: np.ndarray) -> SpeechRegions:
+    with stage_timer("silence_trim", len(audio) / SAMPLE_RATE):
+        return trim_silence(
+            audio,
+            threshold_db=SILENCE_THRESHOLD_DB,
+            noise_factor=SILENCE_NOISE_FACTOR,
+            min_silence_seconds=SILENCE_MIN_SECONDS,
+            padding_seconds=SILENCE_PADDING_SECONDS
+        )
+
+
+def _detect_language_sync(engine: ASREngine, audio: np.ndarray) -> tuple[str, float]:
+    with stage_timer("language_detection", len(audio) / SAMPLE_RATE, engine.model_size):
+        return engine.detect_language(audio[:WHISPER_WINDOW_SECONDS * SAMPLE_RATE])
+
+
+def _transcribe_batch_sync(engine: ASREngine, audios: list, language: str = None) -> list[dict]:
+    longest = max(len(audio) for audio in audios) / SAMPLE_RATE
+    with stage_timer("inference_batch", longest, engine.model_size):
+        return engine.transcribe_batch(audios, language)
+
+
+class MicroBatcher:
+    """
+    Собирает короткие клипы в батчи перед отправкой в пул транскрибации.
+
+    Клипы копятся до window_ms миллисекунд или до max_batch штук (отдельно для
+    каждого языка), затем уходят в воркер одним вызовом transcribe_batch.
+    Результаты раздаются ожидающим вызывающим.
+    """
+
+    def __init__(self, executor: "TranscriptionExecutor", window_ms: int = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX_SIZE):
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: dict[str, list] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._running: set[asyncio.Task] = set()
+
+    async def submit(self, audio: np.ndarray, language: str = None) -> dict:
+        language = None if language in (None, "auto") else language
+        future = asyncio.get_running_loop().create_future()
+
+        batch = self._pending.setdefault(language, [])
+        batch.append((audio, future))
+        if len(batch) >= self.max_batch:
+            self._flush(language)
+        elif len(batch) == 1:
+            self._timers[language] = asyncio.get_running_loop().call_later(self.window, self._flush, language)
+
+        return await future
+
+    def _flush(self, language: str):
+        timer = self._timers.pop(language, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(language, None)
+        if batch:
+            # Батч общий для нескольких задач: в пустом контексте его инференс
+            # не попадает в трассу (current_trace) задачи, открывшей батч
+            task = asyncio.get_running_loop().create_task(
+                self._run_batch(batch, language), context=contextvars.Context()
+            )
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: list, language: str):
+        try:
+            # Клипы батча уже приняты в очередь по отдельности в transcribe
+            results = await self.executor.execute(_transcribe_batch_sync, [audio for audio, _ in batch], language)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logger.debug(f"Батч из {len(batch)} клипов распознан")
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class TranscriptionExecutor:
+    """
+    Пул потоков для транскрибации, чтобы инференс не блокировал event loop.
+
+    Каждый поток загружает собственный экземпляр модели при первой задаче, поэтому
+    воркеры не делят между собой состояние модели. Неудачная загрузка не ломает
+    пул: ошибку получает задача, следующая задача загружает модель заново. Потокобезопасные движки
+    (faster-whisper) загружаются один раз и используются всеми потоками.
+    Очередь ограничена: при переполнении run выбрасывает TranscriptionQueueFull.
+
+    После idle_timeout секунд без задач пул вместе с моделями освобождается
+    и создаётся заново при следующей задаче.
+    """
+
+    def __init__(
+        self,
+        workers: int = TRANSCRIPTION_WORKERS,
+        queue_size: int = TRANSCRIPTION_QUEUE_SIZE,
+        idle_timeout: float = MODEL_IDLE_TIMEOUT,
+        model_size: str = WHISPER_MODEL_SIZE
+    ):
+        # Устройство известно после загрузки модели: не импортируем torch при старте
+        self.device = None
+        self.model_size = model_size
+        self.workers = max(1, workers)
+        self.idle_timeout = idle_timeout
+        self.state = MODEL_STATE_NOT_LOADED
+        self._capacity = self.workers + max(0, queue_size)
+        self._pending = 0
+        self._last_used = time.monotonic()
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._shared_engine = None
+        self._ready_workers = 0
+        engine_cls = ASR_ENGINES.get(ASR_ENGINE)
+        batching = BATCH_MAX_SIZE > 1 and engine_cls is not None and engine_cls.supports_batching
+        self._batcher = MicroBatcher(self) if batching else None
+        self._decode_slots = asyncio.Semaphore(self.workers)
+        self._pool = None
+        self._background = set()
+
+    @property
+    def pending(self) -> int:
+        """Количество задач в работе и в очереди."""
+        return self._pending
+
+    @property
+    def loaded(self) -> bool:
+        """Держит ли пул потоки с моделями в памяти."""
+        return self._pool is not None
+
+    def memory_mb(self) -> int:
+        """Оценка памяти, занятой моделями пула."""
+        if not self.loaded:
+            return 0
+        copies = 1 if self._shared_engine is not None else self.workers
+        return model_memory_mb(self.model_size) * copies
+
+    def expected_memory_mb(self) -> int:
+        """Оценка памяти пула после загрузки: по копии модели на поток, если движок не потокобезопасный."""
+        engine_cls = ASR_ENGINES.get(ASR_ENGINE)
+        copies = 1 if engine_cls is not None and engine_cls.thread_safe else self.workers
+        return model_memory_mb(self.model_size) * copies
+
+    def _engine(self) -> ASREngine:
+        """
+        Модель текущего потока-воркера; загружается при первой задаче потока.
+        Если загрузка не удалась, задача получает исходную ошибку, а следующая
+        задача пробует загрузить модель заново.
+        """
+        engine = getattr(self._local, "model", None)
+        if engine is not None:
+            return engine
+
+        with self._init_lock:
+            engine = self._shared_engine
+            if engine is None:
+                self.state = MODEL_STATE_LOADING
+                try:
+                    engine, self.device = load_whisper_model(self.model_size)
+                except Exception:
+                    self.state = MODEL_STATE_READY if self._ready_workers else MODEL_STATE_NOT_LOADED
+                    raise
+                if engine.thread_safe:
+                    self._shared_engine = engine
+            self._ready_workers += 1
+            self.state = MODEL_STATE_READY
+        self._local.model = engine
+        logger.info(f"Воркер {threading.current_thread().name} готов")
+        return engine
+
+    def _call(self, func, args):
+        return func(self._engine(), *args)
+
+    def _ensure_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="whisper-worker"
+            )
+        return self._pool
 
+    def _admit(self):
+        """Принимает задачу в очередь или выбрасывает TranscriptionQueueFull."""
+        if self._pending >= self._capacity:
+            raise TranscriptionQueueFull(f"В очереди уже {self._pending} задач")
+        self._pending += 1
+
+    def _done(self):
+        self._pending -= 1
+        self._last_used = time.monotonic()
+
+    async def run(self, func, *args):
+        """Выполняет func(model, *args) в потоке-воркере и ожидает результат."""
+        self._admit()
+        try:
+            return await self.execute(func, *args)
+        finally:
+            self._done()
+
+    async def execute(self, func, *args):
+        """Как run, но без проверки очереди: задача уже принята (transcribe, батч)."""
+        loop = asyncio.get_running_loop()
+        trace = current_trace.get()
+        if trace is None:
+            return await loop.run_in_executor(self._ensure_pool(), self._call, func, args)
+        # Трассируемая задача: стадии и профиль из потока-воркера попадают в её трассу
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._ensure_pool(), context.run, trace.run_in_thread, self._call, func, args
+        )
+
+    async def _decode(self, func, *args, stage: str = None):
+        """
+        Декодирование и вырезание тишины: не больше workers одновременно.
+        Стадия stage замеряется после получения слота, без ожидания в очереди.
+        """
+        async with self._decode_slots:
+            if stage is None:
+                return await asyncio.to_thread(func, *args)
+            with stage_timer(stage, model_size=self.model_size):
+                return await asyncio.to_thread(func, *args)
+
+    def start(self, warm_up: bool = MODEL_WARMUP):
+        """Запускает фоновый прогрев модели и контроль простоя."""
+        if warm_up:
+            self._spawn(self.warm_up())
+        if self.idle_timeout > 0:
+            self._spawn(self._idle_loop())
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def warm_up(self):
+        """Загружает модель и прогоняет короткий синтетический клип."""
+        started = time.perf_counter()
+        clip = (0.01 * np.random.default_rng(0).standard_normal(SAMPLE_RATE)).astype(np.float32)
+        try:
+            await self.run(_transcribe_sync, clip, None)
+            logger.info(f"Прогрев модели завершён за {time.perf_counter() - started:.1f} с")
+        except Exception as e:
+            logger.warning(f"Прогрев модели не удался: {e}")
+
+    async def _idle_loop(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout / 2, 30))
+            idle = time.monotonic() - self._last_used
+            if self._pool is not None and self._pending == 0 and idle >= self.idle_timeout:
+                self._unload()
+
+    def _unload(self):
+        """Освобождает потоки и модели; следующая задача загрузит их заново."""
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=False)
+        self._pool = None
+        with self._init_lock:
+            self._shared_engine = None
+            self._ready_workers = 0
+            self.state = MODEL_STATE_UNLOADED
+        gc.collect()
+        if "torch" in sys.modules:
+            torch = sys.modules["torch"]
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        logger.info(f"Модель выгружена после {self.idle_timeout} с простоя")
+
+    def route(self, duration: float, preference: str = None, queue_depth: int = None) -> str:
+        """Пул с одной моделью всегда выбирает её."""
+        return self.model_size
+
+    async def detect_language(self, audio, model_size: str = None) -> tuple[str, float]:
+        """Определяет язык записи по первым 30 с."""
+        self._admit()
+        try:
+            if isinstance(audio, (bytes, bytearray, memoryview)):
+                audio = await self._decode(decode_audio_bytes, bytes(audio))
+            return await self.execute(_detect_language_sync, audio)
+        finally:
+            self._done()
+
+    async def transcribe(self, audio, language: str = None, model_size: str = None) -> dict:
+        """
+        Транскрибирует аудио в потоке-воркере и возвращает результат движка.
+        С SILENCE_TRIM паузы вырезаются до распознавания, а время сегментов
+        переводится обратно в исходную запись (в результате есть ключ trim).
+        Клипы короче окна Whisper (30 с) проходят через микробатчинг. Очередь
+        проверяется до декодирования, а декодирование и вырезание тишины идут
+        не больше чем в workers потоках одновременно.
+        Пул обслуживает одну модель, model_size принимается для совместимости с ModelPool.
+        """
+        # Задача принимается до декодирования: при переполненной очереди файл не декодируется
+        self._admit()
+        try:
+            if isinstance(audio, (bytes, bytearray, memoryview)) and (SILENCE_TRIM or self._batcher is not None):
+                audio = await self._decode(decode_audio_bytes, bytes(audio), stage="decode")
+            elif isinstance(audio, str) and SILENCE_TRIM:
+                audio = await self._decode(decode_audio_file, audio, stage="decode")
+
+            speech = None
+            if SILENCE_TRIM:
+                speech = await self._decode(_trim_silence_sync, audio)
+                if not len(speech.audio):
+                    # Одна тишина: модель не запускаем, иначе она может «услышать» несуществующий текст
+                    return speech.remap({"text": "", "language": None, "segments": []})
+                audio = speech.audio
+
+            if self._batcher is not None and isinstance(audio, np.ndarray) and len(audio) <= _BATCH_MAX_CLIP_SECONDS * SAMPLE_RATE:
+                result = await self._batcher.submit(audio, language)
+            else:
+                result = await self.execute(_transcribe_sync, audio, language)
+        finally:
+            self._done()
+        return speech.remap(result) if speech is not None else result
+
+    def shutdown(self):
+        for task in self._background:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def choose_model_size(
+    duration: float,
+    queue_depth: int,
+    preference: str = None,
+    sizes: list[str] = WHISPER_MODEL_SIZES,
+    default_size: str = WHISPER_MODEL_SIZE
+) -> str:
+    """
+    Выбирает размер модели для задачи.
+
+    Явный выбор пользователя соблюдается. Иначе короткие записи идут на
+    MODEL_ROUTE_SHORT_SIZE, длинные — на MODEL_ROUTE_LONG_SIZE, остальные — на
+    модель по умолчанию. При глубокой очереди автоматический выбор опускается
+    на размер меньше, чтобы разгрести очередь быстрее.
+    """
+    if preference in sizes:
+        return preference
+
+    if duration < MODEL_ROUTE_SHORT_SECONDS:
+        size = MODEL_ROUTE_SHORT_SIZE
+    elif duration >= MODEL_ROUTE_LONG_SECONDS:
+        size = MODEL_ROUTE_LONG_SIZE
+    else:
+        size = default_size
+
+    if size not in sizes:
+        size = default_size if default_size in sizes else sizes[0]
+
+    if queue_depth >= MODEL_DOWNGRADE_QUEUE_DEPTH:
+        size = sizes[max(0, sizes.index(size) - 1)]
+
+    return size
+
+
+class ModelPool:
+    """
+    Набор пулов транскрибации для моделей разных размеров.
+
+    Пулы создаются по требованию; если оценка занятой памяти превышает
+    memory_budget_mb, давно не использованные простаивающие пулы выгружаются.
+    Интерфейс совпадает с TranscriptionExecutor, плюс выбор модели через route.
+    """
+
+    def __init__(
+        self,
+        sizes: list[str] = WHISPER_MODEL_SIZES,
+        default_size: str = WHISPER_MODEL_SIZE,
+        memory_budget_mb: int = MODEL_MEMORY_BUDGET_MB,
+        workers: int = TRANSCRIPTION_WORKERS,
+        queue_size: int = TRANSCRIPTION_QUEUE_SIZE
+    ):
+        self.sizes = sizes if default_size in sizes else sizes + [default_size]
+        self.model_size = default_size
+        self.memory_budget_mb = memory_budget_mb
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executors: OrderedDict[str, TranscriptionExecutor] = OrderedDict()
+        self._started = False
+
+    @property
+    def pending(self) -> int:
+        return sum(executor.pending for executor in self._executors.values())
+
+    @property
+    def device(self) -> str | None:
+        return next((e.device for e in self._executors.values() if e.device), None)
+
+    @property
+    def state(self) -> str:
+        if not self._executors:
+            return MODEL_STATE_NOT_LOADED
+        return ", ".join(f"{size} — {executor.state}" for size, executor in self._executors.items())
+
+    def route(self, duration: float, preference: str = None, queue_depth: int = None) -> str:
+        """Размер модели для записи; queue_depth по умолчанию — задачи в самом пуле."""
+        if queue_depth is None:
+            queue_depth = self.pending
+        return choose_model_size(duration, queue_depth, preference, self.sizes, self.model_size)
+
+    def executor(self, model_size: str = None) -> TranscriptionExecutor:
+        model_size = model_size if model_size in self.sizes else self.model_size
+        executor = self._executors.get(model_size)
+        if executor is None:
+            executor = TranscriptionExecutor(self.workers, self.queue_size, model_size=model_size)
+            self._executors[model_size] = executor
+            if self._started:
+                executor.start(warm_up=False)
+        self._executors.move_to_end(model_size)
+        self._enforce_budget(keep=model_size)
+        return executor
+
+    def _enforce_budget(self, keep: str):
+        # Уже загруженная модель учтена в used, досчитываем только ещё не загруженную
+        kept = self._executors[keep]
+        needed = 0 if kept.loaded else kept.expected_memory_mb()
+        for size, executor in list(self._executors.items()):
+            used = sum(e.memory_mb() for e in self._executors.values())
+            if used + needed <= self.memory_budget_mb:
+                return
+            if size != keep and executor.loaded and executor.pending == 0:
+                logger.info(f"Выгружаю модель {size}: превышен бюджет памяти {self.memory_budget_mb} МБ")
+                executor._unload()
+
+    async def transcribe(self, audio, language: str = None, model_size: str = None) -> dict:
+        return await self.executor(model_size).transcribe(audio, language)
+
+    async def detect_language(self, audio, model_size: str = None) -> tuple[str, float]:
+        return await self.executor(model_size).detect_language(audio)
+
+    def start(self):
+        self._started = True
+        self.executor(self.model_size).start()
+
+    def shutdown(self):
+        for executor in self._executors.values():
+            executor.shutdown()
+
+
+class TranscriptionCache:
+    """
+    Персистентный кэш транскрибаций на SQLite.
+
+    Ключ строится из идентификатора аудио (file_unique_id Telegram или SHA-256
+    содержимого), размера модели и языка. При превышении лимита записей или
+    суммарного размера текста вытесняются давно не использованные записи.
+    """
+
+    def __init__(
+        self,
+        path: str = TRANSCRIPTION_CACHE_PATH,
+        max_entries: int = TRANSCRIPTION_CACHE_MAX_ENTRIES,
+        max_bytes: int = TRANSCRIPTION_CACHE_MAX_BYTES
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS transcriptions ("
+            " key TEXT PRIMARY KEY,"
+            " text TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS transcriptions_accessed_at ON transcriptions (accessed_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def file_key(file_unique_id: str, model_size: str, language: str = None) -> str:
+        return f"file:{file_unique_id}:{model_size}:{language or 'auto'}"
+
+    @staticmethod
+    def content_key(digest: str, model_size: str, language: str = None) -> str:
+        return f"sha256:{digest}:{model_size}:{language or 'auto'}"
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        """SHA-256 содержимого файла (читается блоками)."""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _get_sync(self, keys) -> str | None:
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT text FROM transcriptions WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE transcriptions SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                    )
+                    self._conn.commit()
+                    return row[0]
+        return None
+
+    def _put_sync(self, keys, text: str):
+        size = len(text.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO transcriptions (key, text, size, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, text, size, now) for key in keys]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcriptions"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM transcriptions ORDER BY accessed_at ASC"
+        ).fetchall()
+        stale = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            stale.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM transcriptions WHERE key = ?", stale)
+        logger.info(f"Из кэша транскрибаций вытеснено записей: {len(stale)}")
+
+    async def get(self, *keys: str) -> str | None:
+        """Возвращает текст по первому найденному ключу или None."""
+        text = await asyncio.to_thread(self._get_sync, keys)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        CACHE_REQUESTS.inc(cache="transcription", result="miss" if text is None else "hit")
+        return text
+
+    async def put(self, keys, text: str):
+        """Сохраняет текст под всеми переданными ключами."""
+        await asyncio.to_thread(self._put_sync, tuple(keys), text)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def report_trim(trim: dict | None, label: str = ""):
+    """Пишет в лог и метрики, сколько тишины вырезано из записи перед распознаванием."""
+    if not trim:
+        return
+    original = trim["original_seconds"]
+    speech = trim["speech_seconds"]
+    AUDIO_SECONDS.inc(original, kind="original")
+    AUDIO_SECONDS.inc(speech, kind="speech")
+    if original > 0:
+        logger.info(
+            f"Тишина{label}: вырезано {1 - speech / original:.0%} записи, "
+            f"распознаётся {speech:.1f} с из {original:.1f} с (сэкономлено {original - speech:.1f} с)"
+        )
+
+
+async def transcribe_audio(
+    transcriber: TranscriptionExecutor,
+    audio,
+    language: str = None,
+    cache: TranscriptionCache = None,
+    cache_keys=(),
+    model_size: str = None,
+    on_language=None
+) -> str:
+    """
+    Транскрибирует аудио (путь к файлу или байты) в текст.
+    Автоматически определяет язык, если указано 'auto'.
+    on_language(code) получает язык, который вернула модель.
+    """
+    try:
+        result = await transcriber.transcribe(audio, language, model_size)
+        text = result["text"].strip()
+        report_trim(result.get("trim"))
+
+        if on_language is not None and result.get("language"):
+            on_language(result["language"])
+
+        if cache is not None and cache_keys and text:
+            try:
+                await cache.put(cache_keys, text)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить транскрибацию в кэш: {e}")
+
+        return text
+
+    except TranscriptionQueueFull:
+        raise
     except Exception as e:
-        return f"[Ошибка при распознавании речи: {str(e)}]"
\ No newline at end of file
+        return f"[Ошибка при распознавании речи: {str(e)}]"
+
+
+async def transcribe_long_audio(
+    transcriber: TranscriptionExecutor,
+    audio,
+    language: str = None,
+    segment_seconds: float = LONG_AUDIO_SEGMENT_SECONDS,
+    parallel: int = LONG_AUDIO_PARALLEL_SEGMENTS,
+    model_size: str = None,
+    on_language=None
+) -> AsyncIterator[str]:
+    """
+    Транскрибирует длинную запись по сегментам, выровненным по паузам.
+
+    Тексты сегментов выдаются по порядку, как только готовы, поэтому первая часть
+    появляется быстро независимо от длины записи. Язык определяется один раз по
+    первым 30 с (detect_language) и фиксируется для всех сегментов, после чего
+    они распознаются параллельно (не больше parallel одновременно). Если движок
+    не умеет определять язык отдельно, язык берётся из первого сегмента.
+
+    Если у транскрибатора есть свой transcribe_long (RemoteTranscriber), запись
+    целиком отдаётся ему: декодирование и нарезка выполняются на воркере.
+    """
+    transcribe_long = getattr(transcriber, "transcribe_long", None)
+    if transcribe_long is not None:
+        async for text in transcribe_long(audio, language, model_size, on_language):
+            yield text
+        return
+
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        pcm = await asyncio.to_thread(decode_audio_bytes, bytes(audio))
+    elif isinstance(audio, np.ndarray):
+        pcm = audio
+    else:
+        pcm = await asyncio.to_thread(decode_audio_file, audio)
+
+    bounds = split_on_silence(pcm, segment_seconds)
+    logger.info(f"Длинная запись {len(pcm) / SAMPLE_RATE:.0f} с разбита на {len(bounds)} сегментов")
+
+    segments = deque(bounds)
+    trimmed = {"original_seconds": 0.0, "speech_seconds": 0.0}
+
+    def account(result: dict) -> str:
+        for key, value in (result.get("trim") or {}).items():
+            trimmed[key] += value
+        return result["text"].strip()
+
+    if language in (None, "auto"):
+        head = pcm[:WHISPER_WINDOW_SECONDS * SAMPLE_RATE]
+        try:
+            language, probability = await transcriber.detect_language(head, model_size)
+            logger.info(f"Язык записи определён по первому окну: {language} ({probability:.2f})")
+        except NotImplementedError:
+            language = None
+
+        if language is None:
+            start, end = segments.popleft()
+            first = await transcriber.transcribe(pcm[start:end], language, model_size)
+            language = first.get("language")
+            yield account(first)
+
+        if on_language is not None and language:
+            on_language(language)
+
+    pending = deque()
+    try:
+        while segments or pending:
+            while segments and len(pending) < max(1, parallel):
+                start, end = segments.popleft()
+                pending.append(asyncio.ensure_future(transcriber.transcribe(pcm[start:end], language, model_size)))
+
+            result = await pending.popleft()
+            yield account(result)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if trimmed["original_seconds"]:
+        report_trim(trimmed, " в длинной записи")
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from config import (
+    DEFAULT_LANGUAGE,
+    DEFAULT_MODEL_PREFERENCE,
+    DEFAULT_SUMMARY_STYLE,
+    SUMMARY_STYLES,
+    USER_SETTINGS_CACHE_SIZE,
+    USER_SETTINGS_DB_PATH,
+    USER_SETTINGS_FLUSH_INTERVAL
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class UserSettings:
+    """
+    Настройки одного пользователя.
+
+    Поддерживает словарный доступ (prefs["language"], prefs.get(...)), которым
+    пользуются обработчики. summary_style_name не хранится, а вычисляется по стилю.
+    """
+
+    __slots__ = ("user_id", "language", "summary_style", "model_size", "_on_change")
+
+    FIELDS = ("language", "summary_style", "model_size")
+
+    def __init__(
+        self,
+        user_id: int,
+        language: str = DEFAULT_LANGUAGE,
+        summary_style: str = DEFAULT_SUMMARY_STYLE,
+        model_size: str = DEFAULT_MODEL_PREFERENCE,
+        on_change=None
+    ):
+        self.user_id = user_id
+        self.language = language
+        self.summary_style = summary_style
+        self.model_size = model_size
+        self._on_change = on_change
+
+    @property
+    def summary_style_name(self) -> str:
+        style_info = SUMMARY_STYLES.get(self.summary_style, SUMMARY_STYLES[DEFAULT_SUMMARY_STYLE])
+        return style_info["name"]
+
+    def __getitem__(self, key: str):
+        if key in self.FIELDS or key == "summary_style_name":
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key == "summary_style_name":
+            # Вычисляется из summary_style
+            return
+        if key not in self.FIELDS:
+            raise KeyError(key)
+
+        setattr(self, key, value)
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS or key == "summary_style_name"
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_row(self) -> tuple:
+        return self.user_id, self.language, self.summary_style, self.model_size
+
+
+class UserSettingsRepository:
+    """
+    Репозиторий пользовательских настроек.
+
+    Горячие записи держатся в LRU-кэше ограниченного размера, изменения
+    копятся в памяти и пачками сбрасываются в SQLite раз в flush_interval
+    секунд (write-behind). Пользователи с настройками по умолчанию в базу
+    не пишутся.
+    """
+
+    def __init__(
+        self,
+        path: str = USER_SETTINGS_DB_PATH,
+        cache_size: int = USER_SETTINGS_CACHE_SIZE,
+        flush_interval: float = USER_SETTINGS_FLUSH_INTERVAL
+    ):
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._cache: OrderedDict[int, UserSettings] = OrderedDict()
+        self._dirty: dict[int, UserSettings] = {}
+        self._flushing: dict[int, tuple] = {}
+        self._flush_task = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_settings ("
+            " user_id INTEGER PRIMARY KEY,"
+            " language TEXT NOT NULL,"
+            " summary_style TEXT NOT NULL,"
+            f" model_size TEXT NOT NULL DEFAULT '{DEFAULT_MODEL_PREFERENCE}')"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(user_settings)")}
+        if "model_size" not in columns:
+            # База, созданная до появления выбора модели
+            self._conn.execute(
+                "ALTER TABLE user_settings ADD COLUMN"
+                f" model_size TEXT NOT NULL DEFAULT '{DEFAULT_MODEL_PREFERENCE}'"
+            )
+        self._conn.commit()
+
+    def get(self, user_id: int) -> UserSettings:
+        """Возвращает настройки пользователя, создавая их по умолчанию."""
+        record = self._cache.get(user_id)
+        if record is not None:
+            self._cache.move_to_end(user_id)
+            return record
+
+        record = self._dirty.get(user_id)
+        if record is None:
+            row = self._flushing.get(user_id) or self._load(user_id)
+            if row is None:
+                record = UserSettings(user_id, on_change=self._mark_dirty)
+            else:
+                _, language, summary_style, model_size = row
+                record = UserSettings(user_id, language, summary_style, model_size, on_change=self._mark_dirty)
+
+        self._cache[user_id] = record
+        while len(self._cache) > self.cache_size:
+            # Несохранённые изменения остаются в _dirty до ближайшего сброса
+            self._cache.popitem(last=False)
+        return record
+
+    def _load(self, user_id: int) -> tuple | None:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT user_id, language, summary_style, model_size FROM user_settings WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+
+    def _mark_dirty(self, record: UserSettings):
+        self._dirty[record.user_id] = record
+
+    def _write(self, rows: list[tuple]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO user_settings (user_id, language, summary_style, model_size)"
+                " VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    async def flush(self):
+        """Сбрасывает накопленные изменения в базу одной транзакцией."""
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, {}
+        self._flushing = {user_id: record.as_row() for user_id, record in dirty.items()}
+        try:
+            await asyncio.to_thread(self._write, list(self._flushing.values()))
+            logger.debug(f"Сохранены настройки пользователей: {len(dirty)}")
+        except Exception:
+            # Вернём изменения в очередь, чтобы не потерять их
+            for user_id, record in dirty.items():
+                self._dirty.setdefault(user_id, record)
+            raise
+        finally:
+            self._flushing = {}
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить настройки пользователей: {e}")
+
+    def start(self):
+        """Запускает периодический сброс изменений."""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,96 @@
+import asyncio
+import datetime
+import io
+import tarfile
+import zipfile
+
+import pytest
+from aiogram import types
+
+from handlers.voice_audio_handler import get_file_entity
+from services.archive import (
+    ArchiveLimitExceeded,
+    count_archive_audio,
+    is_archive,
+    iter_archive_audio,
+    read_archive_audio
+)
+
+
+def _zip(path, files: dict[str, bytes]) -> str:
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def _tar(path, files: dict[str, bytes]) -> str:
+    with tarfile.open(path, "w:gz") as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def test_only_audio_entries_are_read(tmp_path):
+    path = _zip(tmp_path / "a.zip", {
+        "one.ogg": b"1", "notes.txt": b"x", "__MACOSX/._one.ogg": b"y", "dir/two.MP3": b"22"
+    })
+    assert list(iter_archive_audio(path)) == [("one.ogg", b"1"), ("dir/two.MP3", b"22")]
+    assert count_archive_audio(path) == 2
+
+
+def test_too_many_files_raise(tmp_path):
+    path = _zip(tmp_path / "a.zip", {f"{i}.ogg": b"x" for i in range(4)})
+    assert len(list(iter_archive_audio(path, max_files=4))) == 4
+    with pytest.raises(ArchiveLimitExceeded):
+        list(iter_archive_audio(path, max_files=3))
+
+
+def test_oversized_file_is_skipped(tmp_path):
+    path = _zip(tmp_path / "a.zip", {"big.ogg": b"x" * 100, "small.ogg": b"y" * 10})
+    assert list(iter_archive_audio(path, max_file_bytes=50, max_total_bytes=1000)) == [
+        ("big.ogg", None), ("small.ogg", b"y" * 10)
+    ]
+
+
+def test_total_unpacked_size_is_limited(tmp_path):
+    # Каждый файл в пределах лимита, но вместе больше max_total_bytes
+    path = _tar(tmp_path / "a.tar.gz", {f"{i}.wav": b"z" * 40 for i in range(3)})
+    assert count_archive_audio(path) is None
+
+    entries = iter_archive_audio(path, max_file_bytes=50, max_total_bytes=100)
+    assert [name for name, _ in (next(entries), next(entries))] == ["0.wav", "1.wav"]
+    with pytest.raises(ArchiveLimitExceeded):
+        next(entries)
+
+
+def test_async_reader_yields_entries(tmp_path):
+    path = _tar(tmp_path / "a.tar.gz", {"a.ogg": b"1", "b.ogg": b"2"})
+
+    async def scenario():
+        return [entry async for entry in read_archive_audio(path)]
+
+    assert asyncio.run(scenario()) == [("a.ogg", b"1"), ("b.ogg", b"2")]
+
+
+def test_archive_detection():
+    assert is_archive("records.TAR.GZ", None)
+    assert is_archive(None, "application/zip")
+    assert not is_archive("voice.ogg", None)
+
+
+def _document_message(mime_type: str | None) -> types.Message:
+    return types.Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=types.Chat(id=1, type="private"),
+        document=types.Document(file_id="f", file_unique_id="u", file_name="file.bin", mime_type=mime_type)
+    )
+
+
+def test_document_without_mime_type_is_not_audio():
+    assert get_file_entity(_document_message(None)) == (None, None)
+    entity, suffix = get_file_entity(_document_message("audio/mpeg"))
+    assert (entity.file_id, suffix) == ("f", ".bin")
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from services.audio import SAMPLE_RATE, SpeechRegions, trim_silence
+
+
+def _tone(seconds: float, amplitude: float = 0.3) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def _noise(seconds: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (0.001 * rng.standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+
+
+def test_long_pauses_are_cut_and_short_ones_kept():
+    audio = np.concatenate([
+        _noise(1.0, 1), _tone(1.0), _noise(2.0, 2), _tone(1.0), _noise(0.3, 3), _tone(1.0), _noise(1.0, 4)
+    ])
+    speech = trim_silence(audio, min_silence_seconds=0.6, padding_seconds=0.2)
+
+    # Пауза 0.3 с внутри речи осталась, паузы 1 и 2 с вырезаны
+    assert len(speech.regions) == 2
+    assert 3.3 <= speech.speech_seconds <= 3.3 + 4 * 0.2 + 0.1
+    assert speech.original_seconds == pytest.approx(7.3)
+    assert 0.4 < speech.trimmed_ratio < 0.6
+    # Участки покрывают речь с запасом
+    (first_start, first_end), (second_start, second_end) = speech.regions / SAMPLE_RATE
+    assert 0.7 <= first_start <= 1.0 and 2.0 <= first_end <= 2.3
+    assert 3.7 <= second_start <= 4.0 and 6.3 <= second_end <= 6.6
+
+
+def test_silence_only_gives_no_speech():
+    speech = trim_silence(_noise(3.0))
+    assert len(speech.regions) == 0
+    assert len(speech.audio) == 0
+    assert speech.trimmed_ratio == 1.0
+    result = speech.remap({"text": "", "segments": []})
+    assert result["trim"] == {"original_seconds": 3.0, "speech_seconds": 0.0}
+
+
+def test_speech_without_pauses_is_untouched():
+    audio = _tone(2.0)
+    speech = trim_silence(audio)
+    assert speech.audio is audio
+    assert speech.trimmed_ratio == 0.0
+    assert speech.to_original(1.234) == pytest.approx(1.234)
+
+
+def test_empty_audio():
+    audio = np.zeros(0, dtype=np.float32)
+    speech = trim_silence(audio)
+    assert len(speech.audio) == 0
+    assert speech.trimmed_ratio == 0.0
+
+
+def _regions(*pairs_seconds) -> SpeechRegions:
+    """Участки в секундах исходной записи длиной 10 с."""
+    audio = np.zeros(10 * SAMPLE_RATE, dtype=np.float32)
+    regions = np.array([[int(a * SAMPLE_RATE), int(b * SAMPLE_RATE)] for a, b in pairs_seconds], dtype=np.int64)
+    return SpeechRegions(audio, regions)
+
+
+def test_to_original_maps_into_regions():
+    speech = _regions((1, 2), (4, 5), (7, 9))
+    assert speech.speech_seconds == pytest.approx(4.0)
+    assert speech.to_original(0.0) == pytest.approx(1.0)
+    assert speech.to_original(0.5) == pytest.approx(1.5)
+    assert speech.to_original(1.5) == pytest.approx(4.5)
+    assert speech.to_original(3.0) == pytest.approx(8.0)
+    # Граница участков: начало сегмента — в следующем участке, конец — в предыдущем
+    assert speech.to_original(1.0) == pytest.approx(4.0)
+    assert speech.to_original(1.0, end=True) == pytest.approx(2.0)
+    assert speech.to_original(2.0, end=True) == pytest.approx(5.0)
+    # Конец последнего участка и время за ним (дополнение модели) не уходят в начало записи
+    assert speech.to_original(4.0, end=True) == pytest.approx(9.0)
+    assert speech.to_original(4.2, end=True) == pytest.approx(9.2)
+
+
+def test_remap_segments_and_trim_stats():
+    speech = _regions((1, 2), (4, 5))
+    result = {
+        "text": "раз два",
+        "language": "ru",
+        "segments": [{"start": 0.2, "end": 1.0, "text": "раз"}, {"start": 1.0, "end": 1.8, "text": "два"}],
+    }
+    remapped = speech.remap(result)
+
+    assert [(seg["start"], seg["end"]) for seg in remapped["segments"]] == [
+        pytest.approx((1.2, 2.0)), pytest.approx((4.0, 4.8))
+    ]
+    assert [seg["text"] for seg in remapped["segments"]] == ["раз", "два"]
+    assert remapped["trim"] == {"original_seconds": 10.0, "speech_seconds": 2.0}
+    assert remapped["text"] == "раз два" and remapped["language"] == "ru"
+    # Исходный результат не меняется
+    assert result["segments"][0]["start"] == 0.2 and "trim" not in result
+
+
+def test_remapped_timestamps_are_monotonic():
+    rng = np.random.default_rng(0)
+    bounds = np.sort(rng.choice(np.arange(1, 100), size=20, replace=False)) / 10
+    speech = _regions(*zip(bounds[0::2], bounds[1::2]))
+    times = np.linspace(0, speech.speech_seconds, 200)
+    mapped = [speech.to_original(t) for t in times]
+    assert all(b >= a for a, b in zip(mapped, mapped[1:]))
+    assert all(speech.regions[0, 0] / SAMPLE_RATE <= t <= speech.regions[-1, 1] / SAMPLE_RATE for t in mapped)
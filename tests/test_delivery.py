@@ -0,0 +1,195 @@
+import asyncio
+import html
+import random
+import re
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import services.delivery as delivery
+from services.delivery import LiveMessage, OutboundSender, TokenBucket, split_html
+
+_TAG = re.compile(r"<(/?)([a-z]+)[^>]*>")
+
+
+def _assert_balanced(chunk: str):
+    stack = []
+    for closing, name in _TAG.findall(chunk):
+        if closing:
+            assert stack and stack[-1] == name, f"лишний </{name}> в {chunk!r}"
+            stack.pop()
+        else:
+            stack.append(name)
+    assert not stack, f"незакрытые теги {stack} в {chunk!r}"
+
+
+def _plain_words(text: str) -> list[str]:
+    return html.unescape(_TAG.sub(" ", text)).split()
+
+
+def _random_html(rng: random.Random, words: int) -> str:
+    vocabulary = ["встреча", "проект", "сроки", "a&b", "<x>", "очень" * 30, "релиз."]
+    parts = []
+    for _ in range(words):
+        word = html.escape(rng.choice(vocabulary))
+        roll = rng.random()
+        if roll < 0.1:
+            word = f"<b>{word} {html.escape(rng.choice(vocabulary))}</b>"
+        elif roll < 0.15:
+            word = f'<a href="https://example.com/{rng.randint(0, 99)}"><i>{word}</i></a>'
+        parts.append(word)
+        parts.append(rng.choice([" ", " ", " ", "\n", "\n\n"]))
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_split_html_chunks_fit_and_stay_balanced(seed):
+    rng = random.Random(seed)
+    text = _random_html(rng, rng.randint(50, 600))
+    limit = rng.choice([64, 200, 1000, 4096])
+    chunks = split_html(text, limit)
+
+    assert chunks
+    for chunk in chunks:
+        assert 0 < len(chunk) <= limit
+        _assert_balanced(chunk)
+        # Сущности не разрываются
+        assert not re.search(r"&#?\w*$", chunk)
+    # Текст не теряется; очень длинные слова могут быть разрезаны, поэтому сравниваем без пробелов
+    assert "".join("".join(_plain_words(chunk)) for chunk in chunks) == "".join(_plain_words(text))
+
+
+def test_split_html_prefers_paragraph_then_sentence_breaks():
+    first = "Первый абзац. " * 5
+    second = "Второй абзац. " * 5
+    chunks = split_html(f"{first.strip()}\n\n{second.strip()}", limit=len(first) + 20)
+    assert chunks == [first.strip(), second.strip()]
+
+    sentences = "Одно предложение тут. Другое предложение там"
+    assert split_html(sentences, limit=30) == ["Одно предложение тут.", "Другое предложение там"]
+
+
+def test_split_html_reopens_tags_across_chunks():
+    text = "<b>" + " ".join(["жирный"] * 40) + "</b> хвост"
+    chunks = split_html(text, limit=60)
+    assert len(chunks) > 1
+    assert all(chunk.startswith("<b>") for chunk in chunks[:-1])
+    assert chunks[-1].endswith("хвост")
+    for chunk in chunks:
+        _assert_balanced(chunk)
+
+
+def test_split_html_short_text_unchanged():
+    assert split_html("<b>Заголовок</b>\nтекст", limit=100) == ["<b>Заголовок</b>\nтекст"]
+    assert split_html("   ", limit=100) == []
+
+
+class FakeClock:
+    """
+    Подменяет часы и asyncio.sleep модуля delivery: сон мгновенно сдвигает часы.
+    Модули time и asyncio не трогаем, иначе встанет сам event loop.
+    """
+
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        self.slept = 0.0
+        monkeypatch.setattr(delivery, "time", SimpleNamespace(monotonic=lambda: self.now))
+        monkeypatch.setattr(delivery, "asyncio", SimpleNamespace(
+            sleep=self.sleep, Lock=asyncio.Lock, get_running_loop=asyncio.get_running_loop
+        ))
+
+    async def sleep(self, seconds: float):
+        # Настоящие часы за время сна всегда сдвигаются хоть немного
+        seconds = max(seconds, 1e-6)
+        self.now += seconds
+        self.slept += seconds
+
+
+def test_token_bucket_burst_then_rate(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    async def scenario():
+        for _ in range(3):
+            await bucket.acquire()
+        assert clock.slept == 0
+        for _ in range(4):
+            await bucket.acquire()
+
+    asyncio.run(scenario())
+    # После всплеска в 3 токена — по 0.5 с на каждый следующий
+    assert clock.slept == pytest.approx(2.0)
+
+
+def test_token_bucket_pause(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    bucket = TokenBucket(rate=1, capacity=5)
+
+    async def scenario():
+        bucket.pause(3)
+        await bucket.acquire()
+
+    asyncio.run(scenario())
+    # Пауза отменяет накопленный всплеск: ждём её и ещё один токен
+    assert clock.slept == pytest.approx(4.0)
+
+
+def test_token_bucket_works_across_event_loops():
+    # Как глобальный outbound: корзина создана вне цикла и переживает несколько asyncio.run
+    bucket = TokenBucket(rate=200, capacity=1)
+
+    async def contend():
+        await asyncio.gather(*(bucket.acquire() for _ in range(3)))
+
+    asyncio.run(contend())
+    asyncio.run(contend())
+
+
+def test_outbound_retries_after_429(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    sender = OutboundSender(global_rate=100, chat_rate=100, chat_burst=1, max_retries=2)
+    attempts = 0
+
+    async def request():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Too Many Requests", retry_after=5)
+        return "ok"
+
+    assert asyncio.run(sender.call(1, request)) == "ok"
+    assert attempts == 3
+    assert clock.slept >= 10
+
+    attempts = 0
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(sender.call(1, request, retry=False))
+    assert attempts == 1
+
+
+def test_outbound_chat_buckets_are_bounded():
+    sender = OutboundSender(max_chats=3)
+    for chat_id in range(10):
+        sender._chat_bucket(chat_id)
+    assert list(sender._chats) == [7, 8, 9]
+
+
+@pytest.mark.parametrize("text, budget", [
+    ("слово " * 50, 40),
+    ("<>&\"'" * 30, 25),
+    ("безпробелов" * 10, 17),
+    ("a & b " * 20, 12),
+])
+def test_live_message_cut_fits_budget(text, budget):
+    cut = LiveMessage._cut(text, budget)
+    assert 0 < cut <= len(text)
+    assert len(html.escape(text[:cut].rstrip())) <= budget
+
+
+def test_live_message_cut_prefers_space():
+    text = "раз два три четыре пять шесть"
+    cut = LiveMessage._cut(text, 20)
+    assert text[cut] == " "
+    assert text[:cut] == "раз два три четыре"
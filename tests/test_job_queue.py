@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import pytest
+
+from services.job_queue import RemoteTranscriber, RemoteTranscriptionError, SQLiteJobQueue
+from services.transcription import transcribe_long_audio
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), poll_interval=0.01, visibility_timeout=60)
+    yield queue
+    queue.shutdown()
+
+
+def test_long_audio_is_sent_encoded_and_streamed_from_worker(queue):
+    transcriber = RemoteTranscriber(queue, model_size="small", result_timeout=5)
+    seen = {}
+
+    async def worker():
+        job = await queue.dequeue("test", timeout=5)
+        seen["kind"], seen["audio"], seen["options"] = job.kind, job.audio, job.options
+        await queue.publish(job.id, {"language": "ru"})
+        for text in ("первая часть", "вторая часть"):
+            await queue.publish(job.id, {"text": text})
+        await queue.complete(job.id, result={"language": "ru"})
+
+    async def scenario():
+        languages = []
+        worker_task = asyncio.create_task(worker())
+        parts = [
+            text async for text in transcribe_long_audio(
+                transcriber, b"ogg-bytes", "auto", model_size="small", on_language=languages.append
+            )
+        ]
+        await worker_task
+        return parts, languages
+
+    parts, languages = asyncio.run(scenario())
+
+    assert parts == ["первая часть", "вторая часть"]
+    assert languages == ["ru"]
+    # Фронтенд не декодирует запись: воркер получает исходный файл
+    assert seen["kind"] == "encoded"
+    assert seen["audio"] == b"ogg-bytes"
+    assert seen["options"]["task"] == "transcribe_long"
+
+
+def test_long_audio_worker_error_is_raised(queue):
+    transcriber = RemoteTranscriber(queue, result_timeout=5)
+
+    async def worker():
+        job = await queue.dequeue("test", timeout=5)
+        await queue.publish(job.id, {"text": "начало"})
+        await queue.complete(job.id, error="ffmpeg упал")
+
+    async def scenario():
+        parts = []
+        worker_task = asyncio.create_task(worker())
+        with pytest.raises(RemoteTranscriptionError):
+            async for text in transcriber.transcribe_long(b"ogg-bytes"):
+                parts.append(text)
+        await worker_task
+        return parts
+
+    assert asyncio.run(scenario()) == ["начало"]
+
+
+def _dequeue(queue, worker_id: str = "test"):
+    return asyncio.run(queue.dequeue(worker_id, timeout=0))
+
+
+def _statuses(queue) -> dict:
+    return dict(queue._execute("SELECT id, status FROM jobs"))
+
+
+def test_claim_takes_oldest_job_once(queue):
+    first = asyncio.run(queue.enqueue("encoded", b"1"))
+    second = asyncio.run(queue.enqueue("encoded", b"2", "ru", {"model_size": "small"}))
+
+    job = _dequeue(queue, "a")
+    assert (job.id, job.audio) == (first, b"1")
+
+    job = _dequeue(queue, "b")
+    assert (job.id, job.language, job.options) == (second, "ru", {"model_size": "small"})
+
+    # Обе задачи у воркеров, больше брать нечего
+    assert _dequeue(queue, "c") is None
+    assert _statuses(queue) == {first: "running", second: "running"}
+    assert asyncio.run(queue.depth()) == 0
+
+
+def test_stale_job_returns_to_queue_after_visibility_timeout(queue):
+    queue.visibility_timeout = 0.05
+    job_id = asyncio.run(queue.enqueue("encoded", b"audio"))
+
+    assert _dequeue(queue, "crashed").id == job_id
+    assert _dequeue(queue, "alive") is None
+
+    time.sleep(0.1)
+    job = _dequeue(queue, "alive")
+    assert job.id == job_id
+    assert queue._execute("SELECT worker FROM jobs WHERE id = ?", (job_id,)) == [("alive",)]
+
+
+def test_finished_jobs_are_purged_after_ttl(queue):
+    queue.finished_ttl = 0.05
+
+    async def finish(audio: bytes, error: str = None) -> str:
+        job_id = await queue.enqueue("encoded", audio)
+        job = await queue.dequeue("test", timeout=0)
+        await queue.publish(job.id, {"text": "часть"})
+        await queue.complete(job.id, result=None if error else {"text": "готово"}, error=error)
+        return job_id
+
+    done = asyncio.run(finish(b"1"))
+    failed = asyncio.run(finish(b"2", error="сбой"))
+    waiting = asyncio.run(queue.enqueue("encoded", b"3"))
+
+    time.sleep(0.1)
+    assert _dequeue(queue).id == waiting
+
+    statuses = _statuses(queue)
+    assert done not in statuses and failed not in statuses
+    assert statuses[waiting] == "running"
+    assert queue._execute("SELECT COUNT(*) FROM job_messages") == [(0,)]
+
+
+def test_result_is_kept_until_ttl(queue):
+    async def scenario():
+        job_id = await queue.enqueue("encoded", b"audio")
+        job = await queue.dequeue("test", timeout=0)
+        await queue.complete(job.id, result={"text": "готово"})
+        # Другой воркер забирает задачи, но свежий результат не трогает
+        await queue.dequeue("other", timeout=0)
+        return await queue.wait_result(job_id, timeout=1)
+
+    assert asyncio.run(scenario()) == {"text": "готово"}
+    assert _statuses(queue) == {}
@@ -0,0 +1,134 @@
+import asyncio
+import datetime
+import io
+from types import SimpleNamespace
+
+import pytest
+from aiogram import types
+
+import handlers.voice_audio_handler as voice_audio_handler
+from services.language import LanguagePrior
+from services.transcription import TranscriptionCache
+from services.user_settings import UserSettingsRepository
+
+
+def _prior(**kwargs) -> LanguagePrior:
+    options = {"window": 10, "min_samples": 3, "confidence": 0.8, "recheck_every": 0, "max_users": 100}
+    return LanguagePrior(**{**options, **kwargs})
+
+
+def test_guess_needs_enough_samples():
+    prior = _prior()
+    prior.observe(1, "ru")
+    prior.observe(1, "ru")
+    assert prior.guess(1) is None
+
+    prior.observe(1, "ru")
+    assert prior.guess(1) == "ru"
+    assert prior.guess(2) is None
+
+
+def test_guess_needs_a_dominant_language():
+    prior = _prior()
+    for language in ("ru", "en", "ru", "en"):
+        prior.observe(1, language)
+    assert prior.guess(1) is None
+
+
+def test_window_follows_language_change():
+    prior = _prior(window=4, min_samples=4, confidence=0.75)
+    for _ in range(4):
+        prior.observe(1, "ru")
+    assert prior.guess(1) == "ru"
+
+    for _ in range(3):
+        prior.observe(1, "en")
+    assert prior.guess(1) == "en"
+
+
+def test_every_nth_guess_rechecks():
+    prior = _prior(recheck_every=3)
+    for _ in range(3):
+        prior.observe(1, "ru")
+    assert [prior.guess(1) for _ in range(6)] == ["ru", "ru", None, "ru", "ru", None]
+
+
+def test_least_recent_users_are_forgotten():
+    prior = _prior(min_samples=1, max_users=2)
+    for user_id in (1, 2, 3):
+        prior.observe(user_id, "ru")
+    assert [prior.guess(user_id) for user_id in (1, 2, 3)] == [None, "ru", "ru"]
+
+
+class CountingPrior(LanguagePrior):
+    def __init__(self):
+        super().__init__(window=10, min_samples=1, confidence=0.5, recheck_every=0)
+        self.guesses = 0
+
+    def guess(self, user_id: int) -> str | None:
+        self.guesses += 1
+        return super().guess(user_id)
+
+
+class StubTranscriber:
+    def __init__(self):
+        self.languages = []
+
+    async def transcribe(self, audio, language: str = None, model_size: str = None) -> dict:
+        self.languages.append(language)
+        return {"text": "распознано", "language": "ru", "segments": []}
+
+
+class StubBot:
+    async def get_file(self, file_id: str):
+        return SimpleNamespace(file_path=f"voice/{file_id}.ogg")
+
+    async def download_file(self, file_path: str, destination=None):
+        return io.BytesIO(b"ogg-data")
+
+
+@pytest.fixture
+def recognize(tmp_path, monkeypatch):
+    async def edit_text(message, text, **kwargs):
+        return message
+
+    monkeypatch.setattr(voice_audio_handler, "outbound", SimpleNamespace(edit_text=edit_text))
+    cache = TranscriptionCache(str(tmp_path / "cache.sqlite3"))
+    settings = UserSettingsRepository(str(tmp_path / "settings.sqlite3"))
+    prior = CountingPrior()
+    prior.observe(1, "ru")
+    transcriber = StubTranscriber()
+
+    def run():
+        message = types.Message(
+            message_id=1,
+            date=datetime.datetime.now(),
+            chat=types.Chat(id=1, type="private"),
+            from_user=types.User(id=1, is_bot=False, first_name="Пользователь"),
+            voice=types.Voice(file_id="f1", file_unique_id="u1", duration=3, file_size=8)
+        )
+        return asyncio.run(voice_audio_handler.recognize_audio_message(
+            message, StubBot(), message, settings, transcriber, cache,
+            model_size="small", language_prior=prior
+        ))
+
+    yield run, cache, prior, transcriber
+    cache.close()
+
+
+def test_cached_transcript_does_not_consume_language_guess(recognize):
+    run, cache, prior, transcriber = recognize
+    digest = TranscriptionCache.hash_bytes(b"ogg-data")
+    asyncio.run(cache.put([TranscriptionCache.content_key(digest, "small", "auto")], "из кэша"))
+
+    assert run() == ("из кэша", False)
+    assert prior.guesses == 0
+    assert transcriber.languages == []
+
+
+def test_transcription_uses_language_guess(recognize):
+    run, _, prior, transcriber = recognize
+
+    assert run() == ("распознано", False)
+    assert prior.guesses == 1
+    assert transcriber.languages == ["ru"]
@@ -0,0 +1,117 @@
+import asyncio
+
+from services.llm_client import CircuitBreaker, LLMBackend, LLMClient
+
+
+class FlakyBackend(LLMBackend):
+    """Падает, пока fail=True; в режиме hang зависает до отмены."""
+
+    kind = "fake"
+
+    def __init__(self):
+        super().__init__("test")
+        self.fail = True
+        self.hang = False
+        self.calls = 0
+
+    async def complete(self, messages: list) -> str:
+        self.calls += 1
+        if self.hang:
+            await asyncio.Event().wait()
+        if self.fail:
+            raise ConnectionError("провайдер недоступен")
+        return "ответ"
+
+    async def stream(self, messages: list):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("провайдер недоступен")
+        for chunk in ("отв", "ет"):
+            yield chunk
+
+
+def _open_client() -> tuple[LLMClient, FlakyBackend, CircuitBreaker]:
+    """Клиент с одним провайдером, автомат которого уже разомкнут и готов к пробе."""
+    backend = FlakyBackend()
+    client = LLMClient([backend], timeout=5, max_retries=0, hedge_percentile=0)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    client.breakers[backend.name] = breaker
+    breaker.record_failure()
+    assert breaker.is_open
+    return client, backend, breaker
+
+
+def test_breaker_opens_and_probe_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open
+
+    assert breaker.allow()
+    # Пока идёт проба, остальные запросы не пропускаются
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow() and breaker.allow()
+
+
+def test_cancelled_probe_does_not_disable_provider():
+    client, backend, breaker = _open_client()
+    backend.hang = True
+
+    async def scenario():
+        probe = asyncio.ensure_future(client.complete([]))
+        await asyncio.sleep(0.01)
+        assert not breaker.allow()
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+        backend.hang = False
+        backend.fail = False
+        return await client.complete([])
+
+    assert asyncio.run(scenario()) == "ответ"
+    assert not breaker.is_open
+
+
+def test_abandoned_stream_probe_does_not_disable_provider():
+    client, backend, breaker = _open_client()
+    backend.fail = False
+
+    async def scenario():
+        stream = client.stream([])
+        assert await stream.__anext__() == "отв"
+        # Потребитель бросил поток после первого фрагмента
+        await stream.aclose()
+        return [chunk async for chunk in client.stream([])]
+
+    assert asyncio.run(scenario()) == ["отв", "ет"]
+    assert not breaker.is_open
+    assert backend.calls == 2
+
+
+def test_cancelled_stream_probe_before_first_chunk():
+    client, backend, breaker = _open_client()
+    backend.fail = False
+
+    async def hanging_stream(messages):
+        await asyncio.Event().wait()
+        yield ""
+
+    backend.stream = hanging_stream
+
+    async def scenario():
+        async def consume():
+            return [chunk async for chunk in client.stream([])]
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return breaker.allow()
+
+    assert asyncio.run(scenario())
@@ -0,0 +1,39 @@
+from benchmarks.fake_telegram import FakeTelegramServer
+from benchmarks.loadtest import _report
+
+
+def _reply(server: FakeTelegramServer, chat_id: int, at: float, text: str):
+    server.calls[chat_id].append((at, "sendMessage"))
+    server.texts[chat_id].append(text)
+
+
+def test_error_replies_are_reported_as_failed():
+    server = FakeTelegramServer()
+    _reply(server, 1, 1.0, "Обрабатываю аудио")
+    _reply(server, 1, 3.0, "Аудио обработано!")
+    _reply(server, 2, 1.5, "Обрабатываю аудио")
+    _reply(server, 2, 2.0, "Произошла серьёзная ошибка при обработке аудио: boom")
+    _reply(server, 3, 0.5, "Резюме готово")
+    sent = [(1, "voice", 0.0), (2, "voice", 0.0), (3, "text", 0.0)]
+
+    report = _report(server, sent)
+
+    assert (report["answered"], report["failed"]) == (2, 1)
+    assert report["failures"] == {"Произошла серьёзная ошибка при обработке аудио: boom": 1}
+    assert report["by_kind"]["voice"]["failed"] == 1
+    # Задержка неудачного апдейта не смешивается с успешными
+    assert report["by_kind"]["voice"]["last_reply"]["max"] == 3.0
+
+
+def test_warm_up_failure_fails_audio_updates_only():
+    server = FakeTelegramServer()
+    _reply(server, 1, 1.0, "Аудио обработано!")
+    _reply(server, 2, 1.0, "Резюме готово")
+    sent = [(1, "audio", 0.0), (2, "text", 0.0)]
+
+    report = _report(server, sent, warm_up_error="CUDA out of memory")
+
+    assert (report["answered"], report["failed"]) == (1, 1)
+    assert report["by_kind"]["audio"]["failed"] == 1
+    assert report["by_kind"]["text"]["failed"] == 0
+    assert report["warm_up_error"] == "CUDA out of memory"
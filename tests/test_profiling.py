@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from services.profiling import JobProfiler, JobTrace
+
+
+def _blocking_handler_step():
+    # Синхронная работа прямо в корутине обработчика останавливает цикл событий
+    time.sleep(0.3)
+
+
+async def _traced(profiler: JobProfiler):
+    trace = profiler.start("тест")
+    await asyncio.sleep(0.05)
+    _blocking_handler_step()
+    await asyncio.sleep(0.05)
+    return trace, profiler.finish(trace)
+
+
+def test_event_loop_stall_is_recorded_in_trace():
+    profiler = JobProfiler(admin_ids=[7], slow_seconds=0.1)
+
+    trace, documents = asyncio.run(_traced(profiler))
+
+    assert trace.stalls and max(trace.stalls) >= 0.2
+    assert any(stage == "event_loop_stall" for _, stage, _ in trace.stages)
+    (chat_id, _, content, _), = documents
+    assert chat_id == 7
+    assert "Остановки цикла событий" in content
+
+
+def test_cprofile_covers_handler_coroutine():
+    profiler = JobProfiler(admin_ids=[], slow_seconds=0)
+    profiler.arm("cprofile", 1, chat_id=5)
+
+    _, documents = asyncio.run(_traced(profiler))
+
+    (_, filename, content, _), = documents
+    assert filename.endswith("profile.txt")
+    loop_section = content.split("Цикл событий")[1]
+    assert "_blocking_handler_step" in loop_section
+    assert JobTrace._loop_profile_owner is None
+
+
+def test_sampling_includes_event_loop_thread():
+    profiler = JobProfiler(admin_ids=[], slow_seconds=0, sample_interval=0.01)
+    profiler.arm("sampling", 1, chat_id=5)
+
+    _, documents = asyncio.run(_traced(profiler))
+
+    (_, filename, content, _), = documents
+    assert filename.endswith("flamegraph.folded")
+    assert any(
+        line.startswith("event_loop;") and "_blocking_handler_step" in line for line in content.splitlines()
+    )
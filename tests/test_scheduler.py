@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from services.scheduler import AudioJobScheduler, SchedulerQueueFull
+
+
+async def _run_all(scheduler: AudioJobScheduler, jobs: list[tuple[int, float]]) -> list[tuple[int, float]]:
+    """
+    Ставит задачи (пользователь, длительность) по порядку и возвращает порядок
+    их запуска. Задачи ждут, пока в очередь не встанут все.
+    """
+    started = []
+    queued = asyncio.Event()
+
+    def make_job(user_id: int, duration: float):
+        async def job():
+            started.append((user_id, duration))
+            await queued.wait()
+        return job
+
+    tasks = []
+    for user_id, duration in jobs:
+        tasks.append(asyncio.ensure_future(scheduler.run(user_id, duration, make_job(user_id, duration))))
+        await asyncio.sleep(0)
+    queued.set()
+    await asyncio.gather(*tasks)
+    return started
+
+
+def test_round_robin_between_users():
+    scheduler = AudioJobScheduler(max_inflight=1, max_inflight_per_user=1, max_queued_per_user=10)
+    jobs = [(1, 10), (1, 10), (1, 10), (1, 10), (2, 10), (3, 10)]
+    order = [user_id for user_id, _ in asyncio.run(_run_all(scheduler, jobs))]
+
+    # Первая задача пользователя 1 заняла слот сразу, дальше слоты идут по кругу
+    assert order == [1, 1, 2, 3, 1, 1]
+
+
+def test_short_recordings_first_within_user():
+    scheduler = AudioJobScheduler(max_inflight=1, max_inflight_per_user=1, max_queued_per_user=10)
+    jobs = [(1, 5), (1, 300), (1, 60), (1, 10)]
+    durations = [duration for _, duration in asyncio.run(_run_all(scheduler, jobs))]
+    # Первая запись заняла свободный слот, остальные — по возрастанию длительности
+    assert durations == [5, 10, 60, 300]
+
+
+def test_per_user_inflight_limit():
+    scheduler = AudioJobScheduler(max_inflight=4, max_inflight_per_user=2, max_queued_per_user=10)
+    peak = {1: 0}
+    running = {1: 0}
+
+    async def job():
+        running[1] += 1
+        peak[1] = max(peak[1], running[1])
+        await asyncio.sleep(0.01)
+        running[1] -= 1
+
+    async def scenario():
+        await asyncio.gather(*(scheduler.run(1, 10, job) for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert peak[1] == 2
+    assert scheduler.inflight == 0 and scheduler.queued == 0
+
+
+def test_queue_limit_per_user():
+    scheduler = AudioJobScheduler(max_inflight=1, max_inflight_per_user=1, max_queued_per_user=1)
+    release = None
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        running = asyncio.ensure_future(scheduler.run(1, 10, release.wait))
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(scheduler.run(1, 10, release.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerQueueFull):
+            await scheduler.run(1, 10, release.wait)
+        # Другой пользователь в очередь встаёт
+        other = asyncio.ensure_future(scheduler.run(2, 10, release.wait))
+        await asyncio.sleep(0)
+        assert scheduler.queued == 2
+        release.set()
+        await asyncio.gather(running, queued, other)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiting_job_leaves_queue():
+    scheduler = AudioJobScheduler(max_inflight=1, max_inflight_per_user=1, max_queued_per_user=10)
+    positions = []
+
+    async def on_wait(position: int, eta: float):
+        positions.append(position)
+
+    async def scenario():
+        release = asyncio.Event()
+        running = asyncio.ensure_future(scheduler.run(1, 10, release.wait))
+        await asyncio.sleep(0)
+        first = asyncio.ensure_future(scheduler.run(2, 10, release.wait))
+        second = asyncio.ensure_future(scheduler.run(3, 10, release.wait, on_wait=on_wait))
+        await asyncio.sleep(0)
+        assert scheduler.queued == 2
+
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+        release.set()
+        await asyncio.gather(running, second)
+
+    asyncio.run(scenario())
+    # Отмена задачи впереди сдвигает позицию ожидающей
+    assert positions[:2] == [2, 1]
+    assert scheduler.inflight == 0 and scheduler.queued == 0
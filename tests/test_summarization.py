@@ -0,0 +1,208 @@
+import asyncio
+
+import pytest
+
+import services.summarization as summarization
+from config import SUMMARY_CHARS_PER_TOKEN
+from services.summarization import SummaryCache, estimate_tokens, split_into_chunks
+
+
+def _max_chars(max_tokens: int) -> int:
+    return int(max_tokens * SUMMARY_CHARS_PER_TOKEN)
+
+
+def test_split_into_chunks_respects_budget_and_keeps_words():
+    sentences = [f"Предложение номер {i} про бюджет проекта и сроки релиза." for i in range(200)]
+    text = " ".join(sentences)
+    chunks = split_into_chunks(text, max_tokens=100)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= _max_chars(100) for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+    # Части режутся по границам предложений
+    assert all(chunk.endswith(".") for chunk in chunks)
+
+
+def test_split_into_chunks_cuts_long_sentence_by_words():
+    text = " ".join(["слово"] * 1000)
+    chunks = split_into_chunks(text, max_tokens=50)
+
+    assert all(len(chunk) <= _max_chars(50) for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_split_into_chunks_short_text_is_one_chunk():
+    assert split_into_chunks("Коротко. Совсем.\n\nКонец!", max_tokens=100) == ["Коротко. Совсем. Конец!"]
+    assert split_into_chunks("   \n\n ", max_tokens=100) == []
+    assert estimate_tokens("") == 1
+
+
+def test_cache_key_ignores_whitespace_but_not_prompt():
+    key = SummaryCache.make_key("один  два\nтри", "prompt", "model")
+    assert key == SummaryCache.make_key("один два три", "prompt", "model")
+    assert key != SummaryCache.make_key("один два три", "другой prompt", "model")
+    assert key != SummaryCache.make_key("один два три", "prompt", "другая модель")
+
+
+def test_cache_lru_and_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(summarization.time, "monotonic", lambda: now[0])
+    cache = SummaryCache(max_entries=2, ttl=10)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    # "b" дольше всех не использовался
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+def test_concurrent_requests_are_coalesced():
+    cache = SummaryCache()
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "резюме"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_create("key", factory) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["резюме"] * 5
+    assert calls == 1
+    assert cache.misses == 1 and cache.hits == 4
+
+
+def test_follower_takes_over_when_leader_is_cancelled():
+    cache = SummaryCache()
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return f"резюме {calls}"
+
+    async def scenario():
+        leader = asyncio.ensure_future(cache.get_or_create("key", factory))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.get_or_create("key", factory))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    # Отмена лидера не отменяет ожидающего: он сам повторяет запрос
+    assert asyncio.run(scenario()) == "резюме 2"
+    assert calls == 2
+
+
+def test_errors_are_shared_but_not_cached():
+    cache = SummaryCache()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ConnectionError("LLM недоступен")
+
+    async def ok():
+        return "резюме"
+
+    async def scenario():
+        results = await asyncio.gather(
+            *(cache.get_or_create("key", failing) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert calls == 1
+        return await cache.get_or_create("key", ok)
+
+    assert asyncio.run(scenario()) == "резюме"
+
+
+class StreamingClient:
+    """Заглушка LLM: отдаёт резюме фрагментами и считает потоковые запросы."""
+
+    model_name = "stub"
+
+    def __init__(self, deltas=("Кратко: ", "всё ", "хорошо."), error: Exception = None):
+        self.deltas = deltas
+        self.error = error
+        self.streams = 0
+
+    async def stream(self, conversation):
+        self.streams += 1
+        for delta in self.deltas:
+            await asyncio.sleep(0.01)
+            yield delta
+        if self.error is not None:
+            await asyncio.sleep(0.01)
+            raise self.error
+
+
+async def _read(stream) -> list[str]:
+    return [delta async for delta in stream]
+
+
+def test_concurrent_stream_summaries_share_one_llm_stream():
+    cache = SummaryCache()
+    client = StreamingClient()
+
+    async def scenario():
+        return await asyncio.gather(*(
+            _read(summarization.stream_summary("Текст записи.", "default", cache, client)) for _ in range(3)
+        ))
+
+    leader, *followers = asyncio.run(scenario())
+
+    assert client.streams == 1
+    # Первый получает поток, остальные — готовое резюме целиком
+    assert leader == ["Кратко: ", "всё ", "хорошо."]
+    assert followers == [["Кратко: всё хорошо."]] * 2
+    assert (cache.misses, cache.hits) == (1, 2)
+
+    # Повторное нажатие берёт резюме из кэша без запроса к модели
+    assert asyncio.run(_read(summarization.stream_summary("Текст записи.", "default", cache, client))) == [
+        "Кратко: всё хорошо."
+    ]
+    assert client.streams == 1
+
+
+def test_stream_error_reaches_waiting_requests_and_is_not_cached():
+    cache = SummaryCache()
+    client = StreamingClient(deltas=(), error=ConnectionError("LLM недоступен"))
+
+    async def scenario():
+        return await asyncio.gather(*(
+            _read(summarization.stream_summary("Текст.", "default", cache, client)) for _ in range(2)
+        ))
+
+    results = asyncio.run(scenario())
+
+    assert client.streams == 1
+    assert all(result == ["Не удалось получить ответ: LLM недоступен"] for result in results)
+    assert cache._entries == {} and cache._inflight == {}
+
+
+def test_abandoned_stream_hands_over_to_waiting_request():
+    cache = SummaryCache()
+    client = StreamingClient()
+
+    async def scenario():
+        leader = summarization.stream_summary("Текст.", "default", cache, client)
+        assert await anext(leader) == "Кратко: "
+        follower = asyncio.ensure_future(_read(summarization.stream_summary("Текст.", "default", cache, client)))
+        await asyncio.sleep(0)
+        # Первый пользователь перестал читать поток: ожидающий запрос генерирует сам
+        await leader.aclose()
+        return await follower
+
+    assert asyncio.run(scenario()) == ["Кратко: ", "всё ", "хорошо."]
+    assert client.streams == 2
@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+
+from aiogram import types
+
+from handlers.text_input_handler import TextDebouncer
+
+WINDOW = 0.05
+
+
+def _message(message_id: int, text: str = "часть", chat_id: int = 1, forwarded_from: int = None) -> types.Message:
+    fields = {}
+    if forwarded_from is not None:
+        fields["forward_origin"] = types.MessageOriginUser(
+            date=datetime.datetime.now(),
+            sender_user=types.User(id=forwarded_from, is_bot=False, first_name="Автор")
+        )
+    return types.Message(
+        message_id=message_id,
+        date=datetime.datetime.now(),
+        chat=types.Chat(id=chat_id, type="private"),
+        from_user=types.User(id=chat_id, is_bot=False, first_name="Пользователь"),
+        text=text,
+        **fields
+    )
+
+
+def _collect(debouncer: TextDebouncer, arrivals: list[tuple[float, types.Message]]) -> list:
+    """
+    Отправляет сообщения в моменты arrivals (секунды от старта) и возвращает
+    для каждого id склеенных сообщений или None, если оно ушло в чужой буфер.
+    """
+    async def send(delay: float, message: types.Message):
+        await asyncio.sleep(delay)
+        messages = await debouncer.collect(message)
+        return None if messages is None else [m.message_id for m in messages]
+
+    async def scenario():
+        results = await asyncio.gather(*(send(delay, message) for delay, message in arrivals))
+        assert debouncer.pending == 0
+        return results
+
+    return asyncio.run(scenario())
+
+
+def test_messages_within_window_are_merged():
+    debouncer = TextDebouncer(window=WINDOW, forward_window=WINDOW, max_wait=1)
+    results = _collect(debouncer, [
+        (0.0, _message(1)), (0.02, _message(2)), (0.04, _message(3)),
+        # Пауза длиннее окна: новый буфер
+        (0.2, _message(4)),
+    ])
+    assert results == [[1, 2, 3], None, None, [4]]
+
+
+def test_max_wait_caps_a_steady_stream():
+    debouncer = TextDebouncer(window=WINDOW, forward_window=WINDOW, max_wait=0.12, max_parts=100)
+    results = _collect(debouncer, [(0.03 * i, _message(i)) for i in range(10)])
+
+    leaders = [result for result in results if result is not None]
+    # Сообщения идут чаще окна, но буфер закрывается по max_wait
+    assert len(leaders) >= 2
+    assert sorted(i for leader in leaders for i in leader) == list(range(10))
+    assert all(len(leader) <= 5 for leader in leaders)
+
+
+def test_max_parts_starts_a_new_buffer():
+    debouncer = TextDebouncer(window=WINDOW, forward_window=WINDOW, max_wait=1, max_parts=3)
+    results = _collect(debouncer, [(0.005 * i, _message(i)) for i in range(1, 8)])
+    assert [result for result in results if result is not None] == [[1, 2, 3], [4, 5, 6], [7]]
+
+
+def test_max_chars_starts_a_new_buffer():
+    debouncer = TextDebouncer(window=WINDOW, forward_window=WINDOW, max_wait=1, max_chars=100)
+    results = _collect(debouncer, [(0.005 * i, _message(i, "x" * 40)) for i in range(1, 6)])
+    assert [result for result in results if result is not None] == [[1, 2], [3, 4], [5]]
+
+
+def test_chats_are_buffered_separately_and_bounded():
+    debouncer = TextDebouncer(window=WINDOW, forward_window=WINDOW, max_wait=1, max_chats=2)
+    results = _collect(debouncer, [
+        (0.0, _message(1, chat_id=1)), (0.0, _message(2, chat_id=2)),
+        # Буферов уже max_chats: сообщение третьего чата обрабатывается сразу
+        (0.01, _message(3, chat_id=3)),
+        (0.02, _message(4, chat_id=1)), (0.02, _message(5, chat_id=2)),
+    ])
+    assert results == [[1, 4], [2, 5], [3], None, None]
+
+
+def test_forwards_from_one_origin_wait_longer():
+    debouncer = TextDebouncer(window=WINDOW, forward_window=4 * WINDOW, max_wait=1)
+    results = _collect(debouncer, [
+        (0.0, _message(1, forwarded_from=7)), (0.1, _message(2, forwarded_from=7)),
+        (0.2, _message(3, forwarded_from=7)),
+    ])
+    assert results == [[1, 2, 3], None, None]
+
+    # Обычные сообщения с той же паузой не склеиваются
+    results = _collect(debouncer, [(0.0, _message(4)), (0.1, _message(5))])
+    assert results == [[4], [5]]
+
+
+def test_disabled_debounce_returns_message_at_once():
+    debouncer = TextDebouncer(window=0)
+    assert _collect(debouncer, [(0.0, _message(1)), (0.0, _message(2))]) == [[1], [2]]
+
+
+def test_cancelled_leader_frees_the_buffer():
+    debouncer = TextDebouncer(window=WINDOW, forward_window=WINDOW, max_wait=1)
+
+    async def scenario():
+        leader = asyncio.ensure_future(debouncer.collect(_message(1)))
+        await asyncio.sleep(0.01)
+        assert await debouncer.collect(_message(2)) is None
+        leader.cancel()
+        await asyncio.gather(leader, return_exceptions=True)
+        assert debouncer.pending == 0
+
+        # Следующее сообщение не дописывается в буфер отменённого обработчика
+        messages = await debouncer.collect(_message(3))
+        return [message.message_id for message in messages]
+
+    assert asyncio.run(scenario()) == [3]
@@ -0,0 +1,345 @@
+import asyncio
+import contextlib
+import time
+
+import numpy as np
+import pytest
+
+import services.transcription as transcription
+from services.audio import SAMPLE_RATE
+from services.transcription import (
+    ASREngine,
+    ModelPool,
+    TranscriptionCache,
+    TranscriptionExecutor,
+    TranscriptionQueueFull
+)
+
+
+class StubEngine(ASREngine):
+    """Движок без модели: считает загрузки и вызовы, отвечает длиной клипа."""
+
+    name = "stub"
+    loads = 0
+    delay = 0.0
+
+    def __init__(self, model_size: str, device: str):
+        super().__init__(model_size, device)
+        StubEngine.loads += 1
+
+    def transcribe(self, audio, language: str = None) -> dict:
+        time.sleep(self.delay)
+        return {"text": f"{len(audio)}", "language": language or "ru", "segments": []}
+
+
+@pytest.fixture
+def stub_engine(monkeypatch):
+    StubEngine.loads = 0
+    StubEngine.delay = 0.0
+    monkeypatch.setitem(transcription.ASR_ENGINES, transcription.ASR_ENGINE, StubEngine)
+    return StubEngine
+
+
+def _clip(seconds: float = 1.0) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+async def _load(pool: ModelPool, size: str):
+    await pool.executor(size).run(transcription._transcribe_sync, _clip(), None)
+
+
+def _loaded(pool: ModelPool) -> list[str]:
+    return [size for size, executor in pool._executors.items() if executor.loaded]
+
+
+def test_budget_keeps_models_that_fit(stub_engine):
+    pool = ModelPool(sizes=["tiny", "small", "medium"], default_size="small", memory_budget_mb=6144, workers=1)
+
+    async def scenario():
+        await _load(pool, "small")
+        await _load(pool, "medium")
+        # Повторный запрос загруженной модели не вытесняет соседнюю: 4000 МБ в бюджете
+        for size in ("medium", "small", "medium"):
+            await _load(pool, size)
+        return _loaded(pool)
+
+    try:
+        assert sorted(asyncio.run(scenario())) == ["medium", "small"]
+        assert stub_engine.loads == 2
+    finally:
+        pool.shutdown()
+
+
+def test_budget_unloads_idle_model_when_new_one_does_not_fit(stub_engine):
+    pool = ModelPool(sizes=["tiny", "small", "medium"], default_size="small", memory_budget_mb=3500, workers=1)
+
+    async def scenario():
+        await _load(pool, "small")
+        await _load(pool, "medium")
+        return _loaded(pool)
+
+    try:
+        assert asyncio.run(scenario()) == ["medium"]
+    finally:
+        pool.shutdown()
+
+
+def test_budget_counts_a_copy_per_worker(stub_engine):
+    # Непотокобезопасный движок держит модель в каждом из двух потоков
+    pool = ModelPool(sizes=["small", "medium"], default_size="small", memory_budget_mb=6144, workers=2)
+
+    async def scenario():
+        await asyncio.gather(*(_load(pool, "small") for _ in range(2)))
+        assert pool.executor("small").memory_mb() == 2000
+        await _load(pool, "medium")
+        return _loaded(pool)
+
+    try:
+        # 2000 + 2 × 3000 не помещается в 6144 МБ
+        assert asyncio.run(scenario()) == ["medium"]
+    finally:
+        pool.shutdown()
+
+
+def test_model_memory_ignores_version_suffix():
+    assert transcription.model_memory_mb("large-v3") == transcription.MODEL_MEMORY_MB["large"]
+    assert transcription.model_memory_mb("unknown") == 1000
+
+
+def test_executor_rejects_jobs_beyond_queue_and_tracks_pending(stub_engine, monkeypatch):
+    monkeypatch.setattr(transcription, "SILENCE_TRIM", False)
+    stub_engine.delay = 0.2
+    executor = TranscriptionExecutor(workers=1, queue_size=1, idle_timeout=0, model_size="small")
+
+    async def scenario():
+        # Один клип в работе, второй в очереди: очередь заполнена
+        running = [asyncio.create_task(executor.transcribe(_clip(seconds))) for seconds in (1, 2)]
+        await asyncio.sleep(0.05)
+        assert executor.pending == 2
+        with pytest.raises(TranscriptionQueueFull):
+            await executor.transcribe(_clip())
+        # Отклонённая задача не занимает место в очереди
+        assert executor.pending == 2
+        return await asyncio.gather(*running)
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert [result["text"] for result in results] == [str(SAMPLE_RATE), str(2 * SAMPLE_RATE)]
+    assert executor.pending == 0
+
+
+def test_executor_releases_slot_when_job_fails(stub_engine, monkeypatch):
+    monkeypatch.setattr(transcription, "SILENCE_TRIM", False)
+    executor = TranscriptionExecutor(workers=1, queue_size=0, idle_timeout=0, model_size="small")
+
+    def broken(engine, audio):
+        raise RuntimeError("сбой модели")
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await executor.run(broken, _clip())
+        assert executor.pending == 0
+        return await executor.transcribe(_clip())
+
+    try:
+        assert asyncio.run(scenario())["text"] == str(SAMPLE_RATE)
+    finally:
+        executor.shutdown()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = TranscriptionCache(str(tmp_path / "cache.sqlite3"), max_entries=2, max_bytes=10_000)
+
+    async def scenario():
+        await cache.put(["a"], "первая")
+        time.sleep(0.01)
+        await cache.put(["b"], "вторая")
+        time.sleep(0.01)
+        # Обращение к a делает вытесняемой b
+        assert await cache.get("a") == "первая"
+        time.sleep(0.01)
+        await cache.put(["c"], "третья")
+        return [await cache.get(key) for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == ["первая", None, "третья"]
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_cache_evicts_by_total_text_size(tmp_path):
+    cache = TranscriptionCache(str(tmp_path / "cache.sqlite3"), max_entries=100, max_bytes=10)
+
+    async def scenario():
+        await cache.put(["old"], "12345678")
+        time.sleep(0.01)
+        await cache.put(["new"], "abcdef")
+        return await cache.get("old"), await cache.get("new")
+
+    assert asyncio.run(scenario()) == (None, "abcdef")
+
+
+def test_cache_finds_any_key_and_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    keys = [TranscriptionCache.file_key("uniq", "small"), TranscriptionCache.content_key("digest", "small", "ru")]
+    cache = TranscriptionCache(path)
+    asyncio.run(cache.put(keys, "текст"))
+    cache.close()
+
+    cache = TranscriptionCache(path)
+    miss = TranscriptionCache.file_key("other", "small")
+    try:
+        assert asyncio.run(cache.get(miss, keys[1])) == "текст"
+        assert asyncio.run(cache.get(miss)) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+    finally:
+        cache.close()
+
+
+class BatchingStubEngine(StubEngine):
+    """Заглушка с батчевым декодированием: запоминает размеры батчей."""
+
+    supports_batching = True
+    batches = []
+
+    def transcribe_batch(self, audios: list, language: str = None) -> list[dict]:
+        BatchingStubEngine.batches.append((len(audios), language))
+        return [self.transcribe(audio, language) for audio in audios]
+
+
+@pytest.fixture
+def batching_executor(stub_engine, monkeypatch):
+    BatchingStubEngine.batches = []
+    monkeypatch.setattr(transcription, "SILENCE_TRIM", False)
+    monkeypatch.setattr(transcription, "BATCH_MAX_SIZE", 8)
+    monkeypatch.setitem(transcription.ASR_ENGINES, transcription.ASR_ENGINE, BatchingStubEngine)
+    executor = TranscriptionExecutor(workers=1, queue_size=10, idle_timeout=0, model_size="small")
+    yield executor
+    executor.shutdown()
+
+
+def test_batcher_groups_concurrent_clips_and_returns_each_result(batching_executor):
+    seconds = (1, 3, 2)
+
+    async def scenario():
+        return await asyncio.gather(*(batching_executor.transcribe(_clip(s), "ru") for s in seconds))
+
+    results = asyncio.run(scenario())
+
+    assert BatchingStubEngine.batches == [(3, "ru")]
+    # Каждый вызывающий получает результат своего клипа, а не соседнего
+    assert [result["text"] for result in results] == [str(s * SAMPLE_RATE) for s in seconds]
+    assert batching_executor.pending == 0
+
+
+def test_batcher_keeps_languages_in_separate_batches(batching_executor):
+    async def scenario():
+        return await asyncio.gather(
+            batching_executor.transcribe(_clip(1), "ru"),
+            batching_executor.transcribe(_clip(2), "en"),
+            batching_executor.transcribe(_clip(3), "ru")
+        )
+
+    results = asyncio.run(scenario())
+
+    assert sorted(BatchingStubEngine.batches) == [(1, "en"), (2, "ru")]
+    assert [result["language"] for result in results] == ["ru", "en", "ru"]
+    assert [result["text"] for result in results] == [str(s * SAMPLE_RATE) for s in (1, 2, 3)]
+
+
+def test_warm_up_loads_model_and_idle_pool_is_unloaded(stub_engine, monkeypatch):
+    monkeypatch.setattr(transcription, "SILENCE_TRIM", False)
+    executor = TranscriptionExecutor(workers=1, queue_size=1, idle_timeout=0.1, model_size="small")
+
+    async def scenario():
+        executor.start(warm_up=True)
+        await asyncio.sleep(0.03)
+        # Прогрев загрузил модель до первой задачи пользователя
+        assert (stub_engine.loads, executor.state, executor.loaded) == (1, transcription.MODEL_STATE_READY, True)
+
+        await asyncio.sleep(0.3)
+        assert (executor.state, executor.loaded) == (transcription.MODEL_STATE_UNLOADED, False)
+
+        # Следующая задача загружает модель заново
+        result = await executor.transcribe(_clip())
+        return result, executor.loaded
+
+    try:
+        result, loaded = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert result["text"] == str(SAMPLE_RATE)
+    assert loaded
+    assert stub_engine.loads == 2
+
+
+def test_busy_pool_is_not_unloaded(stub_engine, monkeypatch):
+    monkeypatch.setattr(transcription, "SILENCE_TRIM", False)
+    stub_engine.delay = 0.3
+    executor = TranscriptionExecutor(workers=1, queue_size=1, idle_timeout=0.1, model_size="small")
+
+    async def scenario():
+        executor.start(warm_up=False)
+        await executor.transcribe(_clip())
+        return executor.loaded
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert stub_engine.loads == 1
+
+
+def test_failed_warm_up_does_not_break_pool(stub_engine, monkeypatch):
+    monkeypatch.setattr(transcription, "SILENCE_TRIM", False)
+    executor = TranscriptionExecutor(workers=1, queue_size=1, idle_timeout=0, model_size="small")
+
+    def broken_load(model_size):
+        raise RuntimeError("нет памяти")
+
+    async def scenario():
+        with monkeypatch.context() as patch:
+            patch.setattr(transcription, "load_whisper_model", broken_load)
+            await executor.warm_up()
+            assert executor.state == transcription.MODEL_STATE_NOT_LOADED
+        return await executor.transcribe(_clip())
+
+    try:
+        assert asyncio.run(scenario())["text"] == str(SAMPLE_RATE)
+    finally:
+        executor.shutdown()
+
+
+def test_decode_stage_excludes_waiting_for_decode_slot(stub_engine, monkeypatch):
+    monkeypatch.setattr(transcription, "SILENCE_TRIM", True)
+
+    def slow_decode(data: bytes) -> np.ndarray:
+        time.sleep(0.1)
+        return _clip()
+
+    stages = []
+
+    @contextlib.contextmanager
+    def recording_timer(stage: str, duration: float = None, model_size: str = ""):
+        started = time.perf_counter()
+        yield
+        stages.append((stage, time.perf_counter() - started))
+
+    monkeypatch.setattr(transcription, "decode_audio_bytes", slow_decode)
+    monkeypatch.setattr(transcription, "stage_timer", recording_timer)
+    executor = TranscriptionExecutor(workers=1, queue_size=2, idle_timeout=0, model_size="small")
+
+    async def scenario():
+        # Один слот декодирования: второй файл ждёт первый, но это ожидание не стадия decode
+        await asyncio.gather(*(executor.transcribe(b"ogg") for _ in range(2)))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    decode = [seconds for stage, seconds in stages if stage == "decode"]
+    assert len(decode) == 2
+    assert max(decode) < 0.18
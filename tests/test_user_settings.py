@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from config import DEFAULT_LANGUAGE, DEFAULT_MODEL_PREFERENCE, DEFAULT_SUMMARY_STYLE
+from services.user_settings import UserSettingsRepository
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "user_settings.sqlite3")
+
+
+def _rows(repository: UserSettingsRepository) -> list[tuple]:
+    with repository._lock:
+        return repository._conn.execute("SELECT * FROM user_settings ORDER BY user_id").fetchall()
+
+
+def test_flush_persists_changes_and_they_reload(db_path):
+    async def scenario():
+        repository = UserSettingsRepository(db_path, flush_interval=3600)
+        repository.get(1)["language"] = "en"
+        repository.get(2)["summary_style"] = "short"
+        repository.get(2)["model_size"] = "small"
+        # Пользователь без изменений в базу не пишется
+        repository.get(3)
+        assert _rows(repository) == []
+
+        await repository.flush()
+        assert _rows(repository) == [
+            (1, "en", DEFAULT_SUMMARY_STYLE, DEFAULT_MODEL_PREFERENCE),
+            (2, DEFAULT_LANGUAGE, "short", "small")
+        ]
+        await repository.close()
+
+        reopened = UserSettingsRepository(db_path)
+        try:
+            return [reopened.get(user_id).as_row() for user_id in (1, 2, 3)]
+        finally:
+            await reopened.close()
+
+    first, second, third = asyncio.run(scenario())
+
+    assert first[1] == "en"
+    assert second[2:] == ("short", "small")
+    assert third[1] == DEFAULT_LANGUAGE
+
+
+def test_background_flush_writes_without_explicit_flush(db_path):
+    async def scenario():
+        repository = UserSettingsRepository(db_path, flush_interval=0.05)
+        repository.start()
+        repository.get(1)["language"] = "de"
+        await asyncio.sleep(0.2)
+        rows = _rows(repository)
+        await repository.close()
+        return rows
+
+    assert [row[:2] for row in asyncio.run(scenario())] == [(1, "de")]
+
+
+def test_dirty_settings_survive_cache_eviction(db_path):
+    async def scenario():
+        repository = UserSettingsRepository(db_path, cache_size=1, flush_interval=3600)
+        repository.get(1)["language"] = "fr"
+        # Пользователь 1 вытеснен из кэша до сброса в базу
+        repository.get(2)
+        language = repository.get(1)["language"]
+        await repository.close()
+        return language
+
+    assert asyncio.run(scenario()) == "fr"
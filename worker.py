@@ -0,0 +1,134 @@
+# worker.py
+"""
+Воркер транскрибации для горизонтального масштабирования.
+
+Бот (main_bot.py с JOB_QUEUE_BACKEND=sqlite|redis) только скачивает файлы и
+ставит задачи в очередь; модель загружается здесь, длинные записи тоже
+декодируются и режутся по паузам здесь. Запуск:
+
+    python worker.py --processes 2
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+
+from dotenv import load_dotenv
+
+from config import BATCH_MAX_SIZE, JOB_QUEUE_BACKEND, TRANSCRIPTION_WORKERS
+from services.job_queue import create_job_queue
+from services.transcription import ModelPool, transcribe_long_audio
+
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(concurrency: int = None):
+    """Забирает задачи из очереди и распознаёт их в локальном пуле моделей."""
+    # Одновременно берём столько задач, сколько нужно, чтобы заполнить батчи всех потоков
+    concurrency = concurrency or TRANSCRIPTION_WORKERS * max(1, BATCH_MAX_SIZE)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    queue = create_job_queue()
+    transcriber = ModelPool(queue_size=concurrency)
+    transcriber.start()
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+
+    async def transcribe_long(job, model_size):
+        """Режет длинную запись здесь и публикует тексты сегментов по мере готовности."""
+        detected = []
+        published = None
+        parts = transcribe_long_audio(
+            transcriber, job.payload(), job.language, model_size=model_size, on_language=detected.append
+        )
+        async for text in parts:
+            if detected and detected[-1] != published:
+                published = detected[-1]
+                await queue.publish(job.id, {"language": published})
+            await queue.publish(job.id, {"text": text})
+        return {"language": detected[-1] if detected else job.language}
+
+    async def handle(job):
+        try:
+            model_size = job.options.get("model_size")
+            task = job.options.get("task")
+            if task == "detect_language":
+                language, probability = await transcriber.detect_language(job.payload(), model_size)
+                result = {"language": language, "probability": probability}
+            elif task == "transcribe_long":
+                result = await transcribe_long(job, model_size)
+            else:
+                result = await transcriber.transcribe(job.payload(), job.language, model_size)
+            await queue.complete(job.id, result=result)
+        except Exception as e:
+            logger.error(f"Ошибка при распознавании задачи {job.id}: {e}", exc_info=True)
+            await queue.complete(job.id, error=str(e))
+        finally:
+            slots.release()
+
+    logger.info(f"Воркер {worker_id} ждёт задачи ({JOB_QUEUE_BACKEND}, параллельно до {concurrency})")
+    try:
+        while True:
+            await slots.acquire()
+            try:
+                job = await queue.dequeue(worker_id, timeout=5)
+            except Exception as e:
+                slots.release()
+                logger.error(f"Не удалось получить задачу из очереди: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if job is None:
+                slots.release()
+                continue
+
+            task = asyncio.create_task(handle(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        transcriber.shutdown()
+        queue.shutdown()
+
+
+def _process_main(concurrency: int = None):
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run_worker(concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер транскрибации")
+    parser.add_argument("--processes", type=int, default=1, help="сколько процессов-воркеров запустить")
+    parser.add_argument("--concurrency", type=int, default=None, help="задач одновременно на процесс")
+    args = parser.parse_args()
+
+    if JOB_QUEUE_BACKEND == "local":
+        raise SystemExit("Для воркеров задайте JOB_QUEUE_BACKEND=sqlite или redis")
+
+    if args.processes <= 1:
+        _process_main(args.concurrency)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_process_main, args=(args.concurrency,), name=f"transcription-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()